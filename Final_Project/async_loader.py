@@ -0,0 +1,341 @@
+"""
+Asyncio loader engine.
+
+Runs any of the insert_data_*.py loaders from one thread: the TSV is read
+in chunks, each chunk goes through the loader's own row builder
+(build_*_steps) and is written on a connection borrowed from an aiomysql
+pool, with up to CONCURRENCY chunks in flight.
+
+Usage:
+    python async_loader.py title_ratings /path/to/title.ratings.tsv
+    python async_loader.py title_ratings /path/to/title.ratings.tsv --benchmark
+
+--benchmark loads the file with the ThreadPoolExecutor path and with the
+asyncio engine (emptying the target tables before each run), so only use
+it on a scratch database.
+
+The database settings (DB_HOST, DB_PORT, DB_USER, DB_PASS, DB_NAME) are
+read from connect_db.py, the same ones connect_db() uses. Rejected rows
+go to the dead-letter files (dead_letter.py) as with the threaded
+loaders, but the asyncio engine only loads: none of the post-load steps
+of the insert_data_*.py mains run. After an asyncio load, bring what is
+built from the loaded tables up to date by hand:
+
+    python summaries.py refresh
+    python title_summary.py rebuild
+    python title_search.py build
+    python name_autocomplete.py build
+    python person_roles.py build
+    python top_rated.py build
+    python distinct_sketches.py rebuild
+"""
+import argparse
+import asyncio
+import csv
+import importlib
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+import aiomysql
+
+import connect_db as db_config
+from connect_db import connect_db
+from dead_letter import DeadLetterWriter
+from loader_pipeline import (Batch, LinkedBatch, TransactionStats, backoff_delay,
+                             is_transient_error, print_report, rows_written, MAX_RETRIES)
+from loader_registry import LOADERS
+from metrics import table_of, write_run_report
+
+# ---------------- CONFIG ----------------
+
+CONCURRENCY = 32     # chunks in flight
+POOL_SIZE = 16       # pooled connections
+
+# ----------------------------------------
+
+
+def pool_settings():
+    """
+    aiomysql.create_pool arguments from connect_db.py's settings.
+    """
+    try:
+        return {"host": db_config.DB_HOST, "port": db_config.DB_PORT, "user": db_config.DB_USER,
+                "password": db_config.DB_PASS, "db": db_config.DB_NAME}
+    except AttributeError as err:
+        raise RuntimeError("the asyncio engine reads DB_HOST, DB_PORT, DB_USER, DB_PASS and "
+                           "DB_NAME from connect_db.py") from err
+
+
+# ---------------- async versions of loader_pipeline writes ----------------
+
+
+async def execute_steps_async(cur, steps, metrics=None):
+    """
+    Async twin of loader_pipeline.execute_steps.
+    """
+    def timed(sql):
+        return metrics.timer("executemany_seconds", table_of(sql)) if metrics else nullcontext()
+
+    written = []
+    for step in steps:
+        if isinstance(step, LinkedBatch):
+            child_batches = [[] for _ in step.child_sqls]
+            with timed(step.parent_sql):
+                for parent_params, child_rows in step.items:
+                    await cur.execute(step.parent_sql, parent_params)
+                    parent_id = cur.lastrowid
+                    for k, rows in enumerate(child_rows):
+                        child_batches[k].extend((parent_id, *r) for r in rows)
+            for sql, rows in zip(step.child_sqls, child_batches):
+                if rows:
+                    with timed(sql):
+                        await cur.executemany(sql, rows)
+            written.append(None)
+        elif step.rows:
+            with timed(step.sql):
+                await cur.executemany(step.sql, step.rows)
+            written.append(cur.rowcount)
+        else:
+            written.append(0)
+    return written
+
+
+async def run_transaction_async(pool, steps, stats=None, label="", max_retries=MAX_RETRIES):
+    """
+    Async twin of loader_pipeline.run_transaction: write steps on a pooled
+    connection and commit, replaying them on deadlock / lock wait timeout.
+    """
+    attempt = 0
+    while True:
+        async with pool.acquire() as conn:
+            try:
+                async with conn.cursor() as cur:
+                    written = await execute_steps_async(cur, steps,
+                                                        stats.metrics if stats is not None else None)
+                commit_start = time.perf_counter()
+                await conn.commit()
+                if stats is not None:
+                    stats.record_commit(label, time.perf_counter() - commit_start)
+                    stats.record_steps(steps, written)
+                return
+            except Exception as err:
+                await conn.rollback()
+                if not is_transient_error(err):
+                    raise
+                if attempt >= max_retries:
+                    if stats is not None:
+                        stats.record_give_up(label)
+                    raise
+                if stats is not None:
+                    stats.record_retry(label, err)
+        await asyncio.sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+async def run_steps_async(pool, steps, stats=None, label="", batch_size=None):
+    """
+    Async twin of loader_pipeline.run_steps (same transaction boundaries).
+    """
+    if batch_size is None:
+        await run_transaction_async(pool, steps, stats, label)
+        return
+
+    for step in steps:
+        if isinstance(step, LinkedBatch):
+            await run_transaction_async(pool, [step], stats, label)
+            continue
+        for start in range(0, len(step.rows), batch_size):
+            piece = Batch(step.sql, step.rows[start:start + batch_size])
+            await run_transaction_async(pool, [piece], stats, label)
+
+
+# ---------------- engine ----------------
+
+
+async def load_async(tsv_path: Path,
+                     build,
+                     label,
+                     chunk_size: int=1000,
+                     batch_size=None,
+                     concurrency: int=CONCURRENCY,
+                     pool_size: int=POOL_SIZE):
+    """
+    Load tsv_path with build(rows) -> steps as the row builder.
+
+    Returns (totals, report): rows written per target table (in builder
+    order) and a run report in the same shape as loader_pipeline.load_chunks.
+    """
+    txn_stats = TransactionStats()
+    pool = await aiomysql.create_pool(**pool_settings(), minsize=1, maxsize=pool_size,
+                                      autocommit=False)
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+    totals = []
+    chunks = 0
+    rows_read = 0
+    started = time.perf_counter()
+
+    async def process_chunk(rows):
+        txn_stats.metrics.chunk_started()
+        try:
+            with txn_stats.metrics.timer("parse_seconds"):
+                steps = build(rows)
+            await run_steps_async(pool, steps, txn_stats, label, batch_size)
+            counts = rows_written(steps)
+            for k, n in enumerate(counts):
+                if k == len(totals):
+                    totals.append(0)
+                totals[k] += n
+        finally:
+            txn_stats.metrics.chunk_finished()
+            slots.release()
+
+    async def submit(chunk):
+        nonlocal chunks
+        await slots.acquire()
+        tasks.add(asyncio.create_task(process_chunk(chunk)))
+        chunks += 1
+        txn_stats.metrics.sample_queue(len(tasks))
+        # surface worker errors early instead of after the whole file
+        for task in [t for t in tasks if t.done()]:
+            tasks.discard(task)
+            task.result()
+
+    try:
+        with tsv_path.open("r", encoding="utf-8") as f:
+            reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+            current_chunk = []
+            for rows_read, row in enumerate(reader, start=1):
+                current_chunk.append(row)
+                if len(current_chunk) >= chunk_size:
+                    await submit(current_chunk)
+                    current_chunk = []
+
+                if rows_read % 100000 == 0:
+                    print(f"Queued {rows_read} rows from {tsv_path.name}")
+
+            if current_chunk:
+                await submit(current_chunk)
+
+        await asyncio.gather(*tasks)
+    finally:
+        pool.close()
+        await pool.wait_closed()
+
+    report = {
+        "table": label,
+        "source": str(tsv_path),
+        "rows_read": rows_read,
+        "chunks": chunks,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "concurrency": {
+            "mode": "asyncio",
+            "min_workers": 1,
+            "max_workers": concurrency,
+            "final_workers": concurrency,
+            "peak_workers": concurrency,
+            "pool_size": pool_size,
+        },
+        "metrics": txn_stats.metrics.report(),
+        "transactions": txn_stats.report(),
+        "touched": txn_stats.touched,
+        "sketches": txn_stats.sketches,
+    }
+    return totals, report
+
+
+def run_loader(name, tsv_path: Path, engine="asyncio", **kwargs):
+    """
+    Run loader `name` (a key of LOADERS) on the "asyncio" or "threads" engine.
+    Returns the run report. Neither engine runs the loader's post-load
+    steps (see the module docstring).
+    """
+    spec = LOADERS[name]
+    module = importlib.import_module(spec.module)
+    ctx = spec.context(module, tsv_path)
+
+    if engine == "threads":
+        return getattr(module, spec.thread_loader)(tsv_path, *ctx, **kwargs)
+
+    builder = getattr(module, spec.builder)
+    dead_letter = DeadLetterWriter(name)
+    with dead_letter:
+        totals, report = asyncio.run(load_async(
+            tsv_path,
+            lambda rows: builder(rows, *ctx, dead_letter=dead_letter),
+            name,
+            chunk_size=kwargs.pop("chunk_size", spec.chunk_size),
+            batch_size=module.BATCH_SIZE if spec.batched else None,
+            **kwargs,
+        ))
+    for table, n in zip(spec.tables, totals):
+        print(f"Total {table} rows inserted: {n}")
+    report["rows_written"] = dict(zip(spec.tables, totals))
+    report["dead_letter"] = dead_letter.report()
+    print_report(report)
+    write_run_report(report)
+    return report
+
+
+def clear_tables(tables):
+    """
+    Empty the given tables (children first) between benchmark runs.
+    """
+    conn = connect_db()
+    cur = conn.cursor()
+    cur.execute("SET FOREIGN_KEY_CHECKS = 0;")
+    for table in reversed(tables):
+        cur.execute(f"TRUNCATE TABLE {table};")
+    cur.execute("SET FOREIGN_KEY_CHECKS = 1;")
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def benchmark(name, tsv_path: Path):
+    """
+    Load the same file with the threaded and the asyncio engine and print
+    rows/sec for both. Destroys the contents of the loader's tables.
+    """
+    results = {}
+    for engine in ("threads", "asyncio"):
+        clear_tables(LOADERS[name].tables)
+        start = time.perf_counter()
+        report = run_loader(name, tsv_path, engine=engine)
+        seconds = time.perf_counter() - start
+        results[engine] = (report["rows_read"], seconds)
+
+    print(f"Benchmark {name} ({tsv_path.name}):")
+    for engine, (rows, seconds) in results.items():
+        print(f"  {engine:8s} {rows} rows in {seconds:.1f}s -> {rows / seconds:.0f} rows/s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run an IMDb loader on the asyncio engine.",
+        epilog="Only loads the rows (rejected ones go to the dead-letter files); the "
+               "post-load steps of the insert_data_*.py mains (summaries, title_summary, "
+               "search / name indexes, person_roles, top_rated, distinct sketches) are not "
+               "run, see the module docstring for the commands.")
+    parser.add_argument("loader", choices=sorted(LOADERS))
+    parser.add_argument("tsv", type=Path)
+    parser.add_argument("--benchmark", action="store_true",
+                        help="compare with the ThreadPoolExecutor loader (truncates tables!)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--pool-size", type=int, default=POOL_SIZE)
+    args = parser.parse_args()
+
+    if not args.tsv.exists():
+        raise FileNotFoundError(f"TSV file not found: {args.tsv}")
+
+    if args.benchmark:
+        benchmark(args.loader, args.tsv)
+    else:
+        run_loader(args.loader, args.tsv,
+                   concurrency=args.concurrency, pool_size=args.pool_size)
+
+
+if __name__ == "__main__":
+    main()
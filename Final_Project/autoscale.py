@@ -0,0 +1,162 @@
+"""
+Worker-count autoscaling for the chunked loaders.
+
+ConcurrencyController decides how many chunks (= worker threads = DB
+connections) may be in flight at once:
+- ramp up by one worker while the rows/sec committed keeps rising
+- back off when commit latency climbs well above the best seen so far,
+  or when the server's Threads_running shows it is saturated
+- step back one worker when the last increase did not pay off, then hold
+"""
+import time
+
+from connect_db import connect_db
+
+
+# ---------------- CONFIG ----------------
+
+AUTOSCALE_START_WORKERS = 2
+AUTOSCALE_MAX_WORKERS = 16
+ADJUST_WINDOW = 5.0             # seconds of throughput per decision
+THROUGHPUT_GAIN = 0.05          # +5% rows/sec counts as "still rising"
+LATENCY_BACKOFF_FACTOR = 3.0    # commit latency vs best window
+THREADS_RUNNING_LIMIT = 32      # server-wide Threads_running
+
+# ----------------------------------------
+
+
+def threads_running():
+    """
+    Current Threads_running from the server, or None if it can't be read.
+    """
+    try:
+        conn = connect_db()
+        cur = conn.cursor()
+        cur.execute("SHOW GLOBAL STATUS LIKE 'Threads_running';")
+        row = cur.fetchone()
+        cur.close()
+        conn.close()
+        return int(row[1]) if row else None
+    except Exception:
+        return None
+
+
+class ConcurrencyController:
+    """
+    Hill-climbing controller for the number of in-flight chunks.
+
+    All methods are called from the thread that reads the TSV and submits
+    chunks, so no locking is needed.
+    """
+
+    def __init__(self,
+                 min_workers: int=1,
+                 max_workers: int=AUTOSCALE_MAX_WORKERS,
+                 txn_stats=None,
+                 probe=threads_running,
+                 window: float=ADJUST_WINDOW):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.fixed = min_workers == max_workers
+        self.limit = max(min_workers, min(max_workers, AUTOSCALE_START_WORKERS))
+        self.peak = self.limit
+        self.txn_stats = txn_stats
+        self.probe = probe
+        self.window = window
+
+        self.history = []
+        self._started = time.perf_counter()
+        self._window_start = self._started
+        self._window_rows = 0
+        self._last_throughput = None
+        self._last_action = None
+        self._best_latency = None
+        self._commit_mark = (0, 0.0)
+
+    @classmethod
+    def for_max_workers(cls, max_workers, txn_stats=None):
+        """
+        max_workers=None -> autoscale, an int -> fixed pool of that size.
+        """
+        if max_workers is None:
+            return cls(txn_stats=txn_stats)
+        return cls(min_workers=max_workers, max_workers=max_workers, txn_stats=txn_stats)
+
+    def record_rows(self, n):
+        self._window_rows += n
+
+    def _window_commit_latency(self):
+        # mean commit latency of the transactions committed in this window
+        if self.txn_stats is None:
+            return None
+        count, seconds = self.txn_stats.commit_latency()
+        prev_count, prev_seconds = self._commit_mark
+        self._commit_mark = (count, seconds)
+        if count == prev_count:
+            return None
+        return (seconds - prev_seconds) / (count - prev_count)
+
+    def maybe_adjust(self):
+        """
+        Once per window: measure, then move the limit up / down / hold.
+        """
+        if self.fixed:
+            return
+        now = time.perf_counter()
+        elapsed = now - self._window_start
+        if elapsed < self.window:
+            return
+
+        throughput = self._window_rows / elapsed
+        latency = self._window_commit_latency()
+        running = self.probe() if self.probe else None
+        if latency is not None and (self._best_latency is None or latency < self._best_latency):
+            self._best_latency = latency
+
+        old = self.limit
+        if running is not None and running > THREADS_RUNNING_LIMIT:
+            self.limit = max(self.min_workers, old - max(1, old // 4))
+            action = "down: Threads_running"
+        elif latency is not None and latency > self._best_latency * LATENCY_BACKOFF_FACTOR:
+            self.limit = max(self.min_workers, old - max(1, old // 4))
+            action = "down: commit latency"
+        elif old >= self.max_workers:
+            action = "hold: at max_workers"
+        elif self._last_throughput is None or throughput > self._last_throughput * (1 + THROUGHPUT_GAIN):
+            self.limit = old + 1
+            action = "up: throughput rising"
+        elif self._last_action == "up":
+            self.limit = max(self.min_workers, old - 1)
+            action = "down: last step did not pay off"
+        else:
+            action = "hold"
+
+        self.peak = max(self.peak, self.limit)
+        self.history.append({
+            "elapsed_s": round(now - self._started, 1),
+            "workers": old,
+            "rows_per_s": round(throughput, 1),
+            "commit_latency_ms": None if latency is None else round(latency * 1000, 2),
+            "threads_running": running,
+            "action": action,
+        })
+        if self.limit != old:
+            print(f"Concurrency {old} -> {self.limit} ({action}, {throughput:.0f} rows/s)")
+
+        self._last_action = action.split(":")[0]
+        self._last_throughput = throughput
+        self._window_start = now
+        self._window_rows = 0
+
+    def report(self):
+        """
+        Concurrency section of the run report.
+        """
+        return {
+            "mode": "fixed" if self.fixed else "auto",
+            "min_workers": self.min_workers,
+            "max_workers": self.max_workers,
+            "final_workers": self.limit,
+            "peak_workers": self.peak,
+            "adjustments": self.history,
+        }
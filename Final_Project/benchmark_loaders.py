@@ -0,0 +1,237 @@
+"""
+Loader benchmark suite.
+
+Runs every threaded insert_data_*.py loader (loader_registry.LOADERS, in
+dependency order) over one directory of IMDb TSV files, usually made by
+generate_data.py, and records per loader:
+- wall seconds (lookup pass + load) and rows/s
+- peak RSS of the loader process
+- rows and write seconds per target table (from its run report)
+
+Each loader runs in its own process, so peak RSS is that loader's alone.
+The run reports, dead-letter files and benchmark_results.json go to
+--out. The loaded tables are emptied first:
+- MySQL (connect_db.py): TRUNCATE of every loader table and lookup table
+- --sqlite: a fresh SQLite file with the create_db.py schema
+  (sqlite_backend.py), no server needed
+
+With --baseline <old benchmark_results.json>, loaders more than
+REGRESSION_TOLERANCE slower (rows/s) are listed and the exit code is 1.
+
+Usage:
+    python generate_data.py /tmp/imdb_small --titles 100000
+    python benchmark_loaders.py /tmp/imdb_small --sqlite --out /tmp/bench
+"""
+import argparse
+import importlib
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from loader_registry import LOADERS
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+
+# ---------------- CONFIG ----------------
+
+OUT_DIR = Path("benchmark")
+REGRESSION_TOLERANCE = 0.10   # rows/s drop vs. the baseline that counts as a regression
+
+# ----------------------------------------
+
+TSV_FILES = {
+    "title_basics": "title.basics.tsv",
+    "name_basics": "name.basics.tsv",
+    "title_akas": "title.akas.tsv",
+    "title_principals": "title.principals.tsv",
+    "title_crew": "title.crew.tsv",
+    "title_episode": "title.episode.tsv",
+    "title_ratings": "title.ratings.tsv",
+}
+
+LOOKUP_TABLES = ("title_type", "genre", "profession", "types", "title_attribute",
+                 "principal_category")
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB, None if unknown.
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+
+
+def clear_mysql():
+    """
+    Empty every loader table and lookup table (children first).
+    """
+    from connect_db import connect_db
+
+    conn = connect_db()
+    cur = conn.cursor()
+    cur.execute("SET FOREIGN_KEY_CHECKS = 0;")
+    for spec in reversed(list(LOADERS.values())):
+        for table in reversed(spec.tables):
+            cur.execute(f"TRUNCATE TABLE {table};")
+    for table in LOOKUP_TABLES:
+        cur.execute(f"TRUNCATE TABLE {table};")
+    cur.execute("SET FOREIGN_KEY_CHECKS = 1;")
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+# ---------------- one loader (child process) ----------------
+
+
+def run_one(name, tsv_path: Path, sqlite: bool):
+    """
+    Fill the lookups of loader `name` and run its threaded loader; returns
+    the timing part of its benchmark result.
+    """
+    if sqlite:
+        import sqlite_backend
+        sys.modules["connect_db"] = sqlite_backend
+
+    spec = LOADERS[name]
+    module = importlib.import_module(spec.module)
+
+    start = time.perf_counter()
+    if spec.fill_lookups is not None:
+        spec.fill_lookups(module, tsv_path)
+    lookup_seconds = time.perf_counter() - start
+    getattr(module, spec.thread_loader)(tsv_path, *spec.context(module, tsv_path))
+    seconds = time.perf_counter() - start
+
+    return {
+        "seconds": round(seconds, 3),
+        "lookup_seconds": round(lookup_seconds, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# ---------------- suite (parent process) ----------------
+
+
+def table_times(run_report):
+    """
+    {table: {rows, rows_per_s, write_seconds}} from a loader's run report.
+    """
+    metrics = run_report.get("metrics", {})
+    tables = {table: dict(stats) for table, stats in metrics.get("rows", {}).items()}
+    for hist in metrics.get("histograms", []):
+        if hist["name"] == "executemany_seconds" and hist["table"]:
+            tables.setdefault(hist["table"], {})["write_seconds"] = hist["sum"]
+    return tables
+
+
+def benchmark(tsv_dir: Path, out_dir: Path=OUT_DIR, loaders=tuple(LOADERS), sqlite=False):
+    """
+    Run `loaders` one after another, each in a fresh process with out_dir as
+    its working directory. Returns (and writes) the benchmark results.
+    """
+    tsv_dir = tsv_dir.resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if sqlite:
+        import sqlite_backend
+        sqlite_backend.create_schema(out_dir / sqlite_backend.SQLITE_PATH)
+    else:
+        clear_mysql()
+
+    results = {"tsv_dir": str(tsv_dir), "backend": "sqlite" if sqlite else "mysql", "loaders": {}}
+    for name in loaders:
+        tsv_path = tsv_dir / TSV_FILES[name]
+        print(f"==== {name} ({tsv_path.name}) ====")
+        timing_path = out_dir / f"{name}.timing.json"
+        cmd = [sys.executable, str(Path(__file__).resolve()), str(tsv_dir),
+               "--one", name, "--timing", str(timing_path.resolve())]
+        if sqlite:
+            cmd.append("--sqlite")
+        subprocess.run(cmd, cwd=out_dir, check=True)
+
+        result = json.loads(timing_path.read_text(encoding="utf-8"))
+        timing_path.unlink()
+        run_report = json.loads((out_dir / "run_reports" / f"{name}.json").read_text(encoding="utf-8"))
+        result["rows_read"] = run_report.get("rows_read")
+        result["rows_per_s"] = round(result["rows_read"] / result["seconds"], 1) if result["seconds"] else None
+        result["tables"] = table_times(run_report)
+        results["loaders"][name] = result
+
+    path = out_dir / "benchmark_results.json"
+    path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print_results(results)
+    print(f"Benchmark results written to {path}")
+    return results
+
+
+def print_results(results):
+    print(f"Loader benchmark ({results['backend']}, {results['tsv_dir']}):")
+    for name, r in results["loaders"].items():
+        print(f"  {name:18s} {r['rows_read']:>10} rows {r['seconds']:8.1f}s "
+              f"{r['rows_per_s']:>10.0f} rows/s  peak RSS {r['peak_rss_mb']} MB")
+        for table, t in r["tables"].items():
+            print(f"      {table:22s} {t.get('rows', 0):>10} rows  "
+                  f"write {t.get('write_seconds', 0):.2f}s")
+
+
+def regressions(results, baseline, tolerance: float=REGRESSION_TOLERANCE):
+    """
+    Loaders whose rows/s dropped by more than `tolerance` vs. baseline,
+    as [(name, baseline rows/s, rows/s)].
+    """
+    slower = []
+    for name, r in results["loaders"].items():
+        old = baseline["loaders"].get(name)
+        if old and old["rows_per_s"] and r["rows_per_s"] < old["rows_per_s"] * (1 - tolerance):
+            slower.append((name, old["rows_per_s"], r["rows_per_s"]))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the IMDb loaders on a directory of TSV files.")
+    parser.add_argument("tsv_dir", type=Path)
+    parser.add_argument("--out", type=Path, default=OUT_DIR)
+    parser.add_argument("--loaders", nargs="+", choices=list(LOADERS), default=list(LOADERS))
+    parser.add_argument("--sqlite", action="store_true",
+                        help="load into a fresh SQLite file instead of MySQL (see sqlite_backend.py)")
+    parser.add_argument("--generate", type=int, metavar="TITLES",
+                        help="first write a synthetic dataset of this many titles to tsv_dir")
+    parser.add_argument("--baseline", type=Path,
+                        help="benchmark_results.json of an earlier run to check for regressions")
+    parser.add_argument("--one", choices=list(LOADERS), help=argparse.SUPPRESS)
+    parser.add_argument("--timing", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one:
+        timing = run_one(args.one, args.tsv_dir / TSV_FILES[args.one], args.sqlite)
+        args.timing.write_text(json.dumps(timing), encoding="utf-8")
+        return
+
+    if args.generate:
+        from generate_data import generate
+        generate(args.tsv_dir, args.generate)
+
+    results = benchmark(args.tsv_dir, args.out, args.loaders, args.sqlite)
+
+    if args.baseline:
+        slower = regressions(results, json.loads(args.baseline.read_text(encoding="utf-8")))
+        for name, old, new in slower:
+            print(f"REGRESSION {name}: {old:.0f} -> {new:.0f} rows/s")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
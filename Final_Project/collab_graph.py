@@ -0,0 +1,294 @@
+"""
+Person-title collaboration graph in CSR form.
+
+title_principals, title_director and title_writer together are a
+bipartite graph between people and titles. build_graph() exports it as
+compressed sparse row arrays, both ways, into GRAPH_DIR (one .npy file
+per array, see FILES); CollabGraph.open() memory-maps them, so opening
+is instant and only the touched pages are read.
+
+- people / titles are numbered 0..n-1 in the order of their (integer
+  encoded, see columnar.encode_id) ids, person_ids / title_ids map back
+- person_titles[person_indptr[p]:person_indptr[p + 1]] are the titles of
+  person p (sorted), title_people likewise for a title
+- *_roles holds the roles of each edge as bits (ROLE_BITS), a person
+  being both director and writer of a title is one edge
+
+Queries run on whole frontiers at a time (vectorized BFS):
+- titles_of / people_of: one CSR slice
+- collaborators(person): people sharing a title
+- k_hop(person, k): people within k collaborations
+- shortest_path(a, b): person, title, person, ... chain
+- common_titles / common_collaborators(a, b)
+
+Usage:
+    python collab_graph.py build
+    python collab_graph.py path nm0000102 nm0000138
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from connect_db import *
+from columnar import decode_id, encode_id, read_columns
+
+
+# ---------------- CONFIG ----------------
+
+GRAPH_DIR = Path("graph")
+
+# ----------------------------------------
+
+ROLE_BITS = {"principal": 1, "director": 2, "writer": 4}
+EDGE_SOURCES = (
+    ("title_principals", "principal"),
+    ("title_director", "director"),
+    ("title_writer", "writer"),
+)
+FILES = ("person_ids", "title_ids",
+         "person_indptr", "person_titles", "person_roles",
+         "title_indptr", "title_people", "title_roles")
+
+
+def gather(indptr, indices, nodes):
+    """
+    Concatenated neighbor lists of nodes, without a Python loop.
+    """
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, indices.dtype)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return indices[np.repeat(starts, counts) + offsets]
+
+
+def csr(rows, cols, values, n_rows):
+    """
+    (indptr, cols, values) of the edges, ordered by (row, col).
+    """
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(n_rows + 1, np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, cols[order], values[order]
+
+
+def build_graph(directory: Path=GRAPH_DIR):
+    """
+    Read the three edge tables and write the CSR arrays to directory.
+    """
+    start = time.perf_counter()
+    conn = connect_db()
+    cur = conn.cursor()
+    people, titles, roles = [], [], []
+    for table, role in EDGE_SOURCES:
+        nconst, tconst = read_columns(cur, f"SELECT nconst, tconst FROM {table};", (None, None))
+        people.append(nconst)
+        titles.append(tconst)
+        roles.append(np.full(len(nconst), ROLE_BITS[role], np.uint8))
+    cur.close()
+    conn.close()
+    people, titles, roles = np.concatenate(people), np.concatenate(titles), np.concatenate(roles)
+
+    person_ids = np.unique(people)
+    title_ids = np.unique(titles)
+    p = np.searchsorted(person_ids, people).astype(np.int64)
+    t = np.searchsorted(title_ids, titles).astype(np.int64)
+
+    # one edge per (person, title), roles OR-ed together
+    edges, inverse = np.unique((p << 32) | t, return_inverse=True)
+    edge_roles = np.zeros(len(edges), np.uint8)
+    np.bitwise_or.at(edge_roles, inverse, roles)
+    p = (edges >> 32).astype(np.int32)
+    t = (edges & 0xFFFFFFFF).astype(np.int32)
+
+    arrays = {"person_ids": person_ids, "title_ids": title_ids}
+    arrays["person_indptr"], arrays["person_titles"], arrays["person_roles"] = csr(p, t, edge_roles, len(person_ids))
+    arrays["title_indptr"], arrays["title_people"], arrays["title_roles"] = csr(t, p, edge_roles, len(title_ids))
+
+    directory.mkdir(parents=True, exist_ok=True)
+    for name in FILES:
+        np.save(directory / f"{name}.npy", arrays[name])
+    print(f"Built graph: {len(person_ids)} people, {len(title_ids)} titles, {len(edges)} edges "
+          f"in {time.perf_counter() - start:.1f}s -> {directory}")
+    return arrays
+
+
+class CollabGraph:
+    """
+    Memory-mapped CSR arrays of build_graph(). People and titles are
+    given and returned as IMDb ids ("nm...", "tt...").
+    """
+
+    def __init__(self, arrays):
+        for name in FILES:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def open(cls, directory: Path=GRAPH_DIR):
+        return cls({name: np.load(directory / f"{name}.npy", mmap_mode="r") for name in FILES})
+
+    # ---------------- ids ----------------
+
+    @staticmethod
+    def _index(ids, value):
+        n = encode_id(value)
+        i = int(np.searchsorted(ids, n))
+        if i == len(ids) or ids[i] != n:
+            raise KeyError(f"{value} is not in the graph")
+        return i
+
+    def person(self, nconst):
+        return self._index(self.person_ids, nconst)
+
+    def title(self, tconst):
+        return self._index(self.title_ids, tconst)
+
+    def nconsts(self, people):
+        return [decode_id("nm", int(n)) for n in self.person_ids[people]]
+
+    def tconsts(self, titles):
+        return [decode_id("tt", int(n)) for n in self.title_ids[titles]]
+
+    # ---------------- queries ----------------
+
+    def titles_of(self, nconst, roles=None):
+        """
+        Titles of a person; roles: only edges with one of these roles.
+        """
+        p = self.person(nconst)
+        lo, hi = self.person_indptr[p], self.person_indptr[p + 1]
+        titles = self.person_titles[lo:hi]
+        if roles:
+            mask = sum(ROLE_BITS[r] for r in roles)
+            titles = titles[(self.person_roles[lo:hi] & mask) != 0]
+        return self.tconsts(titles)
+
+    def people_of(self, tconst):
+        t = self.title(tconst)
+        return self.nconsts(self.title_people[self.title_indptr[t]:self.title_indptr[t + 1]])
+
+    def _collaborators(self, people):
+        titles = np.unique(gather(self.person_indptr, self.person_titles, people))
+        return np.unique(gather(self.title_indptr, self.title_people, titles))
+
+    def collaborators(self, nconst):
+        p = self.person(nconst)
+        found = self._collaborators(np.array([p]))
+        return self.nconsts(found[found != p])
+
+    def k_hop(self, nconst, k=2):
+        """
+        People within k collaborations of nconst, as {nconst: hops}.
+        """
+        seen = np.zeros(len(self.person_ids), bool)
+        frontier = np.array([self.person(nconst)])
+        seen[frontier] = True
+        hops = {}
+        for hop in range(1, k + 1):
+            found = self._collaborators(frontier)
+            frontier = found[~seen[found]]
+            if not len(frontier):
+                break
+            seen[frontier] = True
+            hops.update(dict.fromkeys(self.nconsts(frontier), hop))
+        return hops
+
+    def shortest_path(self, source, target, max_hops=6):
+        """
+        Shortest chain person, title, person, ... from source to target,
+        None if they are more than max_hops collaborations apart.
+        """
+        s, goal = self.person(source), self.person(target)
+        if s == goal:
+            return [source]
+        # parent title of each reached person, parent person of each reached title
+        person_via = np.full(len(self.person_ids), -1, np.int64)
+        title_via = np.full(len(self.title_ids), -1, np.int64)
+        person_via[s] = s
+        frontier = np.array([s])
+        for _ in range(max_hops):
+            # person -> titles
+            counts = self.person_indptr[frontier + 1] - self.person_indptr[frontier]
+            titles = gather(self.person_indptr, self.person_titles, frontier)
+            owners = np.repeat(frontier, counts)
+            new = title_via[titles] < 0
+            titles, owners = titles[new], owners[new]
+            titles, first = np.unique(titles, return_index=True)
+            title_via[titles] = owners[first]
+            # titles -> people
+            counts = self.title_indptr[titles + 1] - self.title_indptr[titles]
+            people = gather(self.title_indptr, self.title_people, titles)
+            owners = np.repeat(titles, counts)
+            new = person_via[people] < 0
+            people, owners = people[new], owners[new]
+            people, first = np.unique(people, return_index=True)
+            person_via[people] = owners[first]
+            if person_via[goal] >= 0:
+                break
+            if not len(people):
+                return None
+            frontier = people
+        else:
+            return None
+
+        path = []
+        p = goal
+        while p != s:
+            t = person_via[p]
+            path += [self.nconsts([p])[0], self.tconsts([t])[0]]
+            p = title_via[t]
+        path.append(source)
+        return path[::-1]
+
+    def common_titles(self, a, b):
+        return self.tconsts(np.intersect1d(
+            gather(self.person_indptr, self.person_titles, np.array([self.person(a)])),
+            gather(self.person_indptr, self.person_titles, np.array([self.person(b)]))))
+
+    def common_collaborators(self, a, b):
+        """
+        People who worked with both a and b (other than a and b).
+        """
+        pa, pb = self.person(a), self.person(b)
+        both = np.intersect1d(self._collaborators(np.array([pa])), self._collaborators(np.array([pb])))
+        return self.nconsts(both[(both != pa) & (both != pb)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / query the person-title collaboration graph.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build")
+    path_cmd = sub.add_parser("path", help="shortest collaboration path")
+    path_cmd.add_argument("source")
+    path_cmd.add_argument("target")
+    hop_cmd = sub.add_parser("khop", help="people within k collaborations")
+    hop_cmd.add_argument("person")
+    hop_cmd.add_argument("-k", type=int, default=2)
+    common_cmd = sub.add_parser("common", help="common titles and collaborators")
+    common_cmd.add_argument("a")
+    common_cmd.add_argument("b")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_graph()
+        return
+
+    graph = CollabGraph.open()
+    start = time.perf_counter()
+    if args.command == "path":
+        print(graph.shortest_path(args.source, args.target))
+    elif args.command == "khop":
+        hops = graph.k_hop(args.person, args.k)
+        for hop in range(1, args.k + 1):
+            print(f"{hop} hop(s): {sum(1 for h in hops.values() if h == hop)} people")
+    else:
+        print("common titles:", graph.common_titles(args.a, args.b))
+        print("common collaborators:", graph.common_collaborators(args.a, args.b))
+    print(f"{(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
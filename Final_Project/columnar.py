@@ -0,0 +1,312 @@
+"""
+In-process columnar engine for the commands.sql analytics.
+
+ColumnStore.load() reads title_basics, title_ratings, title_genre,
+title_director, title_writer and person_profession once into NumPy
+arrays. Keys are integer-encoded: an IMDb id is its number ("tt0000042"
+-> 42, "nm0000007" -> 7), lookup ids stay as they are. The commands.sql
+questions are then answered with vectorized kernels:
+- joins:     sort one side by key, np.searchsorted the other into it
+             (join_unique for key -> value, join_many for many-to-many)
+- group-by:  np.bincount over dense small ids (types, genres), np.unique
+             with return_inverse over sparse ones (people)
+
+Only the result rows go back to MySQL, for their names
+(name_basics.primaryName / title_basics.primaryTitle are not loaded).
+
+Usage:
+    python columnar.py                   # run all queries, print results
+    python columnar.py --benchmark 5     # vs. MySQL, 5 runs per query
+"""
+import argparse
+import time
+
+import numpy as np
+
+from connect_db import *
+from query_benchmark import parse_commands, percentile
+
+
+# ---------------- CONFIG ----------------
+
+FETCH_SIZE = 100000      # rows per fetchmany while loading
+MIN_DIRECTED = 5         # query 4: HAVING number_title >= 5
+
+# ----------------------------------------
+
+
+def encode_id(value):
+    # "tt0000042" -> 42
+    return int(value[2:])
+
+
+def decode_id(prefix, n):
+    return f"{prefix}{n:07d}"
+
+
+def read_columns(cur, sql, dtypes, fetch_size: int=FETCH_SIZE):
+    """
+    One NumPy array per selected column. A dtype of None means an IMDb id
+    column, encoded with encode_id into int32; NULLs become NaN / -1.
+    """
+    cur.execute(sql)
+    parts = [[] for _ in dtypes]
+    while True:
+        rows = cur.fetchmany(fetch_size)
+        if not rows:
+            break
+        for k, (column, dtype) in enumerate(zip(zip(*rows), dtypes)):
+            if dtype is None:
+                parts[k].append(np.fromiter(map(encode_id, column), np.int32, len(column)))
+            elif dtype.kind == "f":
+                parts[k].append(np.array([np.nan if v is None else v for v in column], dtype))
+            else:
+                parts[k].append(np.array([-1 if v is None else v for v in column], dtype))
+    return [np.concatenate(p) if p else np.empty(0, d or np.int32) for p, d in zip(parts, dtypes)]
+
+
+def join_unique(keys, values, probe, missing):
+    """
+    values[i] where keys[i] == probe[j], for every j (keys unique);
+    `missing` where probe has no match.
+    """
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    pos = np.searchsorted(sorted_keys, probe)
+    pos[pos == len(sorted_keys)] = 0
+    found = sorted_keys[pos] == probe if len(sorted_keys) else np.zeros(len(probe), bool)
+    out = np.full(len(probe), missing, dtype=values.dtype)
+    out[found] = values[order[pos[found]]]
+    return out, found
+
+
+def join_many(left_keys, right_keys):
+    """
+    Index pairs (i, j) with left_keys[i] == right_keys[j] (an inner join
+    of two non-unique key columns).
+    """
+    order = np.argsort(right_keys, kind="stable")
+    sorted_right = right_keys[order]
+    lo = np.searchsorted(sorted_right, left_keys, "left")
+    hi = np.searchsorted(sorted_right, left_keys, "right")
+    counts = hi - lo
+    left_idx = np.repeat(np.arange(len(left_keys)), counts)
+    # position of each output row inside its left row's run of matches
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    right_idx = order[np.repeat(lo, counts) + offsets]
+    return left_idx, right_idx
+
+
+def name_index(lookup):
+    """
+    (sorted distinct names, array id -> index into them) for a lookup
+    table {id: name}; lookup tables may repeat a name under several ids,
+    and commands.sql groups by the name.
+    """
+    names = sorted(set(lookup.values()))
+    position = {name: i for i, name in enumerate(names)}
+    to_name = np.full(max(lookup, default=0) + 1, -1, np.int64)
+    for key, name in lookup.items():
+        to_name[key] = position[name]
+    return names, to_name
+
+
+def group_sum_count(groups, values):
+    """
+    (distinct groups, sum of non-NaN values, count of non-NaN values,
+    count of rows) per group.
+    """
+    keys, inverse = np.unique(groups, return_inverse=True)
+    valid = ~np.isnan(values)
+    sums = np.bincount(inverse, np.where(valid, values, 0.0), len(keys))
+    counts = np.bincount(inverse, valid, len(keys))
+    rows = np.bincount(inverse, minlength=len(keys))
+    return keys, sums, counts, rows
+
+
+class ColumnStore:
+    """
+    The normalized tables as columns, plus the small lookup tables as
+    dicts. Build with ColumnStore.load().
+    """
+
+    def __init__(self, columns, lookups):
+        self.__dict__.update(columns)
+        self.type_names, self.genre_names, self.profession_names = lookups
+
+    @classmethod
+    def load(cls):
+        conn = connect_db()
+        cur = conn.cursor()
+        i16, i32, f32 = np.dtype(np.int16), np.dtype(np.int32), np.dtype(np.float32)
+        columns = {}
+        columns["tb_tconst"], columns["tb_type"] = read_columns(
+            cur, "SELECT tconst, title_type_id FROM title_basics;", (None, i16))
+        columns["tr_tconst"], columns["tr_rating"], columns["tr_votes"] = read_columns(
+            cur, "SELECT tconst, averageRating, numVotes FROM title_ratings;", (None, f32, i32))
+        columns["tg_tconst"], columns["tg_genre"] = read_columns(
+            cur, "SELECT tconst, genre_id FROM title_genre;", (None, i16))
+        columns["td_tconst"], columns["td_nconst"] = read_columns(
+            cur, "SELECT tconst, nconst FROM title_director;", (None, None))
+        columns["tw_tconst"], columns["tw_nconst"] = read_columns(
+            cur, "SELECT tconst, nconst FROM title_writer;", (None, None))
+        columns["pp_nconst"], columns["pp_profession"] = read_columns(
+            cur, "SELECT nconst, profession_id FROM person_profession;", (None, i16))
+
+        lookups = []
+        for sql in ("SELECT title_type_id, title_type_name FROM title_type;",
+                    "SELECT genre_id, genre_name FROM genre;",
+                    "SELECT id, profession_name FROM profession;"):
+            cur.execute(sql)
+            lookups.append(dict(cur.fetchall()))
+        cur.close()
+        conn.close()
+        return cls(columns, lookups)
+
+    def nbytes(self):
+        return sum(v.nbytes for v in self.__dict__.values() if isinstance(v, np.ndarray))
+
+    # ---------------- names of result rows ----------------
+
+    @staticmethod
+    def _names(sql, ids):
+        if not ids:
+            return {}
+        conn = connect_db()
+        cur = conn.cursor()
+        cur.execute(sql % ", ".join(["%s"] * len(ids)), tuple(ids))
+        names = dict(cur.fetchall())
+        cur.close()
+        conn.close()
+        return names
+
+    def person_names(self, nconsts):
+        ids = [decode_id("nm", int(n)) for n in nconsts]
+        names = self._names("SELECT nconst, primaryName FROM name_basics WHERE nconst IN (%s);", ids)
+        return [names.get(i) for i in ids]
+
+    def title_names(self, tconsts):
+        ids = [decode_id("tt", int(t)) for t in tconsts]
+        names = self._names("SELECT tconst, primaryTitle FROM title_basics WHERE tconst IN (%s);", ids)
+        return [names.get(i) for i in ids]
+
+    # ---------------- commands.sql ----------------
+
+    def query_1(self):
+        """Titles per title type."""
+        counts = np.bincount(self.tb_type[self.tb_type >= 0])
+        return [(self.type_names[t], int(counts[t])) for t in np.flatnonzero(counts)]
+
+    def query_2(self, min_votes=1000, k=5):
+        """Top k rated titles with more than min_votes votes."""
+        rated = np.flatnonzero((self.tr_votes > min_votes) & ~np.isnan(self.tr_rating))
+        _, found = join_unique(self.tb_tconst, self.tb_type, self.tr_tconst[rated], -1)
+        rated = rated[found]
+        best = rated[np.argsort(-self.tr_rating[rated], kind="stable")[:k]]
+        titles = self.title_names(self.tr_tconst[best])
+        return [(title, round(float(self.tr_rating[i]), 1), int(self.tr_votes[i]))
+                for title, i in zip(titles, best)]
+
+    def query_3(self):
+        """Average rating per title type name."""
+        types, found = join_unique(self.tb_tconst, self.tb_type, self.tr_tconst, -1)
+        found &= types >= 0
+        names, to_name = name_index(self.type_names)
+        ratings = self.tr_rating[found].astype(np.float64)
+        keys, sums, counts, _ = group_sum_count(to_name[types[found]], ratings)
+        return [(names[t], s / c if c else None) for t, s, c in zip(keys, sums, counts)]
+
+    def query_4(self, k=5, min_titles=MIN_DIRECTED):
+        """Best k directors by average rating, over at least min_titles rated titles."""
+        ratings, found = join_unique(self.tr_tconst, self.tr_rating.astype(np.float64),
+                                     self.td_tconst, np.nan)
+        keys, sums, counts, rows = group_sum_count(self.td_nconst[found], ratings[found])
+        keep = np.flatnonzero((rows >= min_titles) & (counts > 0))
+        averages = sums[keep] / counts[keep]
+        best = keep[np.argsort(-averages, kind="stable")[:k]]
+        names = self.person_names(keys[best])
+        return [(name, sums[i] / counts[i], int(rows[i])) for name, i in zip(names, best)]
+
+    def query_5(self):
+        """People who are both directors and writers."""
+        return [(int(np.intersect1d(self.td_nconst, self.tw_nconst).size),)]
+
+    def query_6(self):
+        """Distinct people per profession name."""
+        names, to_name = name_index(self.profession_names)
+        known = self.pp_profession >= 0
+        pairs = np.unique((to_name[self.pp_profession[known]] << 32) | self.pp_nconst[known].astype(np.int64))
+        counts = np.bincount(pairs >> 32, minlength=len(names))
+        return [(name, int(counts[i])) for i, name in enumerate(names) if counts[i]]
+
+    def query_7(self):
+        """Per genre, the director(s) with the most titles in it."""
+        g_idx, d_idx = join_many(self.tg_tconst, self.td_tconst)
+        pairs = (self.tg_genre[g_idx].astype(np.int64) << 32) | self.td_nconst[d_idx].astype(np.int64)
+        keys, counts = np.unique(pairs, return_counts=True)
+        genres = keys >> 32
+        best = np.zeros(genres.max() + 1 if len(genres) else 0, np.int64)
+        np.maximum.at(best, genres, counts)
+        winners = np.flatnonzero(counts == best[genres])
+        names = self.person_names(keys[winners] & 0xFFFFFFFF)
+        rows = [(self.genre_names.get(int(genres[i])), name, int(counts[i]))
+                for name, i in zip(names, winners)]
+        return sorted(rows, key=lambda r: r[0])
+
+    def run(self, name):
+        return getattr(self, name)()
+
+
+QUERIES = [f"query_{n}" for n in range(1, 8)]
+
+
+def benchmark(store, runs: int=5):
+    """
+    Median seconds per query for the columnar engine and for MySQL
+    (commands.sql, warm), as {query: (columnar, mysql)}.
+    """
+    sql, _ = parse_commands()
+    conn = connect_db()
+    cur = conn.cursor()
+    results = {}
+    for name in QUERIES:
+        columnar_times, mysql_times = [], []
+        for _ in range(runs):
+            start = time.perf_counter()
+            store.run(name)
+            columnar_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            cur.execute(sql[name])
+            cur.fetchall()
+            mysql_times.append(time.perf_counter() - start)
+        results[name] = (percentile(sorted(columnar_times), 0.5), percentile(sorted(mysql_times), 0.5))
+    cur.close()
+    conn.close()
+
+    print(f"{'query':10s}{'columnar ms':>14s}{'mysql ms':>12s}{'speedup':>10s}")
+    for name, (col, db) in results.items():
+        print(f"{name:10s}{col * 1000:14.2f}{db * 1000:12.2f}{db / col if col else float('inf'):9.1f}x")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar in-process engine for the commands.sql queries.")
+    parser.add_argument("--benchmark", type=int, metavar="RUNS",
+                        help="time every query here and on MySQL")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = ColumnStore.load()
+    print(f"Loaded columns ({store.nbytes() / 2**20:.1f} MB) in {time.perf_counter() - start:.1f}s")
+
+    if args.benchmark:
+        benchmark(store, args.benchmark)
+        return
+    for name in QUERIES:
+        print(f"==== {name} ====")
+        for row in store.run(name):
+            print(*row, sep="\t")
+
+
+if __name__ == "__main__":
+    main()
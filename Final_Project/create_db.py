@@ -28,6 +28,15 @@ normalized_title_basic = [
 
     # Core table: title_basics
     # Foreign Key: title_type_id
+    # genre_mask: bit genre.mask_bit set per genre of the title (genre_mask.py)
+    # (existing databases: ALTER TABLE title_basics
+    #    ADD COLUMN genre_mask BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    #    ADD INDEX idx_tb_genre_mask (genre_mask);
+    #  then python genre_mask.py backfill)
+    # tconst_len: tconst in IMDb file order (merge_join.SortedIdStream)
+    # (existing databases: ALTER TABLE title_basics
+    #    ADD COLUMN tconst_len TINYINT UNSIGNED AS (CHAR_LENGTH(tconst)) STORED,
+    #    ADD INDEX idx_tb_tconst_len (tconst_len, tconst);)
         """
         CREATE TABLE IF NOT EXISTS title_basics (
             tconst VARCHAR(12) NOT NULL PRIMARY KEY,
@@ -38,6 +47,10 @@ normalized_title_basic = [
             endYear INT NULL,
             runtimeMinutes INT NULL,
             title_type_id INT NULL,
+            genre_mask BIGINT UNSIGNED NOT NULL DEFAULT 0,
+            tconst_len TINYINT UNSIGNED AS (CHAR_LENGTH(tconst)) STORED,
+            INDEX idx_tb_genre_mask (genre_mask),
+            INDEX idx_tb_tconst_len (tconst_len, tconst),
             CONSTRAINT fk_tt_type_id
                 FOREIGN KEY (title_type_id) REFERENCES title_type(title_type_id)
             ON UPDATE CASCADE ON DELETE CASCADE
@@ -46,10 +59,16 @@ normalized_title_basic = [
 
     # Lookup: genre
     # Split genres by comma, distinct genre rows.
+    # mask_bit: bit of the genre in title_basics.genre_mask (mask_bits.py)
+    # (existing databases: point title_genre at the first genre_id of each
+    #  name and delete the other rows, then ALTER TABLE genre
+    #    ADD COLUMN mask_bit TINYINT UNSIGNED NULL UNIQUE,
+    #    ADD UNIQUE (genre_name);)
     """
     CREATE TABLE IF NOT EXISTS genre (
         genre_id INT AUTO_INCREMENT PRIMARY KEY,
-        genre_name VARCHAR(64) NOT NULL
+        genre_name VARCHAR(64) NOT NULL UNIQUE,
+        mask_bit TINYINT UNSIGNED NULL UNIQUE
     );
     """,
 
@@ -84,10 +103,13 @@ normalized_name_basic = [
 
     # Lookup: profession
     # Split primaryProfession.
+    # mask_bit: bit of the profession in person_roles.profession_mask
+    # (existing databases: see genre)
     """
     CREATE TABLE IF NOT EXISTS profession (
         id INT AUTO_INCREMENT PRIMARY KEY,
-        profession_name VARCHAR(128) NOT NULL
+        profession_name VARCHAR(128) NOT NULL UNIQUE,
+        mask_bit TINYINT UNSIGNED NULL UNIQUE
     );
     """,
 
@@ -96,13 +118,10 @@ normalized_name_basic = [
     CREATE TABLE IF NOT EXISTS person_profession (
         id INT AUTO_INCREMENT PRIMARY KEY,
         nconst VARCHAR(12) NOT NULL,
-        profession_id INT NOT NULL
-<<<<<<< HEAD
+        profession_id INT NOT NULL,
         CONSTRAINT person_profession_name_basics_fk
             FOREIGN KEY (nconst) REFERENCES name_basics(nconst)
             ON UPDATE CASCADE ON DELETE CASCADE
-=======
->>>>>>> eb3b5dc2ea05affd3c12176b89f1a65ddef378d2
     );
     """,
 
@@ -193,10 +212,13 @@ normalized_title_akas = [
 # Normalized title principals
 normalized_title_principals = [
     # Lookup: principal_category (e.g., "actor", "actress", "director", "producer", ...)
+    # mask_bit: bit of the category in person_roles.category_mask
+    # (existing databases: see genre)
     """
     CREATE TABLE IF NOT EXISTS principal_category (
         id INT AUTO_INCREMENT PRIMARY KEY,
-        category_name VARCHAR(64) NOT NULL
+        category_name VARCHAR(64) NOT NULL UNIQUE,
+        mask_bit TINYINT UNSIGNED NULL UNIQUE
     );
     """,
 
@@ -290,11 +312,16 @@ normalized_title_episode_AND_title_ratings = [
     """,
 
     # Table: title_ratings
+    # weightedRating: Bayesian weighted rating, computed by the loader
+    # (existing databases: ALTER TABLE title_ratings
+    #    ADD COLUMN weightedRating DOUBLE NULL, ADD INDEX idx_tr_weighted (weightedRating);)
     """
     CREATE TABLE IF NOT EXISTS title_ratings (
         tconst VARCHAR(12) PRIMARY KEY NOT NULL,
         averageRating DECIMAL(3,1) NULL,
         numVotes INT NULL,
+        weightedRating DOUBLE NULL,
+        INDEX idx_tr_weighted (weightedRating),
         CONSTRAINT fk_tr_tconst
             FOREIGN KEY (tconst) REFERENCES title_basics(tconst)
             ON UPDATE CASCADE ON DELETE CASCADE
@@ -302,6 +329,127 @@ normalized_title_episode_AND_title_ratings = [
     """
 ]
 
+# Summary tables of the commands.sql analytics (filled by summaries.py)
+analytics_summaries = [
+    # Per title type: ratings of its titles (query 3)
+    """
+    CREATE TABLE IF NOT EXISTS summary_type_rating (
+        title_type_id INT PRIMARY KEY NOT NULL,
+        num_titles INT NOT NULL,
+        rating_sum DOUBLE NOT NULL,
+        rating_count INT NOT NULL
+    );
+    """,
+
+    # Per director: ratings of the rated titles they directed (query 4)
+    """
+    CREATE TABLE IF NOT EXISTS summary_director_rating (
+        nconst VARCHAR(12) PRIMARY KEY NOT NULL,
+        num_titles INT NOT NULL,
+        rating_sum DOUBLE NOT NULL,
+        rating_count INT NOT NULL
+    );
+    """,
+
+    # Per (genre, director): titles directed in that genre (query 7)
+    """
+    CREATE TABLE IF NOT EXISTS summary_genre_director (
+        genre_id INT NOT NULL,
+        nconst VARCHAR(12) NOT NULL,
+        num_titles INT NOT NULL,
+        PRIMARY KEY (genre_id, nconst)
+    );
+    """,
+
+    # Per profession: distinct people (query 6)
+    """
+    CREATE TABLE IF NOT EXISTS summary_profession (
+        profession_name VARCHAR(128) PRIMARY KEY NOT NULL,
+        num_people INT NOT NULL
+    );
+    """,
+
+    # Top-K rated titles per (vote threshold, type, genre, decade); 0 = any
+    # (filled by top_rated.py)
+    """
+    CREATE TABLE IF NOT EXISTS top_rated (
+        min_votes INT NOT NULL,
+        title_type_id INT NOT NULL,
+        genre_id INT NOT NULL,
+        decade INT NOT NULL,
+        rank_pos INT NOT NULL,
+        tconst VARCHAR(12) NOT NULL,
+        primaryTitle VARCHAR(512) NULL,
+        averageRating DECIMAL(3,1) NOT NULL,
+        numVotes INT NOT NULL,
+        PRIMARY KEY (min_votes, title_type_id, genre_id, decade, rank_pos)
+    );
+    """,
+
+    # One wide row per title for point reads (filled by title_summary.py);
+    # genres / directors / writers are JSON arrays
+    """
+    CREATE TABLE IF NOT EXISTS title_summary (
+        tconst VARCHAR(12) PRIMARY KEY NOT NULL,
+        primaryTitle VARCHAR(512) NULL,
+        originalTitle VARCHAR(512) NULL,
+        titleType VARCHAR(64) NULL,
+        isAdult TINYINT(1) NULL,
+        startYear INT NULL,
+        endYear INT NULL,
+        runtimeMinutes INT NULL,
+        averageRating DECIMAL(3,1) NULL,
+        numVotes INT NULL,
+        weightedRating DOUBLE NULL,
+        genres JSON NULL,
+        directors JSON NULL,
+        writers JSON NULL,
+        parentTconst VARCHAR(12) NULL,
+        seasonNumber INT NULL,
+        episodeNumber INT NULL
+    );
+    """,
+
+    # Role bits per person (filled by person_roles.py):
+    # crew_mask bit 0 director / bit 1 writer, category_mask bit
+    # principal_category.mask_bit, profession_mask bit profession.mask_bit
+    """
+    CREATE TABLE IF NOT EXISTS person_roles (
+        nconst VARCHAR(12) PRIMARY KEY NOT NULL,
+        crew_mask TINYINT UNSIGNED NOT NULL DEFAULT 0,
+        category_mask BIGINT UNSIGNED NOT NULL DEFAULT 0,
+        profession_mask BIGINT UNSIGNED NOT NULL DEFAULT 0,
+        INDEX idx_pr_crew (crew_mask),
+        INDEX idx_pr_category (category_mask),
+        INDEX idx_pr_profession (profession_mask)
+    );
+    """,
+
+    # HyperLogLog registers per (dimension, value) (distinct_sketches.py)
+    """
+    CREATE TABLE IF NOT EXISTS distinct_sketches (
+        dimension VARCHAR(16) NOT NULL,
+        value VARCHAR(128) NOT NULL,
+        registers MEDIUMBLOB NOT NULL,
+        PRIMARY KEY (dimension, value)
+    );
+    """
+]
+
+# One row per finished load (written by metrics.write_run_report); readers
+# that cache query results (query_service.py) drop them when MAX(run_id)
+# changes
+load_bookkeeping = [
+    """
+    CREATE TABLE IF NOT EXISTS load_runs (
+        run_id INT AUTO_INCREMENT PRIMARY KEY,
+        table_name VARCHAR(64) NOT NULL,
+        rows_read BIGINT NULL,
+        finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """
+]
+
 
 DBC_STATEMENTS = [
     start_Statements,
@@ -310,7 +458,9 @@ DBC_STATEMENTS = [
     normalized_title_akas,
     normalized_title_principals,
     normalized_title_crew,
-    normalized_title_episode_AND_title_ratings
+    normalized_title_episode_AND_title_ratings,
+    analytics_summaries,
+    load_bookkeeping
 ]
 
 def main():
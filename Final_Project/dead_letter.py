@@ -0,0 +1,129 @@
+"""
+Dead-letter files for rows the loaders drop or only partly load.
+
+Every row builder takes a dead_letter argument and calls
+dead_letter.reject(REASON, row, detail) wherever it used to `continue`
+silently (or quietly NULL a reference). DeadLetterWriter hands the rows
+to a background thread, which writes them gzip-compressed to
+DEAD_LETTER_DIR/<table>.rejects.tsv.gz:
+
+    reason  detail  <the original TSV columns...>
+
+so the workers never wait on compression or disk. Per-reason counts go
+into the run report.
+"""
+import gzip
+import threading
+from pathlib import Path
+from queue import SimpleQueue
+
+
+# ---------------- CONFIG ----------------
+
+DEAD_LETTER_DIR = Path("dead_letter")
+FLUSH_EVERY = 1000       # rows per write() on the background thread
+
+# ----------------------------------------
+
+
+# ---------------- reason codes ----------------
+# row dropped
+MISSING_KEY = "missing_key"                  # empty tconst / nconst / titleId
+TITLE_NOT_FOUND = "title_not_found"          # tconst not in title_basics
+NAME_NOT_FOUND = "name_not_found"            # nconst not in name_basics
+BAD_ORDERING = "bad_ordering"                # ordering missing or not an int
+# row kept, part of it dropped / NULLed (detail says which value)
+UNKNOWN_TITLE_TYPE = "unknown_title_type"    # titleType not in title_type_map
+UNKNOWN_GENRE = "unknown_genre"              # genre not in genre_map
+UNKNOWN_PROFESSION = "unknown_profession"
+UNKNOWN_AKA_TYPE = "unknown_aka_type"
+UNKNOWN_AKA_ATTRIBUTE = "unknown_aka_attribute"
+UNKNOWN_CATEGORY = "unknown_category"
+KNOWN_FOR_NOT_FOUND = "known_for_not_found"  # knownForTitles entry not in title_basics
+CREW_NAME_NOT_FOUND = "crew_name_not_found"  # directors / writers entry not in name_basics
+PARENT_NULLED = "parent_nulled"              # parentTconst not in title_basics -> NULL
+
+
+class _NoDeadLetter:
+    """
+    Default for the row builders: rejected rows are just dropped.
+    """
+
+    def reject(self, reason, row, detail=None):
+        pass
+
+
+NO_DEAD_LETTER = _NoDeadLetter()
+
+
+class DeadLetterWriter:
+    """
+    Collects rejected rows for one table from any number of threads.
+
+    Use as a context manager around the load; the file is only created
+    if something is rejected.
+    """
+
+    _STOP = object()
+
+    def __init__(self, table, directory: Path=DEAD_LETTER_DIR):
+        self.table = table
+        self.path = directory / f"{table}.rejects.tsv.gz"
+        self.counts = {}         # reason -> rows; only touched by the writer thread
+        self._queue = SimpleQueue()
+        self._thread = threading.Thread(target=self._write_loop, name=f"dead-letter-{table}",
+                                        daemon=True)
+        self._thread.start()
+
+    def reject(self, reason, row, detail=None):
+        """
+        Called from the loader threads: just a queue put.
+        """
+        self._queue.put((reason, detail, row))
+
+    def _write_loop(self):
+        out = None
+        buffer = []
+        try:
+            while True:
+                item = self._queue.get()
+                if item is self._STOP:
+                    break
+                reason, detail, row = item
+                self.counts[reason] = self.counts.get(reason, 0) + 1
+                if out is None:
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                    out = gzip.open(self.path, "wt", encoding="utf-8", newline="")
+                    out.write("\t".join(["reason", "detail", *row.keys()]) + "\n")
+                buffer.append("\t".join([
+                    reason,
+                    "" if detail is None else str(detail),
+                    *(r"\N" if value is None else value for value in row.values()),
+                ]) + "\n")
+                if len(buffer) >= FLUSH_EVERY:
+                    out.write("".join(buffer))
+                    buffer = []
+        finally:
+            if out is not None:
+                out.write("".join(buffer))
+                out.close()
+
+    def close(self):
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def report(self):
+        """
+        Dead-letter section of the run report (call after close()).
+        """
+        return {
+            "file": str(self.path) if self.counts else None,
+            "rows": sum(self.counts.values()),
+            "reasons": dict(sorted(self.counts.items())),
+        }
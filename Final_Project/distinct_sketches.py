@@ -0,0 +1,456 @@
+"""
+Approximate distinct counts: HyperLogLog sketches per profession, genre,
+principal category, aka region and aka language.
+
+Query 6 of commands.sql (COUNT(DISTINCT pp.nconst) per profession) and
+its siblings scan tens of millions of bridge rows. A HyperLogLog sketch
+counts the distinct items added to it in a fixed 2^HLL_PRECISION bytes,
+with a relative standard error of 1.04 / sqrt(2^HLL_PRECISION) (0.8% at
+14), and two sketches merge by a register-wise max into the sketch of
+the union. So:
+
+- with SKETCH_DURING_LOAD, while a loader runs, the rows of every
+  committed chunk go into the load's SketchSet
+  (loader_pipeline.TransactionStats.sketches); adding an item twice
+  changes nothing, so replayed transactions and re-loaded rows are
+  harmless
+- at the end of its main() the loader calls merge_after_load(sketches):
+  the load's sketches are merged into the stored ones (distinct_sketches
+  table, create_db.py), so a delta load only adds what it saw
+- estimates(cur, dimension) reads a dimension's counts from the stored
+  sketches; union_estimate() merges several values first (distinct
+  people who are actors or actresses)
+
+DIMENSIONS lists what is counted:
+
+    profession  people per profession     (person_profession)
+    genre       titles per genre          (title_genre)
+    category    people per principal category (title_principals)
+    region      titles per aka region     (title_akas)
+    language    titles per aka language   (title_akas)
+
+Sketching costs the workers about 1-2 µs per committed row
+(SketchSet.add_rows hashes each distinct item of a chunk once, in
+Python), small next to inserting the row. With SKETCH_DURING_LOAD off
+the loaders leave the stored sketches alone and they go stale until a
+"rebuild".
+
+Lookup ids are stored under their names (the ids of a name that the
+lookup table holds twice share one sketch). The set-based engines of
+staging_load.py don't go through the chunk pipeline; they rebuild the
+dimensions of the tables they loaded. Run "rebuild" to start from the
+current tables.
+
+Usage:
+    python distinct_sketches.py rebuild [--only genre region]
+    python distinct_sketches.py show profession --exact
+    python distinct_sketches.py union category actor actress
+"""
+import argparse
+import hashlib
+import math
+import threading
+import time
+from typing import NamedTuple
+
+from connect_db import *
+
+
+# ---------------- CONFIG ----------------
+
+SKETCH_DURING_LOAD = True   # loaders feed and merge the sketches
+HLL_PRECISION = 14          # 2^p one-byte registers per sketch
+FETCH_SIZE = 100000
+
+# ----------------------------------------
+
+_MASK64 = (1 << 64) - 1
+_POW2 = [2.0 ** -r for r in range(66)]
+
+
+class Dimension(NamedTuple):
+    """
+    - table: loader table whose committed rows feed the sketches
+    - value_col / item_col: positions in that table's row tuples (the
+      parent params for LinkedBatch tables)
+    - lookup: (table, id column, name column) naming the values, or None
+    - scan: SELECT value, item over the whole table (rebuild)
+    - exact: SELECT name, COUNT(DISTINCT item) ... GROUP BY name
+    """
+    table: str
+    value_col: int
+    item_col: int
+    lookup: object
+    scan: str
+    exact: str
+
+
+DIMENSIONS = {
+    "profession": Dimension(
+        "person_profession", 1, 0, ("profession", "id", "profession_name"),
+        "SELECT profession_id, nconst FROM person_profession;",
+        """
+        SELECT p.profession_name, COUNT(DISTINCT pp.nconst)
+        FROM profession AS p
+        INNER JOIN person_profession AS pp
+            ON p.id = pp.profession_id
+        GROUP BY p.profession_name;
+        """),
+    "genre": Dimension(
+        "title_genre", 1, 0, ("genre", "genre_id", "genre_name"),
+        "SELECT genre_id, tconst FROM title_genre;",
+        """
+        SELECT g.genre_name, COUNT(DISTINCT tg.tconst)
+        FROM genre AS g
+        INNER JOIN title_genre AS tg
+            ON g.genre_id = tg.genre_id
+        GROUP BY g.genre_name;
+        """),
+    "category": Dimension(
+        "title_principals", 3, 2, ("principal_category", "id", "category_name"),
+        "SELECT category_id, nconst FROM title_principals WHERE category_id IS NOT NULL;",
+        """
+        SELECT pc.category_name, COUNT(DISTINCT tp.nconst)
+        FROM principal_category AS pc
+        INNER JOIN title_principals AS tp
+            ON pc.id = tp.category_id
+        GROUP BY pc.category_name;
+        """),
+    "region": Dimension(
+        "title_akas", 3, 0, None,
+        "SELECT region_code, titleId FROM title_akas WHERE region_code IS NOT NULL;",
+        """
+        SELECT region_code, COUNT(DISTINCT titleId)
+        FROM title_akas
+        WHERE region_code IS NOT NULL
+        GROUP BY region_code;
+        """),
+    "language": Dimension(
+        "title_akas", 4, 0, None,
+        "SELECT language_code, titleId FROM title_akas WHERE language_code IS NOT NULL;",
+        """
+        SELECT language_code, COUNT(DISTINCT titleId)
+        FROM title_akas
+        WHERE language_code IS NOT NULL
+        GROUP BY language_code;
+        """),
+}
+
+# loader table -> its dimensions
+SKETCHED_TABLES = {}
+for _name, _dim in DIMENSIONS.items():
+    SKETCHED_TABLES.setdefault(_dim.table, []).append(_name)
+
+
+def hash64(item):
+    """
+    64-bit hash of an item, the same in every process.
+    """
+    return int.from_bytes(hashlib.blake2b(str(item).encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def register_of(h, p: int=HLL_PRECISION):
+    """
+    (register index, rank) of a 64-bit hash: the first p bits pick the
+    register, the rank is 1 + the leading zeros of the other 64 - p.
+    """
+    rest = (h << p) & _MASK64
+    return h >> (64 - p), (64 - rest.bit_length() + 1) if rest else 64 - p + 1
+
+
+def standard_error(p: int=HLL_PRECISION):
+    return 1.04 / math.sqrt(1 << p)
+
+
+class HyperLogLog:
+    """
+    One sketch: 2^p registers, each the highest rank seen.
+    """
+
+    def __init__(self, p: int=HLL_PRECISION, registers=None):
+        self.p = p
+        self.registers = bytearray(registers) if registers is not None else bytearray(1 << p)
+        if len(self.registers) != 1 << p:
+            raise ValueError(f"{len(self.registers)} registers, expected {1 << p}")
+
+    def add(self, item):
+        index, rank = register_of(hash64(item), self.p)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """
+        Make this the sketch of the union of both.
+        """
+        if other.p != self.p:
+            raise ValueError(f"can't merge sketches of precision {self.p} and {other.p}")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(_POW2[r] for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # small range: linear counting of the empty registers
+            return m * math.log(m / zeros)
+        return raw
+
+
+class SketchSet:
+    """
+    Sketches of one load, per (dimension, value id or code). Thread-safe.
+    """
+
+    def __init__(self, p: int=HLL_PRECISION):
+        self._lock = threading.Lock()
+        self.p = p
+        self.sketches = {}
+        self.added = {}
+
+    def add_rows(self, table, rows):
+        """
+        Add committed rows of a loader table (see Dimension).
+        - each distinct item of the batch is hashed once, whatever the
+          number of its rows and dimensions (a title's akas feed region
+          and language)
+        - the highest rank per register is kept per sketch first, so the
+          lock is held for one update per touched register
+        """
+        if not SKETCH_DURING_LOAD or table not in SKETCHED_TABLES:
+            return
+        registers = {}   # item -> (register index, rank)
+        updates = {}     # (dimension, value) -> {register index: rank}
+        counts = {}      # dimension -> items added
+        for dimension in SKETCHED_TABLES[table]:
+            dim = DIMENSIONS[dimension]
+            added = 0
+            for row in rows:
+                value, item = row[dim.value_col], row[dim.item_col]
+                if value is None or item is None:
+                    continue
+                register = registers.get(item)
+                if register is None:
+                    register = registers[item] = register_of(hash64(item), self.p)
+                index, rank = register
+                best = updates.get((dimension, value))
+                if best is None:
+                    best = updates[(dimension, value)] = {}
+                if rank > best.get(index, 0):
+                    best[index] = rank
+                added += 1
+            if added:
+                counts[dimension] = added
+        with self._lock:
+            for key, best in updates.items():
+                sketch = self.sketches.get(key)
+                if sketch is None:
+                    sketch = self.sketches[key] = HyperLogLog(self.p)
+                regs = sketch.registers
+                for index, rank in best.items():
+                    if rank > regs[index]:
+                        regs[index] = rank
+            for dimension, n in counts.items():
+                self.added[dimension] = self.added.get(dimension, 0) + n
+
+    def report(self):
+        with self._lock:
+            return {dimension: {"items": n, "values": sum(1 for d, _ in self.sketches if d == dimension)}
+                    for dimension, n in sorted(self.added.items())}
+
+
+def value_names(cur, dimension):
+    """
+    {value id: name} of a lookup dimension, None for code dimensions.
+    """
+    lookup = DIMENSIONS[dimension].lookup
+    if lookup is None:
+        return None
+    table, id_col, name_col = lookup
+    cur.execute(f"SELECT {id_col}, {name_col} FROM {table};")
+    return dict(cur.fetchall())
+
+
+def _by_name(cur, sketches):
+    """
+    {(dimension, stored value): merged sketch} of {(dimension, value): sketch}.
+    """
+    names = {}
+    merged = {}
+    for (dimension, value), sketch in sketches.items():
+        if dimension not in names:
+            names[dimension] = value_names(cur, dimension)
+        if names[dimension] is not None:
+            value = names[dimension].get(value, str(value))
+        key = (dimension, value)
+        if key in merged:
+            merged[key].merge(sketch)
+        else:
+            merged[key] = HyperLogLog(sketch.p, sketch.registers)
+    return merged
+
+
+def load_sketches(cur, dimension, p: int=HLL_PRECISION, for_update: bool=False):
+    """
+    {value: HyperLogLog} stored for a dimension; for_update locks the rows
+    (and, in InnoDB, the gaps around them) until the transaction ends.
+    """
+    lock = " FOR UPDATE" if for_update else ""
+    cur.execute(f"SELECT value, registers FROM distinct_sketches WHERE dimension = %s{lock};", (dimension,))
+    return {value: HyperLogLog(p, registers) for value, registers in cur.fetchall()}
+
+
+UPSERT_SKETCH_SQL = """
+    INSERT INTO distinct_sketches (dimension, value, registers)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE registers = VALUES(registers);
+"""
+
+
+def merge_sketches(sketches, replace_dimensions=()):
+    """
+    Merge {(dimension, value): sketch} into the stored sketches, in one
+    transaction; the stored sketches of replace_dimensions are dropped
+    first. The stored rows are read FOR UPDATE, so concurrent merges
+    (two loaders finishing together) don't overwrite each other's
+    registers; a merge that deadlocks with another one (both inserting
+    a dimension's first sketches) is replayed by
+    loader_pipeline.run_transaction. Returns the number of sketches
+    written.
+    """
+    # loader_pipeline imports this module (SketchSet)
+    from loader_pipeline import run_transaction
+
+    def merge(cur):
+        for dimension in replace_dimensions:
+            cur.execute("DELETE FROM distinct_sketches WHERE dimension = %s;", (dimension,))
+        merged = _by_name(cur, sketches)
+        stored = {}
+        for dimension in sorted({d for d, _ in merged}):
+            stored[dimension] = load_sketches(cur, dimension, for_update=True)
+        rows = []
+        for (dimension, value), sketch in merged.items():
+            if value in stored[dimension]:
+                sketch.merge(stored[dimension][value])
+            rows.append((dimension, value, bytes(sketch.registers)))
+        if rows:
+            cur.executemany(UPSERT_SKETCH_SQL, rows)
+        return len(rows)
+
+    conn = connect_db()
+    conn.autocommit = False
+    try:
+        return run_transaction(conn, merge, label="distinct_sketches")
+    finally:
+        conn.close()
+
+
+def merge_after_load(sketches):
+    """
+    Merge a load's SketchSet (report["sketches"]) into the stored sketches.
+    """
+    if not SKETCH_DURING_LOAD or not sketches.sketches:
+        return 0
+    start = time.perf_counter()
+    written = merge_sketches(sketches.sketches)
+    print(f"Merged {written} distinct-count sketches in {time.perf_counter() - start:.2f}s")
+    return written
+
+
+def rebuild(dimensions=None):
+    """
+    Recompute the sketches of the given dimensions (default: all) from the
+    tables. Returns {dimension: seconds}.
+    """
+    timings = {}
+    conn = connect_db()
+    cur = conn.cursor()
+    for dimension in dimensions or DIMENSIONS:
+        start = time.perf_counter()
+        dim = DIMENSIONS[dimension]
+        sketches = SketchSet()
+        cur.execute(dim.scan)
+        while True:
+            rows = cur.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for value, item in rows:
+                sketch = sketches.sketches.get((dimension, value))
+                if sketch is None:
+                    sketch = sketches.sketches[(dimension, value)] = HyperLogLog(sketches.p)
+                sketch.add(item)
+        written = merge_sketches(sketches.sketches, replace_dimensions=(dimension,))
+        timings[dimension] = time.perf_counter() - start
+        print(f"Rebuilt {written} {dimension} sketches in {timings[dimension]:.1f}s")
+    cur.close()
+    conn.close()
+    return timings
+
+
+def estimates(cur, dimension):
+    """
+    {value: approximate distinct count} of a dimension.
+    """
+    return {value: round(sketch.estimate()) for value, sketch in load_sketches(cur, dimension).items()}
+
+
+def union_estimate(cur, dimension, values):
+    """
+    Approximate distinct count of the union of several values.
+    """
+    stored = load_sketches(cur, dimension)
+    missing = [v for v in values if v not in stored]
+    if missing:
+        raise KeyError(f"no {dimension} sketch for: {', '.join(missing)}")
+    union = HyperLogLog(stored[values[0]].p)
+    for value in values:
+        union.merge(stored[value])
+    return round(union.estimate())
+
+
+def exact_counts(cur, dimension):
+    cur.execute(DIMENSIONS[dimension].exact)
+    return dict(cur.fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HyperLogLog distinct-count sketches.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_cmd = sub.add_parser("rebuild")
+    rebuild_cmd.add_argument("--only", nargs="+", choices=list(DIMENSIONS))
+    show_cmd = sub.add_parser("show", help="approximate distinct counts of a dimension")
+    show_cmd.add_argument("dimension", choices=list(DIMENSIONS))
+    show_cmd.add_argument("--exact", action="store_true", help="also run the exact COUNT(DISTINCT)")
+    union_cmd = sub.add_parser("union", help="approximate distinct count of several values")
+    union_cmd.add_argument("dimension", choices=list(DIMENSIONS))
+    union_cmd.add_argument("values", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        rebuild(args.only)
+        return
+
+    conn = connect_db()
+    cur = conn.cursor()
+    start = time.perf_counter()
+    if args.command == "union":
+        n = union_estimate(cur, args.dimension, args.values)
+        print(f"~{n} distinct ({time.perf_counter() - start:.3f}s, "
+              f"standard error {standard_error():.2%})")
+    else:
+        approx = estimates(cur, args.dimension)
+        seconds = time.perf_counter() - start
+        exact = exact_counts(cur, args.dimension) if args.exact else {}
+        for value, n in sorted(approx.items(), key=lambda kv: -kv[1]):
+            line = f"{n:12d}  {value}"
+            if value in exact:
+                line += f"  (exact {exact[value]}, {(n - exact[value]) / exact[value]:+.2%})"
+            print(line)
+        print(f"{len(approx)} values in {seconds:.3f}s, standard error {standard_error():.2%}")
+    cur.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
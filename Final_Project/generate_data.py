@@ -0,0 +1,275 @@
+"""
+Synthetic IMDb dataset generator.
+
+Writes the seven IMDb TSV files (same names, columns, \\N markers, sort
+order) for `titles` titles, with cardinalities and NULL rates roughly
+like the real dumps:
+- ~1.3 names, ~4.7 akas, ~8 principals per title, ~14% titles rated
+- 0-3 genres / professions, 0-4 knownForTitles, comma-separated
+- characters as JSON-ish lists ('["Self"]', '["A","B"]')
+- a few accented titles and names, and a small share of dirty rows
+  (dangling ids, bad ordering) so the dead-letter paths get exercised
+
+Output is deterministic for a given (titles, seed): every file has its
+own random stream, so regenerating one file doesn't change the others.
+
+Usage:
+    python generate_data.py /tmp/imdb_small --titles 100000
+"""
+import argparse
+import random
+from pathlib import Path
+
+
+# ---------------- CONFIG ----------------
+
+DEFAULT_TITLES = 100000
+DEFAULT_SEED = 564
+DIRTY_RATE = 0.001       # share of rows with a dangling id / bad ordering
+
+# ----------------------------------------
+
+TITLE_TYPES = [  # (type, weight)
+    ("tvEpisode", 0.60), ("short", 0.09), ("movie", 0.07), ("video", 0.03),
+    ("tvSeries", 0.03), ("tvMovie", 0.015), ("tvMiniSeries", 0.005),
+    ("tvSpecial", 0.004), ("videoGame", 0.004), ("tvShort", 0.002),
+]
+GENRES = [
+    "Drama", "Comedy", "Documentary", "Talk-Show", "Reality-TV", "Romance",
+    "Family", "News", "Animation", "Action", "Crime", "Adventure", "Music",
+    "Game-Show", "Thriller", "Short", "Fantasy", "Horror", "Mystery", "Sport",
+    "History", "Biography", "Sci-Fi", "Musical", "Adult", "War", "Western", "Film-Noir",
+]
+PROFESSIONS = [
+    "actor", "actress", "miscellaneous", "producer", "writer", "director",
+    "camera_department", "cinematographer", "composer", "editor",
+    "art_department", "sound_department", "music_department", "self",
+    "make_up_department", "editorial_department", "animation_department",
+    "costume_department", "visual_effects", "stunts", "casting_director",
+    "production_designer", "special_effects", "location_management",
+    "script_department", "transportation_department", "soundtrack", "archive_footage",
+]
+CATEGORIES = [  # (category, weight)
+    ("actor", 0.26), ("actress", 0.17), ("self", 0.14), ("writer", 0.09),
+    ("director", 0.09), ("producer", 0.08), ("editor", 0.04), ("composer", 0.04),
+    ("cinematographer", 0.04), ("production_designer", 0.02),
+    ("archive_footage", 0.02), ("casting_director", 0.01),
+]
+AKA_TYPES = ["imdbDisplay", "original", "alternative", "working", "festival", "dvd", "tv", "video"]
+AKA_ATTRIBUTES = [
+    "literal English title", "short title", "complete title", "alternative spelling",
+    "new title", "informal title", "promotional title", "reissue title",
+]
+REGIONS = ["US", "GB", "DE", "FR", "IN", "JP", "ES", "IT", "CA", "BR", "MX", "RU", "XWW"]
+LANGUAGES = ["en", "ja", "fr", "de", "es", "hi", "it", "ru", "pt"]
+
+WORDS = [
+    "Night", "City", "Love", "Last", "Dark", "Story", "Man", "Woman", "Life", "World",
+    "Dream", "Time", "Home", "Blood", "Secret", "Road", "King", "Queen", "Summer", "War",
+    "Ghost", "River", "Star", "Heart", "Game", "Party", "Fire", "Winter", "Island", "Shadow",
+    "Amélie", "Ça", "Über", "Señor", "Café", "Niño", "Ångström", "Déjà",
+]
+FIRST_NAMES = [
+    "John", "Mary", "James", "Anna", "Robert", "Maria", "David", "Sarah", "Michael", "Laura",
+    "Pedro", "Sofía", "Jürgen", "Zoë", "François", "Hiro", "Priya", "Chen", "Olga", "Ahmed",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Brown", "Garcia", "Miller", "Davis", "Müller", "Rossi", "Tanaka",
+    "Kumar", "Dubois", "Kowalski", "Nguyen", "Silva", "Ivanov", "O'Brien", "Núñez", "Lee",
+]
+
+NULL = r"\N"
+
+
+def tconst(i):
+    return f"tt{i:07d}"
+
+
+def nconst(i):
+    return f"nm{i:07d}"
+
+
+def _rng(seed, name):
+    # one independent, reproducible stream per file
+    return random.Random(f"{seed}:{name}")
+
+
+def _maybe(r, p_null, value):
+    return NULL if r.random() < p_null else value
+
+
+def _weighted(r, pairs):
+    return r.choices([p[0] for p in pairs], weights=[p[1] for p in pairs])[0]
+
+
+def _title_name(r):
+    return " ".join(r.choice(WORDS) for _ in range(r.randint(1, 4)))
+
+
+def _popular(r, n):
+    # skewed towards low ids, like a few very busy people / titles
+    return 1 + int((n - 1) * r.random() ** 3)
+
+
+def _write(path: Path, header, rows):
+    with path.open("w", encoding="utf-8", newline="") as f:
+        f.write("\t".join(header) + "\n")
+        n = 0
+        for row in rows:
+            f.write("\t".join(str(v) for v in row) + "\n")
+            n += 1
+    print(f"Wrote {n} rows to {path}")
+    return n
+
+
+def title_types_for(titles, seed):
+    """
+    titleType of every title (index 1..titles), shared by all files.
+    """
+    r = _rng(seed, "titleType")
+    return [None] + [_weighted(r, TITLE_TYPES) for _ in range(titles)]
+
+
+# ---------------- one generator per file ----------------
+
+
+def title_basics_rows(titles, seed, types):
+    r = _rng(seed, "title.basics")
+    for i in range(1, titles + 1):
+        title_type = types[i]
+        name = _title_name(r)
+        start = _maybe(r, 0.12, r.randint(1890, 2025))
+        end = NULL
+        if title_type in ("tvSeries", "tvMiniSeries") and start != NULL and r.random() < 0.5:
+            end = min(2025, start + r.randint(0, 15))
+        runtime = _maybe(r, 0.65, r.randint(1, 240))
+        genres = _maybe(r, 0.05, ",".join(sorted(r.sample(GENRES, r.randint(1, 3)))))
+        yield (tconst(i), title_type, name, name if r.random() < 0.9 else _title_name(r),
+               1 if r.random() < 0.02 else 0, start, end, runtime, genres)
+
+
+def name_basics_rows(titles, names, seed):
+    r = _rng(seed, "name.basics")
+    for i in range(1, names + 1):
+        birth = _maybe(r, 0.95, r.randint(1850, 2010))
+        death = NULL if birth == NULL or r.random() < 0.8 else min(2025, birth + r.randint(20, 100))
+        professions = _maybe(r, 0.2, ",".join(r.sample(PROFESSIONS, r.randint(1, 3))))
+        known = [tconst(_popular(r, titles)) for _ in range(r.randint(0, 4))]
+        if known and r.random() < DIRTY_RATE * 5:
+            known.append(tconst(titles + r.randint(1, 1000)))       # dangling
+        yield (nconst(i), f"{r.choice(FIRST_NAMES)} {r.choice(LAST_NAMES)}",
+               birth, death, professions, ",".join(known) or NULL)
+
+
+def title_akas_rows(titles, seed):
+    r = _rng(seed, "title.akas")
+    for i in range(1, titles + 1):
+        for ordering in range(1, min(12, int(r.expovariate(1 / 4.7))) + 1):
+            original = ordering == 1 and r.random() < 0.7
+            types = "original" if original else _maybe(r, 0.7, ",".join(r.sample(AKA_TYPES, r.randint(1, 2))))
+            attributes = _maybe(r, 0.98, r.choice(AKA_ATTRIBUTES))
+            ordering_out = "x" if r.random() < DIRTY_RATE else ordering
+            yield (tconst(i), ordering_out, _title_name(r),
+                   NULL if original else _maybe(r, 0.1, r.choice(REGIONS)),
+                   _maybe(r, 0.6, r.choice(LANGUAGES)), types, attributes, 1 if original else 0)
+
+
+def title_crew_rows(titles, names, seed):
+    r = _rng(seed, "title.crew")
+    for i in range(1, titles + 1):
+        directors = [nconst(_popular(r, names)) for _ in range(r.choice((0, 1, 1, 1, 2)))]
+        writers = [nconst(_popular(r, names)) for _ in range(r.choice((0, 0, 1, 1, 2, 3, 4)))]
+        if writers and r.random() < DIRTY_RATE:
+            writers.append(nconst(names + r.randint(1, 1000)))      # dangling
+        yield tconst(i), ",".join(directors) or NULL, ",".join(writers) or NULL
+
+
+def title_episode_rows(titles, seed, types):
+    r = _rng(seed, "title.episode")
+    series = [i for i in range(1, titles + 1) if types[i] in ("tvSeries", "tvMiniSeries")]
+    for i in range(1, titles + 1):
+        if types[i] != "tvEpisode":
+            continue
+        if series and r.random() > DIRTY_RATE:
+            parent = tconst(r.choice(series))
+        else:
+            parent = tconst(titles + r.randint(1, 1000))                  # dangling
+        yield (tconst(i), parent, _maybe(r, 0.2, r.randint(1, 30)), _maybe(r, 0.2, r.randint(1, 300)))
+
+
+def _characters(r):
+    n = r.choice((1, 1, 1, 1, 2))
+    return "[" + ",".join(f'"{r.choice(FIRST_NAMES)}"' if r.random() < 0.8 else '"Self"'
+                          for _ in range(n)) + "]"
+
+
+def title_principals_rows(titles, names, seed):
+    r = _rng(seed, "title.principals")
+    for i in range(1, titles + 1):
+        for ordering in range(1, min(30, int(r.expovariate(1 / 8))) + 1):
+            category = _weighted(r, CATEGORIES)
+            person = nconst(_popular(r, names))
+            if r.random() < DIRTY_RATE:
+                person = nconst(names + r.randint(1, 1000))              # dangling
+            job = _maybe(r, 0.8, f"{category} {r.choice(('assistant', 'associate', 'executive'))}")
+            characters = _characters(r) if category in ("actor", "actress", "self") else NULL
+            yield tconst(i), ordering, person, category, job, characters
+
+
+def title_ratings_rows(titles, seed):
+    r = _rng(seed, "title.ratings")
+    for i in range(1, titles + 1):
+        if r.random() >= 0.14:
+            continue
+        rating = min(10.0, max(1.0, r.gauss(6.6, 1.3)))
+        votes = int(5 * r.paretovariate(1.1))
+        yield tconst(i), f"{rating:.1f}", votes
+
+
+# ---------------- main ----------------
+
+FILES = {
+    # file name -> header
+    "title.basics.tsv": ("tconst", "titleType", "primaryTitle", "originalTitle", "isAdult",
+                         "startYear", "endYear", "runtimeMinutes", "genres"),
+    "name.basics.tsv": ("nconst", "primaryName", "birthYear", "deathYear",
+                        "primaryProfession", "knownForTitles"),
+    "title.akas.tsv": ("titleId", "ordering", "title", "region", "language",
+                       "types", "attributes", "isOriginalTitle"),
+    "title.crew.tsv": ("tconst", "directors", "writers"),
+    "title.episode.tsv": ("tconst", "parentTconst", "seasonNumber", "episodeNumber"),
+    "title.principals.tsv": ("tconst", "ordering", "nconst", "category", "job", "characters"),
+    "title.ratings.tsv": ("tconst", "averageRating", "numVotes"),
+}
+
+
+def generate(out_dir: Path, titles: int=DEFAULT_TITLES, seed: int=DEFAULT_SEED):
+    """
+    Write all seven files to out_dir; returns {file name: rows written}.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    names = int(titles * 1.3)
+    types = title_types_for(titles, seed)
+    rows = {
+        "title.basics.tsv": title_basics_rows(titles, seed, types),
+        "name.basics.tsv": name_basics_rows(titles, names, seed),
+        "title.akas.tsv": title_akas_rows(titles, seed),
+        "title.crew.tsv": title_crew_rows(titles, names, seed),
+        "title.episode.tsv": title_episode_rows(titles, seed, types),
+        "title.principals.tsv": title_principals_rows(titles, names, seed),
+        "title.ratings.tsv": title_ratings_rows(titles, seed),
+    }
+    return {name: _write(out_dir / name, FILES[name], rows[name]) for name in FILES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic IMDb TSV files.")
+    parser.add_argument("out_dir", type=Path)
+    parser.add_argument("--titles", type=int, default=DEFAULT_TITLES)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    args = parser.parse_args()
+    generate(args.out_dir, args.titles, args.seed)
+
+
+if __name__ == "__main__":
+    main()
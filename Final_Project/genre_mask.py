@@ -0,0 +1,234 @@
+"""
+Genre bitmask of title_basics, for multi-genre filters.
+
+"Drama AND Crime but not Comedy" on the bridge table is one semi-join
+per genre against title_genre. There are only ~28 genres, so the
+title_basics loader also stores them as one integer per title:
+
+    title_basics.genre_mask = OR of 1 << genre.mask_bit
+
+(BIGINT UNSIGNED; mask_bit is a dense per-name bit, see mask_bits.py;
+indexed as idx_tb_genre_mask). A genre predicate is then one bitwise test on the
+row itself (mask_predicate):
+
+    all_of  (genre_mask & m) = m
+    any_of  (genre_mask & m) <> 0
+    none_of (genre_mask & m) = 0
+
+Bitwise tests can't seek in a B-tree; the index makes the filter a scan
+of the narrow (genre_mask, tconst) index instead of the table, and serves
+exact-combination lookups (genre_mask = m).
+
+bridge_predicate() builds the same filter as EXISTS / NOT EXISTS on
+title_genre; "benchmark" times both and checks they agree. Databases
+loaded before the column existed are filled by "backfill".
+
+Usage:
+    python genre_mask.py find --all Drama Crime --none Comedy
+    python genre_mask.py benchmark --runs 5
+    python genre_mask.py backfill
+"""
+import argparse
+import json
+import time
+
+from connect_db import *
+from mask_bits import assign_mask_bits, bits_mask, mask_bits
+from metrics import run_report_path
+from query_benchmark import percentile, timed
+
+
+# ---------------- CONFIG ----------------
+
+# (all_of, any_of, none_of) filters timed by "benchmark"
+BENCHMARK_CASES = {
+    "drama_and_crime": (("Drama", "Crime"), (), ()),
+    "drama_and_crime_not_comedy": (("Drama", "Crime"), (), ("Comedy",)),
+    "horror_or_thriller": ((), ("Horror", "Thriller"), ()),
+    "comedy_romance_not_drama": (("Comedy", "Romance"), (), ("Drama",)),
+    "three_genres": (("Action", "Adventure", "Sci-Fi"), (), ()),
+}
+
+# ----------------------------------------
+
+BACKFILL_SQL = """
+    UPDATE title_basics AS tb
+    INNER JOIN (
+        SELECT tg.tconst, BIT_OR(1 << g.mask_bit) AS mask
+        FROM title_genre AS tg
+        INNER JOIN genre AS g
+            ON g.genre_id = tg.genre_id
+        GROUP BY tg.tconst
+    ) AS m
+        ON tb.tconst = m.tconst
+    SET tb.genre_mask = m.mask;
+"""
+
+
+def _lookup(genre_map, names):
+    unknown = [n for n in names if n not in genre_map]
+    if unknown:
+        raise KeyError(f"unknown genre(s): {', '.join(unknown)}")
+    return [genre_map[n] for n in names]
+
+
+def mask_predicate(genre_bits, all_of=(), any_of=(), none_of=(), alias="tb"):
+    """
+    (SQL condition, params) on title_basics AS alias for the genre filter;
+    genre_bits: genre_name -> mask_bit (genre_bits()).
+    """
+    conditions, params = [], []
+    if all_of:
+        mask = bits_mask(_lookup(genre_bits, all_of))
+        conditions.append(f"({alias}.genre_mask & %s) = %s")
+        params += [mask, mask]
+    if any_of:
+        conditions.append(f"({alias}.genre_mask & %s) <> 0")
+        params.append(bits_mask(_lookup(genre_bits, any_of)))
+    if none_of:
+        conditions.append(f"({alias}.genre_mask & %s) = 0")
+        params.append(bits_mask(_lookup(genre_bits, none_of)))
+    return " AND ".join(conditions) or "1 = 1", params
+
+
+def bridge_predicate(genre_map, all_of=(), any_of=(), none_of=(), alias="tb"):
+    """
+    The same filter as semi-joins against title_genre;
+    genre_map: genre_name -> genre_id (genre_ids()).
+    """
+    def exists(ids):
+        return (f"EXISTS (SELECT 1 FROM title_genre AS tg WHERE tg.tconst = {alias}.tconst "
+                f"AND tg.genre_id IN ({', '.join(['%s'] * len(ids))}))")
+
+    conditions, params = [], []
+    for genre_id in _lookup(genre_map, all_of):
+        conditions.append(exists([genre_id]))
+        params.append(genre_id)
+    if any_of:
+        ids = _lookup(genre_map, any_of)
+        conditions.append(exists(ids))
+        params += ids
+    if none_of:
+        ids = _lookup(genre_map, none_of)
+        conditions.append("NOT " + exists(ids))
+        params += ids
+    return " AND ".join(conditions) or "1 = 1", params
+
+
+def genre_ids(cur):
+    cur.execute("SELECT genre_name, genre_id FROM genre;")
+    return dict(cur.fetchall())
+
+
+def genre_bits(cur):
+    return mask_bits(cur, "genre")
+
+
+def find_titles(cur, all_of=(), any_of=(), none_of=(), limit=20):
+    """
+    (tconst, primaryTitle, startYear) of titles matching the genre filter.
+    """
+    where, params = mask_predicate(genre_bits(cur), all_of, any_of, none_of)
+    cur.execute(f"""
+        SELECT tb.tconst, tb.primaryTitle, tb.startYear
+        FROM title_basics AS tb
+        WHERE {where}
+        ORDER BY tb.tconst
+        LIMIT %s;
+    """, (*params, limit))
+    return cur.fetchall()
+
+
+def backfill():
+    """
+    Set genre_mask of every title from title_genre (giving genres without
+    a mask_bit one first).
+    """
+    start = time.perf_counter()
+    conn = connect_db()
+    conn.autocommit = False
+    cur = conn.cursor()
+    assign_mask_bits(cur, "genre")
+    cur.execute(BACKFILL_SQL)
+    conn.commit()
+    cur.close()
+    conn.close()
+    print(f"Backfilled title_basics.genre_mask in {time.perf_counter() - start:.1f}s")
+
+
+def _interpolate(sql, params):
+    # literal SQL for timed(), which runs statements without parameters
+    return sql.replace("%s", "{}").format(*(int(p) for p in params))
+
+
+def benchmark(cases=BENCHMARK_CASES, runs: int=5):
+    """
+    COUNT(*) of each filter through the bitmask and through the bridge
+    table, runs times each; returns (and saves) p50 / p95 per variant.
+    """
+    conn = connect_db()
+    cur = conn.cursor()
+    maps = {"bitmask": genre_bits(cur), "bridge": genre_ids(cur)}
+    report = {"runs": runs, "cases": {}}
+    for name, (all_of, any_of, none_of) in cases.items():
+        missing = [g for g in (*all_of, *any_of, *none_of) if g not in maps["bitmask"]]
+        if missing:
+            print(f"  {name}: skipped, no genre {', '.join(missing)}")
+            continue
+        case = {}
+        counts = {}
+        for variant, predicate in (("bitmask", mask_predicate), ("bridge", bridge_predicate)):
+            where, params = predicate(maps[variant], all_of, any_of, none_of)
+            sql = _interpolate(f"SELECT COUNT(*) FROM title_basics AS tb WHERE {where}", params)
+            cur.execute(sql)
+            counts[variant] = cur.fetchone()[0]
+            latencies = sorted(timed(cur, sql)[0] for _ in range(runs))
+            case[variant] = {"p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+                             "p95_ms": round(percentile(latencies, 0.95) * 1000, 3)}
+        if counts["bitmask"] != counts["bridge"]:
+            raise AssertionError(f"{name}: bitmask counts {counts['bitmask']} titles, "
+                                 f"bridge {counts['bridge']} (run backfill?)")
+        case["titles"] = counts["bitmask"]
+        case["speedup"] = round(case["bridge"]["p50_ms"] / case["bitmask"]["p50_ms"], 2) \
+            if case["bitmask"]["p50_ms"] else None
+        report["cases"][name] = case
+        print(f"  {name}: {case['titles']} titles | bitmask p50 {case['bitmask']['p50_ms']:.1f} ms "
+              f"| bridge p50 {case['bridge']['p50_ms']:.1f} ms | {case['speedup']}x")
+    cur.close()
+    conn.close()
+
+    path = run_report_path("genre_mask_benchmark")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Benchmark report written to {path}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genre bitmask filters on title_basics.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    find_cmd = sub.add_parser("find", help="titles matching a genre filter")
+    find_cmd.add_argument("--all", nargs="+", default=(), metavar="GENRE")
+    find_cmd.add_argument("--any", nargs="+", default=(), metavar="GENRE")
+    find_cmd.add_argument("--none", nargs="+", default=(), metavar="GENRE")
+    find_cmd.add_argument("--limit", type=int, default=20)
+    bench_cmd = sub.add_parser("benchmark", help="bitmask vs. title_genre semi-joins")
+    bench_cmd.add_argument("--runs", type=int, default=5)
+    sub.add_parser("backfill", help="fill genre_mask from title_genre")
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        backfill()
+    elif args.command == "benchmark":
+        benchmark(runs=args.runs)
+    else:
+        conn = connect_db()
+        cur = conn.cursor()
+        for tconst, title, year in find_titles(cur, args.all, args.any, args.none, args.limit):
+            print(f"{tconst}  {year}  {title}")
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
 from connect_db import *
 import csv
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from dead_letter import (DeadLetterWriter, NO_DEAD_LETTER, KNOWN_FOR_NOT_FOUND, MISSING_KEY,
+                         UNKNOWN_PROFESSION)
+from distinct_sketches import merge_after_load as merge_sketches
+from metrics import write_run_report
+from summaries import refresh_after_load
+from loader_pipeline import Batch, TransactionStats, load_chunks, print_report, run_steps
 
 
 # ---------------- CONFIG ----------------
@@ -103,11 +108,94 @@ def load_existing_title_ids():
 
 # -------- STEP 3: load name_basics, person_profession, name_known_for --------
 
+INSERT_NAME_BASICS_SQL = """
+    INSERT INTO name_basics (
+        nconst,
+        primaryName,
+        birthYear,
+        deathYear
+    ) VALUES (%s, %s, %s, %s);
+"""
+
+INSERT_PERSON_PROFESSION_SQL = """
+    INSERT INTO person_profession (nconst, profession_id)
+    VALUES (%s, %s);
+"""
+
+INSERT_NAME_KNOWN_FOR_SQL = """
+    INSERT INTO name_known_for (nconst, tconst, position)
+    VALUES (%s, %s, %s);
+"""
+
+
+def build_name_basics_steps(rows, profession_map, existing_title_ids, dead_letter=NO_DEAD_LETTER):
+    """
+    Row builder for name.basics.tsv:
+    turn a list of CSV rows (dicts) into the batches for
+    name_basics (parent), person_profession and name_known_for (children).
+    Dropped rows / values go to dead_letter (see dead_letter.py).
+    """
+    name_basics_batch = []
+    person_prof_batch = []
+    known_for_batch = []
+
+    for row in rows:
+        nconst = row.get("nconst")
+        if not nconst:
+            dead_letter.reject(MISSING_KEY, row)
+            continue
+
+        primaryName = None if row.get("primaryName") in (None, r"\N") else row["primaryName"]
+        birthYear = parse_int(row.get("birthYear"))
+        deathYear = parse_int(row.get("deathYear"))
+
+        # Parent row: name_basics
+        name_basics_batch.append((nconst, primaryName, birthYear, deathYear))
+
+        # Child rows: person_profession (dedupe professions per person)
+        prof_str = row.get("primaryProfession")
+        if prof_str and prof_str != r"\N":
+            prof_ids_for_person = set()
+            for part in prof_str.split(","):
+                p = part.strip()
+                if not p:
+                    continue
+                prof_id = profession_map.get(p)
+                if prof_id is not None:
+                    prof_ids_for_person.add(prof_id)
+                else:
+                    dead_letter.reject(UNKNOWN_PROFESSION, row, p)
+            for prof_id in prof_ids_for_person:
+                person_prof_batch.append((nconst, prof_id))
+
+        # Child rows: name_known_for (dedupe titles per person)
+        kft_str = row.get("knownForTitles")
+        if kft_str and kft_str != r"\N":
+            titles = [t.strip() for t in kft_str.split(",") if t.strip()]
+            seen_titles = set()
+            pos = 0
+            for tconst_known in titles:
+                if tconst_known in seen_titles:
+                    continue
+                seen_titles.add(tconst_known)
+                if tconst_known in existing_title_ids:
+                    pos += 1
+                    known_for_batch.append((nconst, tconst_known, pos))
+                else:
+                    dead_letter.reject(KNOWN_FOR_NOT_FOUND, row, tconst_known)
+
+    return [
+        Batch(INSERT_NAME_BASICS_SQL, name_basics_batch),
+        Batch(INSERT_PERSON_PROFESSION_SQL, person_prof_batch),
+        Batch(INSERT_NAME_KNOWN_FOR_SQL, known_for_batch),
+    ]
+
+
 def load_name_basics_and_bridges(
     tsv_path: Path,
     profession_map,
     existing_title_ids,
-    max_workers: int = 5,
+    max_workers=None,
     chunk_size: int = 10000,
 ):
     """
@@ -118,6 +206,8 @@ def load_name_basics_and_bridges(
         * name_basics          (parent)
         * person_profession    (child of name_basics)
         * name_known_for       (child of name_basics and title_basics)
+    - A chunk is one transaction; it is replayed if it hits a deadlock or
+      lock wait timeout.
     Parameters
     ----------
     tsv_path : Path
@@ -126,148 +216,53 @@ def load_name_basics_and_bridges(
         Maps profession_name -> profession_id (from 'profession' table)
     existing_title_ids : set
         Set of existing tconst values in title_basics (for FK safety)
-    max_workers : int
+    max_workers : int or None
         Number of worker threads to use
+        (None: autoscale on DB throughput, see autoscale.py)
     chunk_size : int
         Number of TSV rows per chunk submitted to a worker
     """
-
+    txn_stats = TransactionStats()
+    dead_letter = DeadLetterWriter("name_basics")
 
     def process_chunk(rows):
         """
         Process a list of CSV rows (dicts) in a single thread:
-        - Open a new DB connection
         - Build batches for:
             * name_basics
             * person_profession
             * name_known_for
+        - Open a new DB connection
         - Insert parents first (name_basics), then children
         """
+        with txn_stats.metrics.timer("parse_seconds"):
+            steps = build_name_basics_steps(rows, profession_map, existing_title_ids, dead_letter)
 
-        insert_name_basics_sql = """
-            INSERT INTO name_basics (
-                nconst,
-                primaryName,
-                birthYear,
-                deathYear
-            ) VALUES (%s, %s, %s, %s);
-        """
-
-        insert_person_profession_sql = """
-            INSERT INTO person_profession (nconst, profession_id)
-            VALUES (%s, %s);
-        """
-
-        insert_name_known_for_sql = """
-            INSERT INTO name_known_for (nconst, tconst, position)
-            VALUES (%s, %s, %s);
-        """
-
-        name_basics_batch = []
-        person_prof_batch = []
-        known_for_batch = []
-
-        for row in rows:
-            nconst = row.get("nconst")
-            if not nconst:
-                continue
-
-            primaryName = None if row.get("primaryName") in (None, r"\N") else row["primaryName"]
-            birthYear = parse_int(row.get("birthYear"))
-            deathYear = parse_int(row.get("deathYear"))
-
-            # Parent row: name_basics
-            name_basics_batch.append((nconst, primaryName, birthYear, deathYear))
-
-            # Child rows: person_profession (dedupe professions per person)
-            prof_str = row.get("primaryProfession")
-            if prof_str and prof_str != r"\N":
-                prof_ids_for_person = set()
-                for part in prof_str.split(","):
-                    p = part.strip()
-                    if not p:
-                        continue
-                    prof_id = profession_map.get(p)
-                    if prof_id is not None:
-                        prof_ids_for_person.add(prof_id)
-                for prof_id in prof_ids_for_person:
-                    person_prof_batch.append((nconst, prof_id))
-
-            # Child rows: name_known_for (dedupe titles per person)
-            kft_str = row.get("knownForTitles")
-            if kft_str and kft_str != r"\N":
-                titles = [t.strip() for t in kft_str.split(",") if t.strip()]
-                seen_titles = set()
-                pos = 0
-                for tconst_known in titles:
-                    if tconst_known in seen_titles:
-                        continue
-                    seen_titles.add(tconst_known)
-                    if tconst_known in existing_title_ids:
-                        pos += 1
-                        known_for_batch.append((nconst, tconst_known, pos))
-
+        conn = connect_db()
+        conn.autocommit = False
         try:
-
-            conn = connect_db()
-            conn.autocommit = False
-            cur = conn.cursor()
-            # Insert parents first
-            if name_basics_batch:
-                cur.executemany(insert_name_basics_sql, name_basics_batch)
-
-            # Then insert children
-            if person_prof_batch:
-                cur.executemany(insert_person_profession_sql, person_prof_batch)
-
-            if known_for_batch:
-                cur.executemany(insert_name_known_for_sql, known_for_batch)
-
-            conn.commit()
-        except Exception:
-            conn.rollback()
-            raise
+            run_steps(conn, steps, txn_stats, "name_basics")
         finally:
-            cur.close()
             conn.close()
 
-        return len(name_basics_batch), len(person_prof_batch), len(known_for_batch)
+        return len(steps[0].rows), len(steps[1].rows), len(steps[2].rows)
 
     # -------- Main body: read TSV, build chunks, submit to thread pool --------
-    total_names = 0
-    total_prof_links = 0
-    total_known_for_links = 0
-    futures = []
-
-    with tsv_path.open("r", encoding="utf-8") as f, ThreadPoolExecutor(max_workers=max_workers) as executor:
-        reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
-        current_chunk = []
-        for i, row in enumerate(reader, start=1):
-
-            current_chunk.append(row)
-
-            if len(current_chunk) >= chunk_size:
-                futures.append(executor.submit(process_chunk, current_chunk))
-                current_chunk = []
-
-            if i % 100000 == 0:
-                print(f"Queued {i} rows from name.basics.tsv")
-
-        # Submit any remaining rows
-        if current_chunk:
-            futures.append(executor.submit(process_chunk, current_chunk))
-
-        # Collect results as chunks complete
-        for fut in as_completed(futures):
-            n_names, n_prof, n_known_for = fut.result()
-            total_names += n_names
-            total_prof_links += n_prof
-            total_known_for_links += n_known_for
+    with dead_letter:
+        results, report = load_chunks(tsv_path, process_chunk, "name_basics",
+                                      max_workers, chunk_size, txn_stats)
+    total_names = sum(r[0] for r in results)
+    total_prof_links = sum(r[1] for r in results)
+    total_known_for_links = sum(r[2] for r in results)
 
     print("Finished loading name_basics, person_profession, and name_known_for via threads.")
     print(f"Total name_basics rows inserted: {total_names}")
     print(f"Total person_profession rows inserted: {total_prof_links}")
     print(f"Total name_known_for rows inserted: {total_known_for_links}")
+    report["dead_letter"] = dead_letter.report()
+    print_report(report)
+    write_run_report(report)
+    return report
 
 
 
@@ -291,7 +286,15 @@ def main():
     print(f"Loaded {len(existing_title_ids)} existing title IDs")
 
     print("Pass 2: loading name_basics, person_profession, and name_known_for...")
-    load_name_basics_and_bridges(NAME_BASICS_TSV, profession_map, existing_title_ids)
+    report = load_name_basics_and_bridges(NAME_BASICS_TSV, profession_map, existing_title_ids)
+    refresh_after_load(("name_basics", "person_profession", "name_known_for"), report["touched"])
+    # name_autocomplete needs NumPy; only the post-load hook uses it
+    from name_autocomplete import build_after_load as build_name_index
+    build_name_index()
+    # person_roles needs NumPy (RoleBitmaps); only the post-load hook uses it
+    from person_roles import build_after_load as build_person_roles
+    build_person_roles(("name_basics", "person_profession", "name_known_for"), report["touched"])
+    merge_sketches(report["sketches"])
 
     print("All done for name.basics.tsv")
 
@@ -1,13 +1,20 @@
 from connect_db import *
 import csv
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from merge_join import SortedIdStream, title_id_check
+from dead_letter import (DeadLetterWriter, NO_DEAD_LETTER, BAD_ORDERING, MISSING_KEY,
+                         TITLE_NOT_FOUND, UNKNOWN_AKA_ATTRIBUTE, UNKNOWN_AKA_TYPE)
+from distinct_sketches import merge_after_load as merge_sketches
+from metrics import write_run_report
+from loader_pipeline import LinkedBatch, TransactionStats, load_chunks, print_report, run_steps
 
 
 # ---------------- CONFIG ----------------
 
 TITLE_AKAS_TSV = Path("C:\\My_Programs\\Temp\\Data\\title.akas.tsv")  # update as needed
 BATCH_SIZE = 2000
+TITLE_ID_CHECK = "merge"   # "merge": merge-join title_basics ids with the sorted TSV (merge_join.py)
+                           # "set":   load every tconst into memory first
 
 # ----------------------------------------
 
@@ -140,12 +147,120 @@ def load_existing_title_ids():
 # -------- STEP 3: load title_akas and bridge tables --------
 
 
+INSERT_TITLE_AKAS_SQL = """
+    INSERT INTO title_akas (
+        titleId,
+        ordering,
+        title,
+        region_code,
+        language_code,
+        isOriginalTitle
+    ) VALUES (%s, %s, %s, %s, %s, %s);
+"""
+
+INSERT_TITLE_AKA_TYPE_SQL = """
+    INSERT INTO title_aka_type (
+        title_akas_id,
+        title_types_id
+    ) VALUES (%s, %s);
+"""
+
+INSERT_TITLE_AKA_ATTR_SQL = """
+    INSERT INTO title_aka_attribute (
+        title_akas_id,
+        title_attribute_id
+    ) VALUES (%s, %s);
+"""
+
+
+def build_title_akas_steps(rows, aka_type_map, aka_attr_map, existing_title_ids,
+                           dead_letter=NO_DEAD_LETTER):
+    """
+    Row builder for title.akas.tsv:
+    turn a list of CSV rows (dicts) into one LinkedBatch:
+      parent   title_akas row
+      children title_aka_type / title_aka_attribute rows (aka id added on insert)
+    Dropped rows / values go to dead_letter (see dead_letter.py).
+    """
+    items = []
+
+    for row in rows:
+        titleId = row.get("titleId")
+        if not titleId:
+            dead_letter.reject(MISSING_KEY, row)
+            continue
+
+        # Only keep akas for titles that exist in title_basics
+        if titleId not in existing_title_ids:
+            dead_letter.reject(TITLE_NOT_FOUND, row, titleId)
+            continue
+
+        ordering_raw = row.get("ordering")
+        try:
+            ordering = int(ordering_raw) if ordering_raw not in (None, "", r"\N") else None
+        except ValueError:
+            ordering = None
+
+        if ordering is None:
+            # ordering is logically important; skip malformed rows
+            dead_letter.reject(BAD_ORDERING, row, ordering_raw)
+            continue
+
+        title = None if row.get("title") in (None, r"\N") else row["title"]
+        region_code = None if row.get("region") in (None, r"\N") else row["region"]
+        language_code = None if row.get("language") in (None, r"\N") else row["language"]
+        isOriginalTitle = parse_bool_01(row.get("isOriginalTitle"))
+
+        # types -> title_aka_type
+        type_rows = []
+        types_str = row.get("types")
+        if types_str and types_str != r"\N":
+            for part in types_str.split(","):
+                t = part.strip()
+                if not t:
+                    continue
+                type_id = aka_type_map.get(t)
+                if type_id is not None:
+                    type_rows.append((type_id,))
+                else:
+                    dead_letter.reject(UNKNOWN_AKA_TYPE, row, t)
+
+        # attributes -> title_aka_attribute
+        attr_rows = []
+        attrs_str = row.get("attributes")
+        if attrs_str and attrs_str != r"\N":
+            for part in attrs_str.split(","):
+                a = part.strip()
+                if not a:
+                    continue
+                attr_id = aka_attr_map.get(a)
+                if attr_id is not None:
+                    attr_rows.append((attr_id,))
+                else:
+                    dead_letter.reject(UNKNOWN_AKA_ATTRIBUTE, row, a)
+
+        items.append(
+            (
+                (titleId, ordering, title, region_code, language_code, isOriginalTitle),
+                (type_rows, attr_rows),
+            )
+        )
+
+    return [
+        LinkedBatch(
+            INSERT_TITLE_AKAS_SQL,
+            (INSERT_TITLE_AKA_TYPE_SQL, INSERT_TITLE_AKA_ATTR_SQL),
+            items,
+        )
+    ]
+
+
 def load_title_akas_and_bridges(
         tsv_path: Path,
         aka_type_map,
         aka_attr_map,
         existing_title_ids,
-        max_workers: int = 4,
+        max_workers=None,
         chunk_size: int = 10000,
 ):
     """
@@ -158,168 +273,53 @@ def load_title_akas_and_bridges(
         2) Insert rows into:
              * title_aka_type(id, aka_type_id)
              * title_aka_attribute(id, aka_attribute_id)
+    - A chunk is one transaction; it is replayed if it hits a deadlock or
+      lock wait timeout.
 
     Assumptions:
     - title_akas has: id INT AUTO_INCREMENT PRIMARY KEY, plus the other fields.
     - title_aka_type and title_aka_attribute use id as FK.
-    - existing_title_ids is a set of valid tconst values from title_basics (FK safety).
-    - Global constants BATCH_SIZE and MAX_ROWS may be defined elsewhere.
+    - existing_title_ids is a set of valid tconst values from title_basics (FK safety),
+      or a merge_join.SortedIdStream to check titleId by merge join instead.
     """
+    txn_stats = TransactionStats()
+    dead_letter = DeadLetterWriter("title_akas")
+    row_filter, title_ids = title_id_check(existing_title_ids, "titleId", dead_letter)
 
     def process_chunk(rows):
         """
         Process a list of CSV rows (dicts) in a single thread:
+        - Build the title_akas rows and their type / attribute children
         - Open a new DB connection
         - Insert into title_akas row-by-row (to capture aka_id)
         - Batch insert into title_aka_type and title_aka_attribute using aka_id
         """
+        with txn_stats.metrics.timer("parse_seconds"):
+            steps = build_title_akas_steps(rows, aka_type_map, aka_attr_map, title_ids, dead_letter)
+
         conn = connect_db()
         conn.autocommit = False
-        cur = conn.cursor()
-
-        insert_title_akas_sql = """
-            INSERT INTO title_akas (
-                titleId,
-                ordering,
-                title,
-                region_code,
-                language_code,
-                isOriginalTitle
-            ) VALUES (%s, %s, %s, %s, %s, %s);
-        """
-
-        insert_title_aka_type_sql = """
-            INSERT INTO title_aka_type (
-                title_akas_id,
-                title_types_id
-            ) VALUES (%s, %s);
-        """
-
-        insert_title_aka_attr_sql = """
-            INSERT INTO title_aka_attribute (
-                title_akas_id,
-                title_attribute_id
-            ) VALUES (%s, %s);
-        """
-
-        aka_type_batch = []
-        aka_attr_batch = []
-        aka_count = 0
-
         try:
-            for row in rows:
-                titleId = row.get("titleId")
-                if not titleId:
-                    continue
-
-                # Only keep akas for titles that exist in title_basics
-                if titleId not in existing_title_ids:
-                    continue
-
-                ordering_raw = row.get("ordering")
-                try:
-                    ordering = int(ordering_raw) if ordering_raw not in (None, "", r"\N") else None
-                except ValueError:
-                    ordering = None
-
-                if ordering is None:
-                    # ordering is logically important; skip malformed rows
-                    continue
-
-                title = None if row.get("title") in (None, r"\N") else row["title"]
-                region_code = None if row.get("region") in (None, r"\N") else row["region"]
-                language_code = None if row.get("language") in (None, r"\N") else row["language"]
-                isOriginalTitle = parse_bool_01(row.get("isOriginalTitle"))
-
-                # ---- 1) Insert into core table title_akas; get aka_id ----
-                cur.execute(
-                    insert_title_akas_sql,
-                    (titleId, ordering, title, region_code, language_code, isOriginalTitle),
-                )
-                aka_id = cur.lastrowid
-                aka_count += 1
-
-                # ---- 2) Build bridge rows using aka_id as FK ----
-
-                # types -> title_aka_type
-                types_str = row.get("types")
-                if types_str and types_str != r"\N":
-                    for part in types_str.split(","):
-                        t = part.strip()
-                        if not t:
-                            continue
-                        type_id = aka_type_map.get(t)
-                        if type_id is not None:
-                            aka_type_batch.append((aka_id, type_id))
-
-                # attributes -> title_aka_attribute
-                attrs_str = row.get("attributes")
-                if attrs_str and attrs_str != r"\N":
-                    for part in attrs_str.split(","):
-                        a = part.strip()
-                        if not a:
-                            continue
-                        attr_id = aka_attr_map.get(a)
-                        if attr_id is not None:
-                            aka_attr_batch.append((aka_id, attr_id))
-
-                # Optionally flush bridge batches inside the chunk if they get big
-                if len(aka_type_batch) >= BATCH_SIZE or len(aka_attr_batch) >= BATCH_SIZE:
-                    cur.executemany(insert_title_aka_type_sql, aka_type_batch)
-                    aka_type_batch.clear()
-
-                    cur.executemany(insert_title_aka_attr_sql, aka_attr_batch)
-                    aka_attr_batch.clear()
-
-            # Final flush for this chunk
-            if aka_type_batch:
-                cur.executemany(insert_title_aka_type_sql, aka_type_batch)
-                aka_type_batch.clear()
-
-            if aka_attr_batch:
-                cur.executemany(insert_title_aka_attr_sql, aka_attr_batch)
-                aka_attr_batch.clear()
-
-            conn.commit()
-        except Exception:
-            conn.rollback()
-            raise
+            run_steps(conn, steps, txn_stats, "title_akas")
         finally:
-            cur.close()
             conn.close()
 
-        return aka_count
+        return len(steps[0].items)
 
     # -------- Main body: read TSV, build chunks, submit to thread pool --------
-    total_akas = 0
-    futures = []
-
-    with tsv_path.open("r", encoding="utf-8") as f, ThreadPoolExecutor(max_workers=max_workers) as executor:
-        reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
-        current_chunk = []
-
-        for i, row in enumerate(reader, start=1):
-
-            current_chunk.append(row)
-
-            if len(current_chunk) >= chunk_size:
-                futures.append(executor.submit(process_chunk, current_chunk))
-                current_chunk = []
-
-            if i % 100000 == 0:
-                print(f"Queued {i} rows from title.akas.tsv")
-
-        # Submit remaining rows in the final chunk
-        if current_chunk:
-            futures.append(executor.submit(process_chunk, current_chunk))
-
-        # Collect results from worker threads
-        for fut in as_completed(futures):
-            aka_count = fut.result()
-            total_akas += aka_count
+    with dead_letter:
+        results, report = load_chunks(tsv_path, process_chunk, "title_akas",
+                                      max_workers, chunk_size, txn_stats, row_filter)
+    total_akas = sum(results)
 
     print("Finished loading title_akas (aka_id PK), title_aka_type, and title_aka_attribute via threads.")
     print(f"Total title_akas rows inserted: {total_akas}")
+    if row_filter is not None:
+        report["merge_join"] = existing_title_ids.report()
+    report["dead_letter"] = dead_letter.report()
+    print_report(report)
+    write_run_report(report)
+    return report
 
 
 # ---------------- MAIN ----------------
@@ -339,17 +339,29 @@ def main():
     aka_type_map, aka_attr_map = lookup_types_attributes()
     print("Lookup tables loaded.")
 
-    print("Loading existing title IDs from title_basics for FK safety...")
-    existing_title_ids = load_existing_title_ids()
-    print(f"Loaded {len(existing_title_ids)} existing title IDs")
+    if TITLE_ID_CHECK == "merge":
+        print("Streaming title IDs from title_basics for FK safety (merge join)...")
+        existing_title_ids = SortedIdStream("title_basics", "tconst")
+    else:
+        print("Loading existing title IDs from title_basics for FK safety...")
+        existing_title_ids = load_existing_title_ids()
+        print(f"Loaded {len(existing_title_ids)} existing title IDs")
 
     print("Pass 2: loading title_akas and bridge tables...")
-    load_title_akas_and_bridges(
-        TITLE_AKAS_TSV,
-        aka_type_map,
-        aka_attr_map,
-        existing_title_ids,
-    )
+    try:
+        report = load_title_akas_and_bridges(
+            TITLE_AKAS_TSV,
+            aka_type_map,
+            aka_attr_map,
+            existing_title_ids,
+        )
+    finally:
+        if isinstance(existing_title_ids, SortedIdStream):
+            existing_title_ids.close()
+    # title_search needs NumPy; only the post-load hook uses it
+    from title_search import update_after_load as update_search_index
+    update_search_index(report["touched"])
+    merge_sketches(report["sketches"])
 
     print("All done for title.akas.tsv")
 
@@ -4,7 +4,14 @@ Pre-process data and insert the normalized data from title_basics
 import csv
 from pathlib import Path
 from connect_db import *
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from dead_letter import (DeadLetterWriter, NO_DEAD_LETTER, MISSING_KEY, UNKNOWN_GENRE,
+                         UNKNOWN_TITLE_TYPE)
+from distinct_sketches import merge_after_load as merge_sketches
+from mask_bits import assign_mask_bits, bits_mask, mask_bits
+from metrics import write_run_report
+from summaries import refresh_after_load
+from title_summary import sync_after_load as sync_title_summary
+from loader_pipeline import Batch, TransactionStats, load_chunks, print_report, run_steps
 
 TITLE_BASICS_TSV = Path("C:\\My_Programs\\Temp\\Data\\title.basics.tsv")
 BATCH_SIZE = 2000
@@ -89,6 +96,7 @@ def insert(title_types, genres):
 def lookups():
     """
     look up genres and title_types from tables,
+    giving new genres their genre_mask bit first (mask_bits.py)
     """
     conn = connect_db()
     conn.autocommit = False
@@ -106,15 +114,114 @@ def lookups():
     for g_id, g_name in cur.fetchall():
         genre_map[g_name] = g_id
 
+    assign_mask_bits(cur, "genre")
+    genre_bits = mask_bits(cur, "genre")
+    conn.commit()
+
     cur.close()
     conn.close()
-    return title_type_map, genre_map
+    return title_type_map, genre_map, genre_bits
+
+
+INSERT_TITLE_BASICS_SQL = """
+    INSERT IGNORE INTO title_basics (
+        tconst,
+        primaryTitle,
+        originalTitle,
+        isAdult,
+        startYear,
+        endYear,
+        runtimeMinutes,
+        title_type_id,
+        genre_mask
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
+"""
+
+INSERT_TITLE_GENRE_SQL = """
+    INSERT IGNORE INTO title_genre (tconst, genre_id)
+     VALUES (%s, %s);
+"""
+
+
+def build_title_basics_steps(rows, title_type_map, genre_map, genre_bits, dead_letter=NO_DEAD_LETTER):
+    """
+    Row builder for title.basics.tsv:
+    turn a list of CSV rows (dicts) into the batches for
+    title_basics (parent) and title_genre (child), in insert order.
+    title_basics.genre_mask gets the genre_bits of the genres (genre_mask.py).
+    Dropped rows / values go to dead_letter (see dead_letter.py).
+    """
+    title_basics_batch = []
+    title_genre_batch = []
+
+    for row in rows:
+        tconst = row.get("tconst")
+        if not tconst:
+            dead_letter.reject(MISSING_KEY, row)
+            continue
+
+        primaryTitle = None if row.get("primaryTitle") in (None, r"\N") else row["primaryTitle"]
+        originalTitle = None if row.get("originalTitle") in (None, r"\N") else row["originalTitle"]
+        isAdult = parse_bool_01(row.get("isAdult"))
+
+        # Use range-aware parsing if you implemented it
+        startYear = parse_int(row.get("startYear"))
+        endYear = parse_int(row.get("endYear"))
+        runtimeMinutes = parse_int(row.get("runtimeMinutes"))
+
+        # Map titleType text -> title_type_id
+        titleType_raw = row.get("titleType")
+        title_type_id = None
+        if titleType_raw and titleType_raw != r"\N":
+            tt_clean = titleType_raw.strip()
+            if tt_clean:
+                title_type_id = title_type_map.get(tt_clean)
+                if title_type_id is None:
+                    dead_letter.reject(UNKNOWN_TITLE_TYPE, row, tt_clean)
+
+        # Children rows (genres), and their bits for the parent's genre_mask
+        genre_ids = []
+        bits = []
+        genres_raw = row.get("genres")
+        if genres_raw and genres_raw != r"\N":
+            for part in genres_raw.split(","):
+                g_clean = part.strip()
+                if not g_clean or g_clean == r"\N":
+                    continue
+                genre_id = genre_map.get(g_clean)
+                if genre_id is not None:
+                    genre_ids.append(genre_id)
+                    bits.append(genre_bits[g_clean])
+                else:
+                    dead_letter.reject(UNKNOWN_GENRE, row, g_clean)
+
+        # Parent row
+        title_basics_batch.append(
+            (
+                tconst,
+                primaryTitle,
+                originalTitle,
+                isAdult,
+                startYear,
+                endYear,
+                runtimeMinutes,
+                title_type_id,
+                bits_mask(bits),
+            )
+        )
+        title_genre_batch.extend((tconst, genre_id) for genre_id in genre_ids)
+
+    return [
+        Batch(INSERT_TITLE_BASICS_SQL, title_basics_batch),
+        Batch(INSERT_TITLE_GENRE_SQL, title_genre_batch),
+    ]
 
 
 def load_title_basics_and_title_genre(tsv_path: Path,
                                       title_type_map,
                                       genre_map,
-                                      max_workers: int=5,
+                                      genre_bits,
+                                      max_workers=None,
                                       chunk_size: int=10000
                                       ):
 
@@ -123,6 +230,8 @@ def load_title_basics_and_title_genre(tsv_path: Path,
     - Splits the file into chunks of rows.
     - Each chunk is processed in a separate thread with its own DB connection.
     - For each chunk, inserts into title_basics (parent) and then title_genre (child).
+    - A chunk is one transaction; it is replayed if it hits a deadlock or
+      lock wait timeout.
 
     Parameters
     ----------
@@ -132,141 +241,50 @@ def load_title_basics_and_title_genre(tsv_path: Path,
         Maps cleaned titleType text -> title_type_id
     genre_map : dict
         Maps cleaned genre text -> genre_id
-    max_workers : int
-        Number of worker threads to use for DB insertions.
+    genre_bits : dict
+        Maps cleaned genre text -> its bit in genre_mask
+    max_workers : int or None
+        Number of worker threads to use for DB insertions
+        (None: autoscale on DB throughput, see autoscale.py).
     chunk_size : int
         Number of TSV rows per chunk submitted to a worker.
     """
+    txn_stats = TransactionStats()
+    dead_letter = DeadLetterWriter("title_basics")
 
     def process_chunk(rows):
         """
         Process a list of CSV rows (dicts) in a single thread:
-        - Open a new DB connection
         - Build batches for title_basics and title_genre
+        - Open a new DB connection
         - Insert parents first, then children
         """
+        with txn_stats.metrics.timer("parse_seconds"):
+            steps = build_title_basics_steps(rows, title_type_map, genre_map, genre_bits, dead_letter)
 
-        insert_title_basics_sql = """
-            INSERT IGNORE INTO title_basics (
-                tconst,
-                primaryTitle,
-                originalTitle,
-                isAdult,
-                startYear,
-                endYear,
-                runtimeMinutes,
-                title_type_id
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
-        """
-
-        insert_title_genre_sql = """
-            INSERT IGNORE INTO title_genre (tconst, genre_id)
-             VALUES (%s, %s);
-        """
-
-        title_basics_batch = []
-        title_genre_batch = []
-
-        for row in rows:
-            tconst = row.get("tconst")
-            if not tconst:
-                continue
-
-            primaryTitle = None if row.get("primaryTitle") in (None, r"\N") else row["primaryTitle"]
-            originalTitle = None if row.get("originalTitle") in (None, r"\N") else row["originalTitle"]
-            isAdult = parse_bool_01(row.get("isAdult"))
-
-            # Use range-aware parsing if you implemented it
-            startYear = parse_int(row.get("startYear"))
-            endYear = parse_int(row.get("endYear"))
-            runtimeMinutes = parse_int(row.get("runtimeMinutes"))
-
-            # Map titleType text -> title_type_id
-            titleType_raw = row.get("titleType")
-            title_type_id = None
-            if titleType_raw and titleType_raw != r"\N":
-                tt_clean = titleType_raw.strip()
-                if tt_clean:
-                    title_type_id = title_type_map.get(tt_clean)
-
-            # Parent row
-            title_basics_batch.append(
-                (
-                    tconst,
-                    primaryTitle,
-                    originalTitle,
-                    isAdult,
-                    startYear,
-                    endYear,
-                    runtimeMinutes,
-                    title_type_id,
-                )
-            )
-
-            # Children rows (genres)
-            genres_raw = row.get("genres")
-            if genres_raw and genres_raw != r"\N":
-                for part in genres_raw.split(","):
-                    g_clean = part.strip()
-                    if not g_clean or g_clean == r"\N":
-                        continue
-                    genre_id = genre_map.get(g_clean)
-                    if genre_id is not None:
-                        title_genre_batch.append((tconst, genre_id))
-
+        conn = connect_db()
+        conn.autocommit = False
         try:
-
-            conn = connect_db()
-            conn.autocommit = False
-            cur = conn.cursor()
-
-            # Insert parents first
-            cur.executemany(insert_title_basics_sql, title_basics_batch)
-
-            cur.executemany(insert_title_genre_sql, title_genre_batch)
-
-            conn.commit()
-        except Exception:
-            conn.rollback()
-            raise
+            run_steps(conn, steps, txn_stats, "title_basics")
         finally:
-            cur.close()
             conn.close()
 
-        return len(title_basics_batch), len(title_genre_batch)
+        return len(steps[0].rows), len(steps[1].rows)
 
     # -------- Main function body: read TSV, submit chunks to threads --------
-    total_titles = 0
-    total_genres = 0
-    futures = []
-
-    with tsv_path.open("r", encoding="utf-8") as f, ThreadPoolExecutor(max_workers=max_workers) as executor:
-        reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
-        current_chunk = []
-        for i, row in enumerate(reader, start=1):
-            current_chunk.append(row)
-
-            if len(current_chunk) >= chunk_size:
-                # Submit chunk to a worker thread
-                futures.append(executor.submit(process_chunk, current_chunk))
-                current_chunk = []
-
-            if i % 100000 == 0:
-                print(f"Queued {i} rows from title.basics.tsv")
-
-        # Submit any remaining rows
-        if current_chunk:
-            futures.append(executor.submit(process_chunk, current_chunk))
-
-        # Collect results
-        for fut in as_completed(futures):
-            inserted_titles, inserted_genres = fut.result()
-            total_titles += inserted_titles
-            total_genres += inserted_genres
+    with dead_letter:
+        results, report = load_chunks(tsv_path, process_chunk, "title_basics",
+                                      max_workers, chunk_size, txn_stats)
+    total_titles = sum(r[0] for r in results)
+    total_genres = sum(r[1] for r in results)
 
     print(f"Finished loading title_basics and title_genre via threads.")
     print(f"Total title_basics rows inserted: {total_titles}")
     print(f"Total title_genre rows inserted: {total_genres}")
+    report["dead_letter"] = dead_letter.report()
+    print_report(report)
+    write_run_report(report)
+    return report
 
 def main():
 
@@ -277,10 +295,17 @@ def main():
 
     print("Inserting lookup tables (title_type, genre)...")
     insert(title_types, genres)
-    title_type_map, genre_map = lookups()
+    title_type_map, genre_map, genre_bits = lookups()
 
     print("Loading title_basics and title_genre")
-    load_title_basics_and_title_genre(TITLE_BASICS_TSV, title_type_map, genre_map)
+    report = load_title_basics_and_title_genre(TITLE_BASICS_TSV, title_type_map, genre_map,
+                                               genre_bits)
+    refresh_after_load(("title_basics", "title_genre"), report["touched"])
+    sync_title_summary(("title_basics", "title_genre"), report["touched"])
+    # title_search needs NumPy; only the post-load hook uses it
+    from title_search import update_after_load as update_search_index
+    update_search_index(report["touched"])
+    merge_sketches(report["sketches"])
 
 
 if __name__ == '__main__':
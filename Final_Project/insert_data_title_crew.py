@@ -1,12 +1,19 @@
 from connect_db import *
-import csv
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from merge_join import SortedIdStream, title_id_check
+from dead_letter import (DeadLetterWriter, NO_DEAD_LETTER, CREW_NAME_NOT_FOUND, MISSING_KEY,
+                         TITLE_NOT_FOUND)
+from metrics import write_run_report
+from summaries import refresh_after_load
+from title_summary import sync_after_load as sync_title_summary
+from loader_pipeline import Batch, TransactionStats, load_chunks, print_report, run_steps
 
 # ---------------- CONFIG ----------------
 
 TITLE_CREW_TSV = Path("C:\\My_Programs\\Temp\\Data\\title.crew.tsv")
 BATCH_SIZE = 2000
+TITLE_ID_CHECK = "merge"   # "merge": merge-join title_basics ids with the sorted TSV (merge_join.py)
+                           # "set":   load every tconst into memory first
 
 # ----------------------------------------
 
@@ -40,11 +47,82 @@ def load_existing_name_ids():
     return name_ids
 
 
+INSERT_DIRECTOR_SQL = """
+    INSERT INTO title_director (tconst, nconst)
+    VALUES (%s, %s);
+"""
+
+INSERT_WRITER_SQL = """
+    INSERT INTO title_writer (tconst, nconst)
+    VALUES (%s, %s);
+"""
+
+
+def build_title_crew_steps(rows, existing_title_ids, existing_name_ids, dead_letter=NO_DEAD_LETTER):
+    """
+    Row builder for title.crew.tsv:
+    turn a list of CSV rows (dicts) into the batches for
+    title_director and title_writer.
+    Dropped rows / values go to dead_letter (see dead_letter.py).
+    """
+    director_batch = []
+    writer_batch = []
+
+    for row in rows:
+        tconst = row.get("tconst")
+        if not tconst:
+            dead_letter.reject(MISSING_KEY, row)
+            continue
+
+        # FK safety: only keep rows where tconst exists
+        if tconst not in existing_title_ids:
+            dead_letter.reject(TITLE_NOT_FOUND, row, tconst)
+            continue
+
+        # ---- Directors ----
+        directors_raw = row.get("directors")
+        if directors_raw and directors_raw != r"\N":
+            # dedupe nconsts for this title within the chunk
+            seen_directors = set()
+            for part in directors_raw.split(","):
+                n = part.strip()
+                if not n or n == r"\N":
+                    continue
+                if n not in existing_name_ids:
+                    dead_letter.reject(CREW_NAME_NOT_FOUND, row, n)
+                    continue
+                if n in seen_directors:
+                    continue
+                seen_directors.add(n)
+                director_batch.append((tconst, n))
+
+        # ---- Writers ----
+        writers_raw = row.get("writers")
+        if writers_raw and writers_raw != r"\N":
+            seen_writers = set()
+            for part in writers_raw.split(","):
+                n = part.strip()
+                if not n or n == r"\N":
+                    continue
+                if n not in existing_name_ids:
+                    dead_letter.reject(CREW_NAME_NOT_FOUND, row, n)
+                    continue
+                if n in seen_writers:
+                    continue
+                seen_writers.add(n)
+                writer_batch.append((tconst, n))
+
+    return [
+        Batch(INSERT_DIRECTOR_SQL, director_batch),
+        Batch(INSERT_WRITER_SQL, writer_batch),
+    ]
+
+
 def load_title_crew_mt(
     tsv_path: Path,
     existing_title_ids,
     existing_name_ids,
-    max_workers: int=5,
+    max_workers=None,
     chunk_size: int=1000,
         ):
     """
@@ -70,8 +148,13 @@ def load_title_crew_mt(
       - Per chunk:
           * collect director pairs (tconst, nconst)
           * collect writer pairs  (tconst, nconst)
-          * batch insert into title_director / title_writer
+          * batch insert into title_director / title_writer, one transaction
+            per BATCH_SIZE rows; a batch that hits a deadlock or lock wait
+            timeout is replayed on its own
     """
+    txn_stats = TransactionStats()
+    dead_letter = DeadLetterWriter("title_crew")
+    row_filter, title_ids = title_id_check(existing_title_ids, "tconst", dead_letter)
 
     def process_chunk(rows):
         """
@@ -79,151 +162,67 @@ def load_title_crew_mt(
         - Build director and writer batches
         - Insert into title_director and title_writer
         """
+        with txn_stats.metrics.timer("parse_seconds"):
+            steps = build_title_crew_steps(rows, title_ids, existing_name_ids, dead_letter)
 
-        insert_director_sql = """
-            INSERT INTO title_director (tconst, nconst)
-            VALUES (%s, %s);
-        """
-
-        insert_writer_sql = """
-            INSERT INTO title_writer (tconst, nconst)
-            VALUES (%s, %s);
-        """
-
-        director_batch = []
-        writer_batch = []
-        director_count = 0
-        writer_count = 0
-
+        conn = connect_db()
+        conn.autocommit = False
         try:
-            conn = connect_db()
-            conn.autocommit = False
-            cur = conn.cursor()
-
-            for row in rows:
-                tconst = row.get("tconst")
-                if not tconst:
-                    continue
-
-                # FK safety: only keep rows where tconst exists
-                if tconst not in existing_title_ids:
-                    continue
-
-                # ---- Directors ----
-                directors_raw = row.get("directors")
-                if directors_raw and directors_raw != r"\N":
-                    # dedupe nconsts for this title within the chunk
-                    seen_directors = set()
-                    for part in directors_raw.split(","):
-                        n = part.strip()
-                        if not n or n == r"\N":
-                            continue
-                        if n not in existing_name_ids:
-                            continue
-                        if n in seen_directors:
-                            continue
-                        seen_directors.add(n)
-                        director_batch.append((tconst, n))
-                        director_count += 1
-
-                        if len(director_batch) >= BATCH_SIZE:
-                            cur.executemany(insert_director_sql, director_batch)
-                            director_batch.clear()
-                            conn.commit()
-
-                # ---- Writers ----
-                writers_raw = row.get("writers")
-                if writers_raw and writers_raw != r"\N":
-                    seen_writers = set()
-                    for part in writers_raw.split(","):
-                        n = part.strip()
-                        if not n or n == r"\N":
-                            continue
-                        if n not in existing_name_ids:
-                            continue
-                        if n in seen_writers:
-                            continue
-                        seen_writers.add(n)
-                        writer_batch.append((tconst, n))
-                        writer_count += 1
-
-                        if len(writer_batch) >= BATCH_SIZE:
-                            cur.executemany(insert_writer_sql, writer_batch)
-                            writer_batch.clear()
-                            conn.commit()
-
-            # Final flush for this chunk
-            if director_batch:
-                cur.executemany(insert_director_sql, director_batch)
-                director_batch.clear()
-                conn.commit()
-
-            if writer_batch:
-                cur.executemany(insert_writer_sql, writer_batch)
-                writer_batch.clear()
-                conn.commit()
-
-        except Exception:
-            conn.rollback()
-            raise
+            run_steps(conn, steps, txn_stats, "title_crew", batch_size=BATCH_SIZE)
         finally:
-            cur.close()
             conn.close()
 
-        return director_count, writer_count
+        return len(steps[0].rows), len(steps[1].rows)
 
     # -------- Main body: read TSV, build chunks, dispatch to threads --------
-    total_directors = 0
-    total_writers = 0
-    futures = []
-
-    with tsv_path.open("r", encoding="utf-8") as f, ThreadPoolExecutor(max_workers=max_workers) as executor:
-        reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
-        current_chunk = []
-
-        for i, row in enumerate(reader, start=1):
-
-            current_chunk.append(row)
-
-            if len(current_chunk) >= chunk_size:
-                futures.append(executor.submit(process_chunk, current_chunk))
-                current_chunk = []
-
-            if i % 100000 == 0:
-                print(f"Queued {i} rows from title.crew.tsv")
-
-        # Submit remaining rows
-        if current_chunk:
-            futures.append(executor.submit(process_chunk, current_chunk))
-
-        for fut in as_completed(futures):
-            d_count, w_count = fut.result()
-            total_directors += d_count
-            total_writers += w_count
+    with dead_letter:
+        results, report = load_chunks(tsv_path, process_chunk, "title_crew",
+                                      max_workers, chunk_size, txn_stats, row_filter)
+    total_directors = sum(r[0] for r in results)
+    total_writers = sum(r[1] for r in results)
 
     print("Finished loading title_director and title_writer via threads.")
     print(f"Total title_director rows inserted: {total_directors}")
     print(f"Total title_writer rows inserted: {total_writers}")
+    if row_filter is not None:
+        report["merge_join"] = existing_title_ids.report()
+    report["dead_letter"] = dead_letter.report()
+    print_report(report)
+    write_run_report(report)
+    return report
 
 
 def main():
     if not TITLE_CREW_TSV.exists():
         raise FileNotFoundError(f"TSV file not found: {TITLE_CREW_TSV}")
 
-    print("Loading existing title IDs from 'title_basics'...")
-    existing_title_ids = load_existing_title_ids()
-    print(f"Loaded {len(existing_title_ids)} title IDs")
+    if TITLE_ID_CHECK == "merge":
+        print("Streaming title IDs from 'title_basics' (merge join)...")
+        existing_title_ids = SortedIdStream("title_basics", "tconst")
+    else:
+        print("Loading existing title IDs from 'title_basics'...")
+        existing_title_ids = load_existing_title_ids()
+        print(f"Loaded {len(existing_title_ids)} title IDs")
 
     print("Loading existing name IDs from 'name_basics'...")
     existing_name_ids = load_existing_name_ids()
     print(f"Loaded {len(existing_name_ids)} name IDs")
 
     print("Multi-threaded load of title.crew.tsv -> title_director/title_writer...")
-    load_title_crew_mt(
-        TITLE_CREW_TSV,
-        existing_title_ids,
-        existing_name_ids
-    )
+    try:
+        report = load_title_crew_mt(
+            TITLE_CREW_TSV,
+            existing_title_ids,
+            existing_name_ids
+        )
+    finally:
+        if isinstance(existing_title_ids, SortedIdStream):
+            existing_title_ids.close()
+    refresh_after_load(("title_director", "title_writer"), report["touched"])
+    sync_title_summary(("title_director", "title_writer"), report["touched"])
+    # person_roles needs NumPy (RoleBitmaps); only the post-load hook uses it
+    from person_roles import build_after_load as build_person_roles
+    build_person_roles(("title_director", "title_writer"), report["touched"])
 
     print("All done for title.crew.tsv")
 
@@ -1,12 +1,19 @@
 from connect_db import *
 import csv
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from merge_join import SortedIdStream, title_id_check
+from dead_letter import (DeadLetterWriter, NO_DEAD_LETTER, BAD_ORDERING, MISSING_KEY,
+                         NAME_NOT_FOUND, TITLE_NOT_FOUND, UNKNOWN_CATEGORY)
+from distinct_sketches import merge_after_load as merge_sketches
+from metrics import write_run_report
+from loader_pipeline import LinkedBatch, TransactionStats, load_chunks, print_report, run_steps
 
 # ---------------- CONFIG ----------------
 
 TITLE_PRINCIPALS_TSV = Path("C:\\My_Programs\\Temp\\Data\\title.principals.tsv")  # update as needed
 BATCH_SIZE = 200
+TITLE_ID_CHECK = "merge"   # "merge": merge-join title_basics ids with the sorted TSV (merge_join.py)
+                           # "set":   load every tconst into memory first
 
 # ----------------------------------------
 
@@ -98,12 +105,122 @@ def load_existing_name_ids():
 # -------- STEP 3: load title_principals_and_characters tables --------
 
 
+def parse_characters_field(characters_raw: str):
+    """
+    Simple character parsing helper.
+
+    IMDb often stores characters as JSON-like strings, e.g.:
+      '["John Doe","Agent Smith"]'
+    For this project we:
+      - strip enclosing brackets if present
+      - split on commas
+      - trim quotes and whitespace
+      - deduplicate while preserving order
+    """
+    if not characters_raw or characters_raw == r"\N":
+        return []
+
+    s = characters_raw.strip()
+    if s.startswith("[") and s.endswith("]"):
+        s = s[1:-1]
+
+    parts = s.split(",")
+    chars = []
+    for p in parts:
+        c = p.strip().strip('"').strip("'")
+        if c:
+            chars.append(c)
+
+    seen = set()
+    result = []
+    for c in chars:
+        if c not in seen:
+            seen.add(c)
+            result.append(c)
+    return result
+
+
+INSERT_PRINCIPAL_SQL = """
+    INSERT INTO title_principals (
+        tconst,
+        ordering,
+        nconst,
+        category_id,
+        job
+    ) VALUES (%s, %s, %s, %s, %s);
+"""
+
+INSERT_CHARACTER_SQL = """
+    INSERT INTO principal_character (
+        title_principals_id,
+        character_name
+    ) VALUES (%s, %s);
+"""
+
+
+def build_title_principals_steps(rows, category_map, existing_title_ids, existing_name_ids,
+                                 dead_letter=NO_DEAD_LETTER):
+    """
+    Row builder for title.principals.tsv:
+    turn a list of CSV rows (dicts) into one LinkedBatch:
+      parent   title_principals row
+      children principal_character rows (principal id added on insert)
+    Dropped rows / values go to dead_letter (see dead_letter.py).
+    """
+    items = []
+
+    for row in rows:
+        tconst = row.get("tconst")
+        if not tconst:
+            dead_letter.reject(MISSING_KEY, row)
+            continue
+        if tconst not in existing_title_ids:
+            # FK safety: only keep principals for titles we have
+            dead_letter.reject(TITLE_NOT_FOUND, row, tconst)
+            continue
+
+        ordering_raw = row.get("ordering")
+        try:
+            ordering = int(ordering_raw) if ordering_raw not in (None, "", r"\N") else None
+        except ValueError:
+            ordering = None
+        if ordering is None:
+            # ordering is logically required; skip malformed
+            dead_letter.reject(BAD_ORDERING, row, ordering_raw)
+            continue
+
+        nconst = row.get("nconst")
+        if not nconst or nconst not in existing_name_ids:
+            # ensure person exists
+            dead_letter.reject(NAME_NOT_FOUND, row, nconst)
+            continue
+
+        category_raw = row.get("category")
+        category_id = None
+        if category_raw and category_raw != r"\N":
+            c = category_raw.strip()
+            if c:
+                category_id = category_map.get(c)
+                if category_id is None:
+                    dead_letter.reject(UNKNOWN_CATEGORY, row, c)
+
+        job = row.get("job")
+        if job in (None, r"\N"):
+            job = None
+
+        char_rows = [(char_name,) for char_name in parse_characters_field(row.get("characters"))]
+
+        items.append(((tconst, ordering, nconst, category_id, job), (char_rows,)))
+
+    return [LinkedBatch(INSERT_PRINCIPAL_SQL, (INSERT_CHARACTER_SQL,), items)]
+
+
 def load_title_principals_and_characters_mt(
         tsv_path: Path,
         category_map,
         existing_title_ids,
         existing_name_ids,
-        max_workers: int=5,
+        max_workers=None,
         chunk_size: int=200,
 ):
     """
@@ -128,179 +245,53 @@ def load_title_principals_and_characters_mt(
       - Per row in a chunk:
           1) Insert into title_principals (single row, grab 'id' via lastrowid)
           2) Insert related characters into principal_character using that id.
+      - A chunk is one transaction (chunk_size rows); it is replayed if it
+        hits a deadlock or lock wait timeout.
     """
-
-    def parse_characters_field(characters_raw: str):
-        """
-        Simple character parsing helper.
-
-        IMDb often stores characters as JSON-like strings, e.g.:
-          '["John Doe","Agent Smith"]'
-        For this project we:
-          - strip enclosing brackets if present
-          - split on commas
-          - trim quotes and whitespace
-          - deduplicate while preserving order
-        """
-        if not characters_raw or characters_raw == r"\N":
-            return []
-
-        s = characters_raw.strip()
-        if s.startswith("[") and s.endswith("]"):
-            s = s[1:-1]
-
-        parts = s.split(",")
-        chars = []
-        for p in parts:
-            c = p.strip().strip('"').strip("'")
-            if c:
-                chars.append(c)
-
-        seen = set()
-        result = []
-        for c in chars:
-            if c not in seen:
-                seen.add(c)
-                result.append(c)
-        return result
+    txn_stats = TransactionStats()
+    dead_letter = DeadLetterWriter("title_principals")
+    row_filter, title_ids = title_id_check(existing_title_ids, "tconst", dead_letter)
 
     def process_chunk(rows):
         """
         Process a list of CSV rows (dicts) in a single thread:
+        - Build the principal rows and their characters
         - Open a DB connection
         - Insert each principal row one-by-one to get its 'id'
         - Batch insert character rows using that 'id' as FK
         """
+        with txn_stats.metrics.timer("parse_seconds"):
+            steps = build_title_principals_steps(rows, category_map, title_ids, existing_name_ids, dead_letter)
+        items = steps[0].items
+
         conn = connect_db()
         conn.autocommit = False
-        cur = conn.cursor()
-
-        insert_principal_sql = """
-            INSERT INTO title_principals (
-                tconst,
-                ordering,
-                nconst,
-                category_id,
-                job
-            ) VALUES (%s, %s, %s, %s, %s);
-        """
-
-        insert_character_sql = """
-            INSERT INTO principal_character (
-                title_principals_id,
-                character_name
-            ) VALUES (%s, %s);
-        """
-
-        characters_batch = []
-        principals_count = 0
-        characters_count = 0
-
         try:
-            for row in rows:
-                tconst = row.get("tconst")
-                if not tconst:
-                    continue
-                if tconst not in existing_title_ids:
-                    # FK safety: only keep principals for titles we have
-                    continue
-
-                ordering_raw = row.get("ordering")
-                try:
-                    ordering = int(ordering_raw) if ordering_raw not in (None, "", r"\N") else None
-                except ValueError:
-                    ordering = None
-                if ordering is None:
-                    # ordering is logically required; skip malformed
-                    continue
-
-                nconst = row.get("nconst")
-                if not nconst or nconst not in existing_name_ids:
-                    # ensure person exists
-                    continue
-
-                category_raw = row.get("category")
-                category_id = None
-                if category_raw and category_raw != r"\N":
-                    c = category_raw.strip()
-                    if c:
-                        category_id = category_map.get(c)
-
-                job = row.get("job")
-                if job in (None, r"\N"):
-                    job = None
-
-                # ---- 1) Insert into title_principals, get surrogate PK 'id' ----
-                cur.execute(
-                    insert_principal_sql,
-                    (tconst, ordering, nconst, category_id, job),
-                )
-                conn.commit()
-                principal_id = cur.lastrowid
-                principals_count += 1
-
-                # ---- 2) Parse characters and queue principal_character rows ----
-                chars_raw = row.get("characters")
-                char_list = parse_characters_field(chars_raw)
-                for char_name in char_list:
-                    characters_batch.append((principal_id, char_name))
-                    characters_count += 1
-
-                # Flush character batch if large
-                if len(characters_batch) >= BATCH_SIZE:
-                    cur.executemany(insert_character_sql, characters_batch)
-                    characters_batch.clear()
-                    conn.commit()
-
-            # Final flush for leftover character rows in this chunk
-            if characters_batch:
-                cur.executemany(insert_character_sql, characters_batch)
-                characters_batch.clear()
-                conn.commit()
-
+            run_steps(conn, steps, txn_stats, "title_principals")
         except Exception as e:
             print(e)
-            conn.rollback()
             raise
         finally:
-            cur.close()
             conn.close()
 
-        return principals_count, characters_count
+        return len(items), sum(len(children[0]) for _, children in items)
 
     # -------- Main body: read TSV, chunk it, and dispatch to threads --------
-    total_principals = 0
-    total_characters = 0
-    futures = []
-
-    with tsv_path.open("r", encoding="utf-8") as f, ThreadPoolExecutor(max_workers=max_workers) as executor:
-        reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
-        current_chunk = []
-
-        for i, row in enumerate(reader, start=1):
-
-            current_chunk.append(row)
-
-            if len(current_chunk) >= chunk_size:
-                futures.append(executor.submit(process_chunk, current_chunk))
-                current_chunk = []
-
-            if i % 100000 == 0:
-                print(f"Queued {i} rows from title.principals.tsv")
-
-        # Submit any remaining rows
-        if current_chunk:
-            futures.append(executor.submit(process_chunk, current_chunk))
-
-        from concurrent.futures import as_completed
-        for fut in as_completed(futures):
-            p_count, c_count = fut.result()
-            total_principals += p_count
-            total_characters += c_count
+    with dead_letter:
+        results, report = load_chunks(tsv_path, process_chunk, "title_principals",
+                                      max_workers, chunk_size, txn_stats, row_filter)
+    total_principals = sum(r[0] for r in results)
+    total_characters = sum(r[1] for r in results)
 
     print("Finished loading title_principals (with id PK) and principal_character via threads.")
     print(f"Total title_principals rows inserted: {total_principals}")
     print(f"Total principal_character rows inserted: {total_characters}")
+    if row_filter is not None:
+        report["merge_join"] = existing_title_ids.report()
+    report["dead_letter"] = dead_letter.report()
+    print_report(report)
+    write_run_report(report)
+    return report
 
 
 def main():
@@ -316,21 +307,37 @@ def main():
     category_map = lookup_categories()
     print("Category lookup loaded.")
 
-    print("Loading existing title IDs from 'title_basics'...")
-    existing_title_ids = load_existing_title_ids()
-    print(f"Loaded {len(existing_title_ids)} title IDs")
+    if TITLE_ID_CHECK == "merge":
+        print("Streaming title IDs from 'title_basics' (merge join)...")
+        existing_title_ids = SortedIdStream("title_basics", "tconst")
+    else:
+        print("Loading existing title IDs from 'title_basics'...")
+        existing_title_ids = load_existing_title_ids()
+        print(f"Loaded {len(existing_title_ids)} title IDs")
 
     print("Loading existing name IDs from 'name_basics'...")
     existing_name_ids = load_existing_name_ids()
     print(f"Loaded {len(existing_name_ids)} name IDs")
 
     print("Pass 2 (multi-threaded): loading title_principals and principal_character...")
-    load_title_principals_and_characters_mt(
-        TITLE_PRINCIPALS_TSV,
-        category_map,
-        existing_title_ids,
-        existing_name_ids
-    )
+    try:
+        report = load_title_principals_and_characters_mt(
+            TITLE_PRINCIPALS_TSV,
+            category_map,
+            existing_title_ids,
+            existing_name_ids
+        )
+    finally:
+        if isinstance(existing_title_ids, SortedIdStream):
+            existing_title_ids.close()
+    # name_autocomplete needs NumPy; only the post-load hook uses it
+    from name_autocomplete import build_after_load as build_name_index
+    # principal credits rank the name autocomplete
+    build_name_index()
+    # person_roles needs NumPy (RoleBitmaps); only the post-load hook uses it
+    from person_roles import build_after_load as build_person_roles
+    build_person_roles(("title_principals", "principal_character"), report["touched"])
+    merge_sketches(report["sketches"])
 
     print("All done for title.principals.tsv")
 
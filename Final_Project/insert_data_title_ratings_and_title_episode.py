@@ -1,7 +1,14 @@
 from connect_db import *
-import csv
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import NamedTuple
+from merge_join import SortedIdStream, title_id_check
+from dead_letter import (DeadLetterWriter, NO_DEAD_LETTER, MISSING_KEY, PARENT_NULLED,
+                         TITLE_NOT_FOUND)
+from metrics import write_run_report
+from summaries import refresh_after_load
+from title_summary import sync_after_load as sync_title_summary
+from top_rated import build_top_rated
+from loader_pipeline import Batch, TouchedKeys, TransactionStats, load_chunks, print_report, run_steps
 
 
 # ---------------- CONFIG ----------------
@@ -10,6 +17,16 @@ TITLE_EPISODE_TSV = Path("C:\\My_Programs\\Temp\\Data\\title.episode.tsv")
 TITLE_RATINGS_TSV = Path("C:\\My_Programs\\Temp\\Data\\title.ratings.tsv")
 
 BATCH_SIZE = 200    # per-thread batch size for executemany
+TITLE_ID_CHECK = "merge"   # "merge": merge-join title_basics ids with the sorted TSV (merge_join.py);
+                           #          title.ratings only, episodes also check parentTconst
+                           # "set":   load every tconst into memory first
+
+# Bayesian weighted rating stored in title_ratings.weightedRating:
+#   WR = v / (v + m) * R + m / (v + m) * C
+# R = averageRating, v = numVotes, m = WEIGHTED_MIN_VOTES (the prior's
+# weight in votes), C = mean averageRating of the whole ratings file
+WEIGHTED_MIN_VOTES = 25000
+WEIGHTED_PRIOR_MEAN = None   # fixed C (e.g. for delta files); None: compute it from the file
 
 # ----------------------------------------
 
@@ -51,10 +68,59 @@ def load_existing_title_ids():
 # 1) title.episode.tsv
 # =========================
 
+INSERT_EPISODE_SQL = """
+    INSERT INTO title_episode (
+        tconst,
+        parentTconst,
+        seasonNumber,
+        episodeNumber
+    ) VALUES (%s, %s, %s, %s);
+"""
+
+
+def build_title_episode_steps(rows, existing_title_ids, dead_letter=NO_DEAD_LETTER):
+    """
+    Row builder for title.episode.tsv:
+    turn a list of CSV rows (dicts) into the batch for title_episode.
+    Dropped rows / NULLed parents go to dead_letter (see dead_letter.py).
+    """
+    episode_batch = []
+
+    for row in rows:
+        tconst = row.get("tconst")
+        if not tconst:
+            dead_letter.reject(MISSING_KEY, row)
+            continue
+
+        # FK safety: ensure the episode title exists
+        if tconst not in existing_title_ids:
+            dead_letter.reject(TITLE_NOT_FOUND, row, tconst)
+            continue
+
+        parentTconst = row.get("parentTconst")
+        if parentTconst in (None, r"\N"):
+            parentTconst = None
+        else:
+            # only keep if parent also in title_basics
+            if parentTconst not in existing_title_ids:
+                # set None if not
+                dead_letter.reject(PARENT_NULLED, row, parentTconst)
+                parentTconst = None
+
+        seasonNumber = parse_int(row.get("seasonNumber"))
+        episodeNumber = parse_int(row.get("episodeNumber"))
+
+        episode_batch.append(
+            (tconst, parentTconst, seasonNumber, episodeNumber)
+        )
+
+    return [Batch(INSERT_EPISODE_SQL, episode_batch)]
+
+
 def load_title_episode_mt(
     tsv_path: Path,
     existing_title_ids,
-    max_workers: int=5,
+    max_workers=None,
     chunk_size: int=1000,
 ):
     """
@@ -69,7 +135,12 @@ def load_title_episode_mt(
     Target table:
       - title_episode(tconst PK, parentTconst, seasonNumber, episodeNumber)
       - FKs to title_basics(tconst) and title_basics(parentTconst)
+
+    One transaction per BATCH_SIZE rows; a batch that hits a deadlock or
+    lock wait timeout is replayed on its own.
     """
+    txn_stats = TransactionStats()
+    dead_letter = DeadLetterWriter("title_episode")
 
     def process_chunk(rows):
         """
@@ -77,108 +148,123 @@ def load_title_episode_mt(
         - Build batch for title_episode
         - Insert in bulk
         """
+        with txn_stats.metrics.timer("parse_seconds"):
+            steps = build_title_episode_steps(rows, existing_title_ids, dead_letter)
+
         conn = connect_db()
         conn.autocommit = False
-        cur = conn.cursor()
-
-        insert_episode_sql = """
-            INSERT INTO title_episode (
-                tconst,
-                parentTconst,
-                seasonNumber,
-                episodeNumber
-            ) VALUES (%s, %s, %s, %s);
-        """
-
-        episode_batch = []
-        episode_count = 0
-
         try:
-            for row in rows:
-                tconst = row.get("tconst")
-                if not tconst:
-                    continue
-
-                # FK safety: ensure the episode title exists
-                if tconst not in existing_title_ids:
-                    continue
-
-                parentTconst = row.get("parentTconst")
-                if parentTconst in (None, r"\N"):
-                    parentTconst = None
-                else:
-                    # only keep if parent also in title_basics
-                    if parentTconst not in existing_title_ids:
-                        # set None if not
-                        parentTconst = None
-
-                seasonNumber = parse_int(row.get("seasonNumber"))
-                episodeNumber = parse_int(row.get("episodeNumber"))
-
-                episode_batch.append(
-                    (tconst, parentTconst, seasonNumber, episodeNumber)
-                )
-                episode_count += 1
-
-                if len(episode_batch) >= BATCH_SIZE:
-                    cur.executemany(insert_episode_sql, episode_batch)
-                    episode_batch.clear()
-                    conn.commit()
-
-            # Final flush for this chunk
-            if episode_batch:
-                cur.executemany(insert_episode_sql, episode_batch)
-                episode_batch.clear()
-                conn.commit()
-
-        except Exception:
-            conn.rollback()
-            raise
+            run_steps(conn, steps, txn_stats, "title_episode", batch_size=BATCH_SIZE)
         finally:
-            cur.close()
             conn.close()
 
-        return episode_count
+        return len(steps[0].rows)
 
     # ---- main body: read TSV, chunk, dispatch to threads ----
-    total_episodes = 0
-    futures = []
+    with dead_letter:
+        results, report = load_chunks(tsv_path, process_chunk, "title_episode",
+                                      max_workers, chunk_size, txn_stats)
+    total_episodes = sum(results)
 
-    with tsv_path.open("r", encoding="utf-8") as f, ThreadPoolExecutor(max_workers=max_workers) as executor:
-        reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
-        current_chunk = []
+    print("Finished loading title_episode via threads.")
+    print(f"Total title_episode rows inserted: {total_episodes}")
+    report["dead_letter"] = dead_letter.report()
+    print_report(report)
+    write_run_report(report)
+    return report
 
-        for i, row in enumerate(reader, start=1):
 
-            current_chunk.append(row)
+# =========================
+# 2) title.ratings.tsv
+# =========================
 
-            if len(current_chunk) >= chunk_size:
-                futures.append(executor.submit(process_chunk, current_chunk))
-                current_chunk = []
+INSERT_RATINGS_SQL = """
+    INSERT INTO title_ratings (
+        tconst,
+        averageRating,
+        numVotes,
+        weightedRating
+    ) VALUES (%s, %s, %s, %s);
+"""
 
-            if i % 100000 == 0:
-                print(f"Queued {i} rows from title.episode.tsv")
 
-        # Submit remaining rows
-        if current_chunk:
-            futures.append(executor.submit(process_chunk, current_chunk))
+class RatingPrior(NamedTuple):
+    """
+    Prior of the weighted rating: mean rating C, weight m in votes.
+    """
+    mean: float
+    min_votes: int
 
-        for fut in as_completed(futures):
-            ep_count = fut.result()
-            total_episodes += ep_count
 
-    print("Finished loading title_episode via threads.")
-    print(f"Total title_episode rows inserted: {total_episodes}")
+def rating_prior(tsv_path: Path, min_votes: int=WEIGHTED_MIN_VOTES, mean: float=WEIGHTED_PRIOR_MEAN):
+    """
+    RatingPrior for a ratings file: C is the mean averageRating over the
+    whole file (one pass over its second column), unless given.
+    """
+    if mean is None:
+        total = 0.0
+        count = 0
+        with tsv_path.open("r", encoding="utf-8") as f:
+            next(f, None)   # header
+            for line in f:
+                fields = line.split("\t", 2)
+                rating = parse_float(fields[1]) if len(fields) > 1 else None
+                if rating is not None:
+                    total += rating
+                    count += 1
+        mean = total / count if count else 0.0
+    return RatingPrior(mean, min_votes)
+
+
+def weighted_rating(rating, votes, prior):
+    """
+    Bayesian weighted rating, None without a rating or a prior.
+    """
+    if rating is None or prior is None:
+        return None
+    v = votes or 0
+    m = prior.min_votes
+    return (v * rating + m * prior.mean) / (v + m) if v + m else rating
 
 
-# =========================
-# 2) title.ratings.tsv
-# =========================
+def build_title_ratings_steps(rows, existing_title_ids, prior=None, dead_letter=NO_DEAD_LETTER):
+    """
+    Row builder for title.ratings.tsv:
+    turn a list of CSV rows (dicts) into the batch for title_ratings.
+    weightedRating is computed with prior (RatingPrior); without one it
+    stays NULL.
+    Dropped rows go to dead_letter (see dead_letter.py).
+    """
+    ratings_batch = []
+
+    for row in rows:
+        tconst = row.get("tconst")
+        if not tconst:
+            dead_letter.reject(MISSING_KEY, row)
+            continue
+
+        # FK safety: only keep ratings for titles we have
+        if tconst not in existing_title_ids:
+            dead_letter.reject(TITLE_NOT_FOUND, row, tconst)
+            continue
+
+        avg_raw = row.get("averageRating")
+        num_raw = row.get("numVotes")
+
+        averageRating = parse_float(avg_raw)
+        numVotes = parse_int(num_raw)
+
+        ratings_batch.append((tconst, averageRating, numVotes,
+                              weighted_rating(averageRating, numVotes, prior)))
+
+    return [Batch(INSERT_RATINGS_SQL, ratings_batch)]
+
 
 def load_title_ratings_mt(
     tsv_path: Path,
     existing_title_ids,
-    max_workers: int=5,
+    prior=None,
+    max_workers=None,
     chunk_size: int=1000,
 ):
     """
@@ -190,9 +276,21 @@ def load_title_ratings_mt(
       - numVotes
 
     Target table:
-      - title_ratings(tconst PK, averageRating, numVotes)
+      - title_ratings(tconst PK, averageRating, numVotes, weightedRating)
       - FK(tconst -> title_basics.tconst)
+
+    weightedRating uses prior (RatingPrior); by default the prior mean is
+    computed from the file in a first pass.
+
+    One transaction per BATCH_SIZE rows; a batch that hits a deadlock or
+    lock wait timeout is replayed on its own.
     """
+    if prior is None:
+        prior = rating_prior(tsv_path)
+        print(f"Weighted rating prior: mean {prior.mean:.4f}, {prior.min_votes} votes")
+    txn_stats = TransactionStats()
+    dead_letter = DeadLetterWriter("title_ratings")
+    row_filter, title_ids = title_id_check(existing_title_ids, "tconst", dead_letter)
 
     def process_chunk(rows):
         """
@@ -200,89 +298,33 @@ def load_title_ratings_mt(
         - Build batch for title_ratings
         - Insert in bulk
         """
+        with txn_stats.metrics.timer("parse_seconds"):
+            steps = build_title_ratings_steps(rows, title_ids, prior, dead_letter)
+
         conn = connect_db()
         conn.autocommit = False
-        cur = conn.cursor()
-
-        insert_ratings_sql = """
-            INSERT INTO title_ratings (
-                tconst,
-                averageRating,
-                numVotes
-            ) VALUES (%s, %s, %s);
-        """
-
-        ratings_batch = []
-        ratings_count = 0
-
         try:
-            for row in rows:
-                tconst = row.get("tconst")
-                if not tconst:
-                    continue
-
-                # FK safety: only keep ratings for titles we have
-                if tconst not in existing_title_ids:
-                    continue
-
-                avg_raw = row.get("averageRating")
-                num_raw = row.get("numVotes")
-
-                averageRating = parse_float(avg_raw)
-                numVotes = parse_int(num_raw)
-
-                ratings_batch.append((tconst, averageRating, numVotes))
-                ratings_count += 1
-
-                if len(ratings_batch) >= BATCH_SIZE:
-                    cur.executemany(insert_ratings_sql, ratings_batch)
-                    ratings_batch.clear()
-                    conn.commit()
-
-            # Final flush for this chunk
-            if ratings_batch:
-                cur.executemany(insert_ratings_sql, ratings_batch)
-                ratings_batch.clear()
-                conn.commit()
-
-        except Exception:
-            conn.rollback()
-            raise
+            run_steps(conn, steps, txn_stats, "title_ratings", batch_size=BATCH_SIZE)
         finally:
-            cur.close()
             conn.close()
 
-        return ratings_count
+        return len(steps[0].rows)
 
     # ---- main body: read TSV, chunk, dispatch to threads ----
-    total_ratings = 0
-    futures = []
-
-    with tsv_path.open("r", encoding="utf-8") as f, ThreadPoolExecutor(max_workers=max_workers) as executor:
-        reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
-        current_chunk = []
-
-        for i, row in enumerate(reader, start=1):
-
-            current_chunk.append(row)
-
-            if len(current_chunk) >= chunk_size:
-                futures.append(executor.submit(process_chunk, current_chunk))
-                current_chunk = []
-
-            if i % 100000 == 0:
-                print(f"Queued {i} rows from title.ratings.tsv")
-
-        # Submit remaining rows
-        if current_chunk:
-            futures.append(executor.submit(process_chunk, current_chunk))
-
-        for fut in as_completed(futures):
-            r_count = fut.result()
-            total_ratings += r_count
+    with dead_letter:
+        results, report = load_chunks(tsv_path, process_chunk, "title_ratings",
+                                      max_workers, chunk_size, txn_stats, row_filter)
+    total_ratings = sum(results)
 
     print("Finished loading title_ratings via threads.")
     print(f"Total title_ratings rows inserted: {total_ratings}")
+    if row_filter is not None:
+        report["merge_join"] = existing_title_ids.report()
+    report["dead_letter"] = dead_letter.report()
+    report["weighted_rating_prior"] = prior._asdict()
+    print_report(report)
+    write_run_report(report)
+    return report
 
 
 # =========================
@@ -294,24 +336,38 @@ def main():
     existing_title_ids = load_existing_title_ids()
     print(f"Loaded {len(existing_title_ids)} title IDs")
 
+    touched = TouchedKeys()
     if TITLE_EPISODE_TSV.exists():
         print("Multi-threaded load of title.episode.tsv -> title_episode...")
-        load_title_episode_mt(
+        report = load_title_episode_mt(
             TITLE_EPISODE_TSV,
             existing_title_ids
         )
+        touched.merge(report["touched"])
     else:
         print(f"WARNING: {TITLE_EPISODE_TSV} not found; skipping title_episode load.")
 
     if TITLE_RATINGS_TSV.exists():
         print("Multi-threaded load of title.ratings.tsv -> title_ratings...")
-        load_title_ratings_mt(
-            TITLE_RATINGS_TSV,
-            existing_title_ids
-        )
+        if TITLE_ID_CHECK == "merge":
+            # episodes needed the full set for parentTconst; ratings only
+            # reference their own (sorted) tconst, so drop it and stream
+            existing_title_ids = SortedIdStream("title_basics", "tconst")
+        try:
+            report = load_title_ratings_mt(
+                TITLE_RATINGS_TSV,
+                existing_title_ids
+            )
+        finally:
+            if isinstance(existing_title_ids, SortedIdStream):
+                existing_title_ids.close()
+        touched.merge(report["touched"])
     else:
         print(f"WARNING: {TITLE_RATINGS_TSV} not found; skipping title_ratings load.")
 
+    refresh_after_load(("title_episode", "title_ratings"), touched)
+    sync_title_summary(("title_episode", "title_ratings"), touched)
+    build_top_rated()
     print("Done with title_episode and title_ratings ETL.")
 
 
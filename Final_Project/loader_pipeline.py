@@ -0,0 +1,532 @@
+"""
+Shared pieces of the multi-threaded loaders (insert_data_*.py):
+- Batch / LinkedBatch describe what one chunk has to write
+- execute_steps writes them with a cursor
+- run_steps wraps the writes in transactions and replays a transaction
+  whose batch failed with a transient error (deadlock, lock wait timeout)
+- load_chunks reads a TSV in chunks and runs them on a worker pool whose
+  size is steered by autoscale.ConcurrencyController
+- timings and throughput go to metrics.LoadMetrics (TransactionStats.metrics)
+- keys of committed rows of the summary source tables are collected in
+  TransactionStats.touched, for summaries.refresh_after_load (and
+  title_search.update_after_load, title_summary.sync_after_load)
+- committed rows also feed the load's distinct-count sketches
+  (TransactionStats.sketches, see distinct_sketches.py)
+"""
+import csv
+import io
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from pathlib import Path
+from typing import NamedTuple
+
+from autoscale import ConcurrencyController
+from distinct_sketches import SketchSet
+from metrics import LoadMetrics, table_of
+from profiling import ChunkProfiler
+from progress import ProgressReporter
+
+
+# ---------------- CONFIG ----------------
+
+# MySQL / MariaDB error codes that only mean "try again"
+#   1205: ER_LOCK_WAIT_TIMEOUT
+#   1213: ER_LOCK_DEADLOCK
+TRANSIENT_ERRNOS = {1205, 1213}
+
+MAX_RETRIES = 6
+RETRY_BASE_DELAY = 0.05   # seconds
+RETRY_MAX_DELAY = 5.0     # seconds
+
+# tables whose committed keys (first column) are collected for incremental
+# summary refreshes (summaries.py), search index updates (title_search.py)
+# title_summary syncs (title_summary.py) and person_roles merges
+# (person_roles.py); past TOUCHED_LIMIT keys a table only counts as
+# "changed everywhere" and what is built from it is rebuilt
+TOUCHED_TABLES = ("title_basics", "title_genre", "title_director", "title_ratings",
+                  "person_profession", "title_akas", "title_writer", "title_episode",
+                  "title_principals")
+TOUCHED_LIMIT = 500000
+
+# ----------------------------------------
+
+
+class Batch(NamedTuple):
+    """
+    Rows inserted with one executemany.
+    """
+    sql: str
+    rows: list
+
+
+class LinkedBatch(NamedTuple):
+    """
+    Parent rows inserted one at a time, so that child rows can use the
+    parent's AUTO_INCREMENT id (cursor.lastrowid).
+
+    items: list of (parent_params, child_rows) where child_rows[k] is the
+    list of child tuples for child_sqls[k], *without* the leading parent id.
+    """
+    parent_sql: str
+    child_sqls: tuple
+    items: list
+
+
+class _AllIds:
+    """
+    Stands in for existing_title_ids / existing_name_ids when the FK check
+    happens somewhere else (on the server, or in a merge join): every id
+    "exists", so the row builder keeps every row.
+    """
+
+    def __contains__(self, item):
+        return True
+
+
+ALL_IDS = _AllIds()
+
+
+def execute_steps(cur, steps, metrics=None):
+    """
+    Write every step with the given cursor (no commit).
+    With metrics, each executemany (and each LinkedBatch's run of parent
+    inserts) is timed per target table.
+    Returns the rows each Batch step wrote (cursor.rowcount; fewer than
+    its rows if INSERT IGNORE skipped some), None for LinkedBatch steps.
+    """
+    def timed(sql):
+        return metrics.timer("executemany_seconds", table_of(sql)) if metrics else nullcontext()
+
+    written = []
+    for step in steps:
+        if isinstance(step, LinkedBatch):
+            child_batches = [[] for _ in step.child_sqls]
+            with timed(step.parent_sql):
+                for parent_params, child_rows in step.items:
+                    cur.execute(step.parent_sql, parent_params)
+                    parent_id = cur.lastrowid
+                    for k, rows in enumerate(child_rows):
+                        child_batches[k].extend((parent_id, *r) for r in rows)
+            for sql, rows in zip(step.child_sqls, child_batches):
+                if rows:
+                    with timed(sql):
+                        cur.executemany(sql, rows)
+            written.append(None)
+        elif step.rows:
+            with timed(step.sql):
+                cur.executemany(step.sql, step.rows)
+            written.append(cur.rowcount)
+        else:
+            written.append(0)
+    return written
+
+
+def step_tables(steps):
+    """
+    Target tables of steps, aligned with rows_written(steps).
+    """
+    tables = []
+    for step in steps:
+        if isinstance(step, LinkedBatch):
+            tables.extend(table_of(sql) for sql in (step.parent_sql, *step.child_sqls))
+        else:
+            tables.append(table_of(step.sql))
+    return tables
+
+
+def rows_written(steps):
+    """
+    Rows a chunk's steps write, as a list aligned with the loader's tables.
+    """
+    counts = []
+    for step in steps:
+        if isinstance(step, LinkedBatch):
+            counts.append(len(step.items))
+            for k in range(len(step.child_sqls)):
+                counts.append(sum(len(children[k]) for _, children in step.items))
+        else:
+            counts.append(len(step.rows))
+    return counts
+
+
+class TouchedKeys:
+    """
+    Keys (first column) of the rows a load committed, per table in
+    TOUCHED_TABLES. Thread-safe.
+    """
+
+    def __init__(self, tables=TOUCHED_TABLES, limit: int=TOUCHED_LIMIT):
+        self._lock = threading.Lock()
+        self.limit = limit
+        self.keys = {table: set() for table in tables}
+        self.overflowed = set()
+
+    def add(self, table, keys):
+        if table not in self.keys:
+            return
+        with self._lock:
+            if table in self.overflowed:
+                return
+            self.keys[table].update(keys)
+            if len(self.keys[table]) > self.limit:
+                self.overflowed.add(table)
+                self.keys[table] = set()
+
+    def get(self, table):
+        """
+        Keys committed to table, or None if they weren't (all) collected.
+        """
+        if table not in self.keys or table in self.overflowed:
+            return None
+        return self.keys[table]
+
+    def discard(self, table):
+        """
+        Give up on the keys of table (some rows of a batch weren't written,
+        and which ones is unknown): what is built from it gets rebuilt.
+        """
+        if table not in self.keys:
+            return
+        with self._lock:
+            self.overflowed.add(table)
+            self.keys[table] = set()
+
+    def merge(self, other):
+        for table, keys in other.keys.items():
+            if table in other.overflowed:
+                self.keys.setdefault(table, set())
+                self.overflowed.add(table)
+            else:
+                self.add(table, keys)
+
+    def report(self):
+        return {table: "overflow" if table in self.overflowed else len(keys)
+                for table, keys in self.keys.items() if keys or table in self.overflowed}
+
+
+# ---------------- transient error handling ----------------
+
+
+def error_code(err):
+    """
+    Server error code of a driver exception (mysql.connector sets .errno,
+    PyMySQL-style drivers put it in args[0]).
+    """
+    code = getattr(err, "errno", None)
+    if code is None and getattr(err, "args", None) and isinstance(err.args[0], int):
+        code = err.args[0]
+    return code
+
+
+def is_transient_error(err):
+    """
+    True if the failed transaction can simply be replayed.
+    """
+    return error_code(err) in TRANSIENT_ERRNOS
+
+
+class TransactionStats:
+    """
+    Thread-safe counters shared by all workers of one load:
+    - retries per table label and error code
+    - transactions that still failed after MAX_RETRIES
+    - metrics: the load's timings and throughput (metrics.LoadMetrics)
+    - touched: keys of the committed rows (TouchedKeys)
+    - sketches: HyperLogLog sketches of the committed rows (SketchSet)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.metrics = LoadMetrics()
+        self.touched = TouchedKeys()
+        self.sketches = SketchSet()
+        self.committed = 0
+        self.commit_seconds = 0.0
+        self.retries = {}      # (label, errno) -> count
+        self.gave_up = {}      # label -> count
+
+    def record_commit(self, label, seconds=0.0):
+        with self._lock:
+            self.committed += 1
+            self.commit_seconds += seconds
+        self.metrics.observe("commit_seconds", seconds)
+
+    def record_steps(self, steps, written=None):
+        """
+        Count the rows of committed steps per target table, collect
+        their keys and add them to the sketches.
+        written: execute_steps' result; if a Batch wrote fewer rows than
+        it had (INSERT IGNORE skipped rows already there, e.g. a re-run),
+        the keys of every table of the steps become unknown
+        (TouchedKeys.discard): the other steps' rows hang off the same
+        keys and may not be new either, so summaries are rebuilt rather
+        than counting those rows twice.
+        """
+        for table, n in zip(step_tables(steps), rows_written(steps)):
+            self.metrics.record_rows(table, n)
+        skipped = written is not None and any(
+            isinstance(step, Batch) and (n is None or n < len(step.rows))
+            for step, n in zip(steps, written)
+        )
+        for step in steps:
+            if isinstance(step, Batch):
+                table, rows = table_of(step.sql), step.rows
+            else:
+                table, rows = table_of(step.parent_sql), [params for params, _ in step.items]
+            if skipped:
+                self.touched.discard(table)
+            self.touched.add(table, (row[0] for row in rows))
+            self.sketches.add_rows(table, rows)
+
+    def commit_latency(self):
+        """
+        (transactions committed, total seconds spent in COMMIT) so far.
+        """
+        with self._lock:
+            return self.committed, self.commit_seconds
+
+    def record_retry(self, label, err):
+        key = (label, error_code(err))
+        with self._lock:
+            self.retries[key] = self.retries.get(key, 0) + 1
+
+    def record_give_up(self, label):
+        with self._lock:
+            self.gave_up[label] = self.gave_up.get(label, 0) + 1
+
+    def report(self):
+        """
+        Transaction section of the run report.
+        """
+        with self._lock:
+            return {
+                "committed": self.committed,
+                "commit_seconds": round(self.commit_seconds, 3),
+                "retries": [
+                    {"label": label, "errno": code, "count": n}
+                    for (label, code), n in sorted(self.retries.items(), key=lambda kv: str(kv[0]))
+                ],
+                "gave_up": dict(sorted(self.gave_up.items())),
+            }
+
+
+def backoff_delay(attempt, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+    """
+    "Full jitter" exponential backoff: uniform in [0, min(max, base * 2^attempt)].
+    Keeps competing threads from re-colliding on the same locks.
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def run_transaction(conn, work, stats=None, label="", max_retries=MAX_RETRIES):
+    """
+    Run work(cur) and commit. On a transient error the transaction is rolled
+    back and work(cur) is replayed with a fresh cursor, so work must rebuild
+    everything it writes from its own inputs.
+    Non-transient errors (and the last transient one) are re-raised.
+    """
+    attempt = 0
+    while True:
+        cur = conn.cursor()
+        try:
+            result = work(cur)
+            commit_start = time.perf_counter()
+            with stats.metrics.stage("commit") if stats is not None else nullcontext():
+                conn.commit()
+            if stats is not None:
+                stats.record_commit(label, time.perf_counter() - commit_start)
+            return result
+        except Exception as err:
+            conn.rollback()
+            if not is_transient_error(err):
+                raise
+            if attempt >= max_retries:
+                if stats is not None:
+                    stats.record_give_up(label)
+                raise
+            if stats is not None:
+                stats.record_retry(label, err)
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+        finally:
+            cur.close()
+
+
+def run_steps(conn, steps, stats=None, label="", batch_size=None):
+    """
+    Write steps through run_transaction.
+    - batch_size=None: all steps in one transaction
+    - batch_size=N:    every N rows of a Batch is its own transaction, so a
+                       deadlock only replays that slice
+    LinkedBatch steps are never split (children need the parents' ids).
+    """
+    metrics = stats.metrics if stats is not None else None
+
+    def transaction(part):
+        written = run_transaction(conn, lambda cur: execute_steps(cur, part, metrics), stats, label)
+        if stats is not None:
+            stats.record_steps(part, written)
+
+    if batch_size is None:
+        transaction(steps)
+        return
+
+    for step in steps:
+        if isinstance(step, LinkedBatch):
+            transaction([step])
+            continue
+        for start in range(0, len(step.rows), batch_size):
+            transaction([Batch(step.sql, step.rows[start:start + batch_size])])
+
+
+# ---------------- chunked, multi-threaded driver ----------------
+
+
+def load_chunks(tsv_path: Path,
+                process_chunk,
+                label,
+                max_workers=None,
+                chunk_size: int=1000,
+                txn_stats=None,
+                row_filter=None):
+    """
+    Read a TSV in chunks of rows and run process_chunk(rows) on worker
+    threads; every in-flight chunk holds its own DB connection.
+
+    - max_workers=None: the number of in-flight chunks is autoscaled
+      (see autoscale.ConcurrencyController); an int fixes it.
+    - Reading blocks while the pool is full, so at most `limit` chunks
+      are held in memory.
+    - row_filter(rows) -> rows, if given, runs on the reading thread in file
+      order before a chunk is submitted (see merge_join.SortedIdStream).
+    - Progress (byte offset, committed rows, ETA, worker states) is printed
+      by progress.ProgressReporter while the load runs.
+    - With profiling.PROFILE on, sampled chunks are profiled, including
+      the reading thread while it reads them (see profiling.ChunkProfiler).
+
+    Returns (results, report):
+      results: process_chunk return values, in completion order
+      report:  run-report dict (rows read, elapsed time, concurrency, retries)
+    """
+    controller = ConcurrencyController.for_max_workers(max_workers, txn_stats)
+    metrics = txn_stats.metrics if txn_stats is not None else LoadMetrics()
+    results = []
+    pending = {}  # future -> number of rows in its chunk
+    started = time.perf_counter()
+    rows_read = 0
+
+    def collect():
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            n_rows = pending.pop(fut)
+            results.append(fut.result())
+            controller.record_rows(n_rows)
+            progress.committed(n_rows)
+        controller.maybe_adjust()
+
+    def run_chunk(chunk, index):
+        metrics.chunk_started()
+        try:
+            return profiler.run(process_chunk, chunk, index)
+        finally:
+            metrics.chunk_finished()
+
+    def submit(chunk):
+        if row_filter is not None:
+            chunk = row_filter(chunk)
+        # waiting for a free worker isn't reading
+        profiler.reading(None)
+        while len(pending) >= controller.limit:
+            collect()
+        pending[executor.submit(run_chunk, chunk, len(results) + len(pending))] = len(chunk)
+        metrics.sample_queue(len(pending))
+        profiler.reading(len(results) + len(pending))
+
+    # binary file underneath, so the byte offset can be read while the
+    # csv reader iterates (text-mode tell() is disabled during iteration)
+    with tsv_path.open("rb") as raw, \
+            io.TextIOWrapper(raw, encoding="utf-8") as f, \
+            ProgressReporter(label, tsv_path, metrics) as progress, \
+            ChunkProfiler(label, metrics) as profiler, \
+            ThreadPoolExecutor(max_workers=controller.max_workers) as executor:
+        reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+        current_chunk = []
+        profiler.reading(0)
+
+        for rows_read, row in enumerate(reader, start=1):
+            current_chunk.append(row)
+
+            if len(current_chunk) >= chunk_size:
+                submit(current_chunk)
+                current_chunk = []
+                progress.queued(rows_read, raw.tell())
+
+        # Submit remaining rows
+        if current_chunk:
+            submit(current_chunk)
+        profiler.reading(None)
+        progress.queued(rows_read, raw.tell())
+
+        while pending:
+            collect()
+
+    report = {
+        "table": label,
+        "source": str(tsv_path),
+        "rows_read": rows_read,
+        "chunks": len(results),
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "concurrency": controller.report(),
+        "metrics": metrics.report(),
+    }
+    if profiler.enabled:
+        report["profile"] = profiler.write()
+    if txn_stats is not None:
+        report["transactions"] = txn_stats.report()
+        report["touched"] = txn_stats.touched
+        report["sketches"] = txn_stats.sketches
+    return results, report
+
+
+def print_report(report):
+    """
+    Human-readable end-of-load summary of a run report.
+    """
+    conc = report["concurrency"]
+    print(f"{report['table']}: {report['rows_read']} rows read in "
+          f"{report['elapsed_seconds']}s ({report['chunks']} chunks)")
+    print(f"Concurrency ({conc['mode']}): final {conc['final_workers']} workers, "
+          f"peak {conc['peak_workers']} (range {conc['min_workers']}-{conc['max_workers']})")
+
+    merge = report.get("merge_join")
+    if merge is not None:
+        print(f"Merge join on {merge['table']}.{merge['column']}: {merge['merged_ids']} ids merged, "
+              f"{merge['point_lookups']} out-of-order ids looked up")
+
+    rejected = report.get("dead_letter")
+    if rejected is not None and rejected["rows"]:
+        print(f"Rejected rows: {rejected['rows']} -> {rejected['file']}")
+        for reason, n in rejected["reasons"].items():
+            print(f"  {reason}: {n}")
+
+    metrics = report.get("metrics")
+    if metrics is not None:
+        print("Metrics:")
+        for table, r in metrics["rows"].items():
+            print(f"  {table}: {r['rows']} rows committed ({r['rows_per_s']} rows/s)")
+        for h in metrics["histograms"]:
+            if h["name"].endswith("_seconds"):
+                where = f"{h['name']}[{h['table']}]" if h["table"] else h["name"]
+                print(f"  {where}: n={h['count']} mean={h['mean']}s p95<={h['p95']}s")
+
+    txn = report.get("transactions")
+    if txn is not None:
+        retried = sum(r["count"] for r in txn["retries"])
+        print(f"Transactions committed: {txn['committed']}, retried: {retried}")
+        for r in txn["retries"]:
+            print(f"  {r['label']}: {r['count']} retries (error {r['errno']})")
+        for label, n in txn["gave_up"].items():
+            print(f"  {label}: {n} transactions failed after {MAX_RETRIES} retries")
@@ -0,0 +1,71 @@
+"""
+Registry of the insert_data_*.py loaders, so that other engines
+(async_loader.py, staging_load.py) can reuse each loader's row builder
+and lookup steps without duplicating them.
+"""
+from typing import NamedTuple
+
+
+class LoaderSpec(NamedTuple):
+    """
+    How to run one insert_data_*.py loader on any engine.
+    - context(module, tsv_path) returns the extra arguments shared by the
+      row builder and the threaded loader, i.e. builder(rows, *ctx),
+      loader(tsv, *ctx)
+    - tables: target tables, parents first
+    - batched: one transaction per module.BATCH_SIZE rows (as the threaded
+      loader does) instead of one per chunk
+    - fill_lookups(module, tsv_path): first pass that fills the loader's
+      lookup tables from the file (None: the loader has none)
+    """
+    module: str
+    builder: str
+    thread_loader: str
+    context: object
+    tables: tuple
+    chunk_size: int
+    batched: bool = False
+    fill_lookups: object = None
+
+
+LOADERS = {
+    "title_basics": LoaderSpec(
+        "insert_data_title_basics", "build_title_basics_steps",
+        "load_title_basics_and_title_genre",
+        lambda m, tsv: m.lookups(),
+        ("title_basics", "title_genre"), 10000,
+        fill_lookups=lambda m, tsv: m.insert(*m.collect_distinct_types_and_genres(tsv))),
+    "name_basics": LoaderSpec(
+        "insert_data_name_basics", "build_name_basics_steps",
+        "load_name_basics_and_bridges",
+        lambda m, tsv: (m.lookups_professions(), m.load_existing_title_ids()),
+        ("name_basics", "person_profession", "name_known_for"), 10000,
+        fill_lookups=lambda m, tsv: m.insert_professions(m.collect_distinct_professions(tsv))),
+    "title_akas": LoaderSpec(
+        "insert_data_title_akas", "build_title_akas_steps",
+        "load_title_akas_and_bridges",
+        lambda m, tsv: (*m.lookup_types_attributes(), m.load_existing_title_ids()),
+        ("title_akas", "title_aka_type", "title_aka_attribute"), 10000,
+        fill_lookups=lambda m, tsv: m.insert_types_attributes(*m.collect_distinct_types_and_attributes(tsv))),
+    "title_principals": LoaderSpec(
+        "insert_data_title_principals", "build_title_principals_steps",
+        "load_title_principals_and_characters_mt",
+        lambda m, tsv: (m.lookup_categories(), m.load_existing_title_ids(), m.load_existing_name_ids()),
+        ("title_principals", "principal_character"), 200,
+        fill_lookups=lambda m, tsv: m.insert_categories(m.collect_distinct_categories(tsv))),
+    "title_crew": LoaderSpec(
+        "insert_data_title_crew", "build_title_crew_steps",
+        "load_title_crew_mt",
+        lambda m, tsv: (m.load_existing_title_ids(), m.load_existing_name_ids()),
+        ("title_director", "title_writer"), 1000, batched=True),
+    "title_episode": LoaderSpec(
+        "insert_data_title_ratings_and_title_episode", "build_title_episode_steps",
+        "load_title_episode_mt",
+        lambda m, tsv: (m.load_existing_title_ids(),),
+        ("title_episode",), 1000, batched=True),
+    "title_ratings": LoaderSpec(
+        "insert_data_title_ratings_and_title_episode", "build_title_ratings_steps",
+        "load_title_ratings_mt",
+        lambda m, tsv: (m.load_existing_title_ids(), m.rating_prior(tsv)),
+        ("title_ratings",), 1000, batched=True),
+}
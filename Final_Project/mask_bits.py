@@ -0,0 +1,93 @@
+"""
+Bit positions of the lookup names behind the bitmask columns.
+
+title_basics.genre_mask (genre_mask.py) and person_roles.category_mask /
+profession_mask (person_roles.py) are BIGINT UNSIGNED: one bit per genre,
+principal category or profession. The bit is not derived from the
+AUTO_INCREMENT id, which keeps growing (gaps from INSERT IGNORE, deleted
+rows, reloads) long after there are more than 64 ids. Each lookup row
+holds its own bit in mask_bit instead:
+
+- assign_mask_bits() gives every row without a bit the lowest free one,
+  in id order, so bits stay dense (0..MAX_BITS - 1) and never move once
+  set; more than MAX_BITS names raise instead of shifting out of the
+  column (MySQL's 1 << 64 is silently 0)
+- mask_bits() reads {name: bit}
+
+Usage:
+    python mask_bits.py          (assign missing bits, print them)
+"""
+from connect_db import *
+
+
+# ---------------- CONFIG ----------------
+
+MAX_BITS = 64   # BIGINT UNSIGNED mask columns
+
+# lookup table -> (id column, name column)
+LOOKUPS = {
+    "genre": ("genre_id", "genre_name"),
+    "principal_category": ("id", "category_name"),
+    "profession": ("id", "profession_name"),
+}
+
+# ----------------------------------------
+
+
+def assign_mask_bits(cur, table):
+    """
+    Give each row of lookup `table` without a mask_bit the lowest free bit.
+    - locks the lookup rows (FOR UPDATE) so concurrent loads can't hand
+      out the same bit; runs in the caller's transaction
+    - returns how many rows got a bit
+    """
+    id_col, _ = LOOKUPS[table]
+    cur.execute(f"SELECT {id_col}, mask_bit FROM {table} ORDER BY {id_col} FOR UPDATE;")
+    rows = cur.fetchall()
+    if len(rows) > MAX_BITS:
+        raise ValueError(f"{table} has {len(rows)} names; the mask columns hold {MAX_BITS} bits")
+
+    used = {bit for _, bit in rows if bit is not None}
+    free = (bit for bit in range(MAX_BITS) if bit not in used)
+    updates = [(next(free), row_id) for row_id, bit in rows if bit is None]
+    if updates:
+        cur.executemany(f"UPDATE {table} SET mask_bit = %s WHERE {id_col} = %s;", updates)
+    return len(updates)
+
+
+def mask_bits(cur, table):
+    """
+    {name: bit} of the rows of lookup `table` that have a bit.
+    """
+    _, name_col = LOOKUPS[table]
+    cur.execute(f"SELECT {name_col}, mask_bit FROM {table} WHERE mask_bit IS NOT NULL;")
+    return dict(cur.fetchall())
+
+
+def bits_mask(bits):
+    """
+    Integer with the given bit positions set.
+    """
+    mask = 0
+    for bit in bits:
+        mask |= 1 << bit
+    return mask
+
+
+def main():
+    conn = connect_db()
+    conn.autocommit = False
+    cur = conn.cursor()
+    for table in LOOKUPS:
+        assigned = assign_mask_bits(cur, table)
+        conn.commit()
+        bits = mask_bits(cur, table)
+        print(f"{table}: {len(bits)} names, {assigned} new bits")
+        for name, bit in sorted(bits.items(), key=lambda item: item[1]):
+            print(f"  {bit:2d}  {name}")
+    cur.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
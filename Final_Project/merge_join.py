@@ -0,0 +1,193 @@
+"""
+Merge-join FK validation for TSVs sorted by tconst.
+
+The IMDb dumps are sorted by their first id column, and so is
+title_basics when it is read in the same order. Instead of holding every
+tconst in a Python set, SortedIdStream walks the title_basics ids page
+by page next to the file and keeps only the rows whose id it meets:
+memory is O(chunk + page), not O(titles).
+
+Only use it for the id the file is sorted by (tconst / titleId). Ids in
+other columns (knownForTitles, parentTconst, nconst in principals) come
+in no particular order and keep using the in-memory sets.
+
+The stream reads the ids in pages of FETCH_SIZE, by keyset
+(WHERE (length, id) >= next id ... LIMIT), in the order of the index on
+the table's generated length column (<column>_len, create_db.py), so no
+page needs a filesort. It starts at the first id of the file, and when
+a page is used up the next one starts at the id it is asked about, not
+after the last id read: a small delta file costs a few pages, not a
+walk over every id up to its largest.
+
+An id that is behind the stream (the file is not perfectly sorted) is
+not lost: it is checked with a point lookup instead, on the stream's
+own connection. Call close() when the load is done (or has failed).
+"""
+from connect_db import connect_db
+from dead_letter import NO_DEAD_LETTER, TITLE_NOT_FOUND
+from loader_pipeline import ALL_IDS
+
+
+# ---------------- CONFIG ----------------
+
+FETCH_SIZE = 10000      # ids per page (one round trip)
+
+# ----------------------------------------
+
+
+def id_key(value):
+    """
+    Sort key matching the IMDb file order: tt9999999 comes before
+    tt10000000, which plain string order gets wrong.
+    """
+    return len(value), value
+
+
+class SortedIdStream:
+    """
+    The ids of table.column, read in id_key order and consumed by a merge
+    join. Only called from the thread that reads the TSV (row_filter of
+    loader_pipeline.load_chunks), so no locking is needed.
+    """
+
+    def __init__(self, table="title_basics", column="tconst", fetch_size: int=FETCH_SIZE):
+        self.table = table
+        self.column = column
+        self.length_column = f"{column}_len"
+        self.fetch_size = fetch_size
+        self.merged = 0          # ids checked by the merge
+        self.looked_up = 0       # ids behind the stream, checked by point lookup
+        self.pages = 0           # pages of ids read
+
+        self._conn = None
+        self._cur = None
+        self._buffer = []
+        self._pos = 0
+        self._started = False
+        self._exhausted = False  # the last page read reached the end of the table
+        self._head = None        # current id of the stream, None when exhausted
+        self._last = None        # id_key of the largest id checked so far
+
+    def _cursor(self):
+        if self._cur is None:
+            self._conn = connect_db()
+            self._cur = self._conn.cursor()
+        return self._cur
+
+    def _fetch(self, start):
+        """
+        The first fetch_size ids from `start` on, in id_key order.
+        """
+        cur = self._cursor()
+        cur.execute(f"""
+            SELECT {self.column} FROM {self.table}
+            WHERE {self.length_column} > %s
+               OR ({self.length_column} = %s AND {self.column} >= %s)
+            ORDER BY {self.length_column}, {self.column}
+            LIMIT %s;
+        """, (len(start), len(start), start, self.fetch_size))
+        self.pages += 1
+        ids = [row[0] for row in cur.fetchall()]
+        self._exhausted = len(ids) < self.fetch_size
+        return ids
+
+    def _advance(self, target):
+        """
+        Move the head to the next id. Past the end of the page, the next
+        page starts at target (the id being looked for, beyond the page):
+        the ids in between are never needed.
+        """
+        self._pos += 1
+        if self._pos < len(self._buffer):
+            self._head = self._buffer[self._pos]
+            return
+        if self._exhausted:
+            self._head = None
+            return
+        self._buffer = self._fetch(target)
+        self._pos = 0
+        self._head = self._buffer[0] if self._buffer else None
+
+    def _lookup(self, ids):
+        cur = self._cursor()
+        placeholders = ", ".join(["%s"] * len(ids))
+        cur.execute(f"SELECT {self.column} FROM {self.table} WHERE {self.column} IN ({placeholders});",
+                    list(ids))
+        return {row[0] for row in cur.fetchall()}
+
+    def present(self, ids):
+        """
+        The subset of ids (one chunk's worth) that exist in the table.
+        The chunk is sorted first, so only ids older than the previous
+        chunk's largest id need a point lookup.
+        """
+        found = set()
+        behind = []
+        for value in sorted(set(ids), key=id_key):
+            key = id_key(value)
+            if self._last is not None and key < self._last:
+                behind.append(value)
+                continue
+            if not self._started:
+                # the stream starts at the first id of the file
+                self._started = True
+                self._pos = -1
+                self._advance(value)
+            while self._head is not None and id_key(self._head) < key:
+                self._advance(value)
+            if self._head == value:
+                found.add(value)
+            self._last = key
+            self.merged += 1
+
+        if behind:
+            self.looked_up += len(behind)
+            found |= self._lookup(behind)
+        return found
+
+    def row_filter(self, column, dead_letter=NO_DEAD_LETTER):
+        """
+        row_filter for load_chunks: drop rows whose `column` id is missing
+        (rows with an empty id are left for the row builder to reject).
+        """
+        def keep_existing(rows):
+            found = self.present(row.get(column) for row in rows if row.get(column))
+            kept = []
+            for row in rows:
+                value = row.get(column)
+                if not value or value in found:
+                    kept.append(row)
+                else:
+                    dead_letter.reject(TITLE_NOT_FOUND, row, value)
+            return kept
+        return keep_existing
+
+    def close(self):
+        if self._cur is not None:
+            self._cur.close()
+            self._conn.close()
+            self._cur = None
+
+    def report(self):
+        """
+        Merge-join section of the run report.
+        """
+        return {
+            "table": self.table,
+            "column": self.column,
+            "merged_ids": self.merged,
+            "point_lookups": self.looked_up,
+            "pages": self.pages,
+        }
+
+
+def title_id_check(existing_title_ids, column, dead_letter=NO_DEAD_LETTER):
+    """
+    Split a loader's title-id check into (row_filter, ids for the row builder):
+    - a set:             (None, the set)       -> builder checks as before
+    - a SortedIdStream:  (merge filter, ALL_IDS) -> rows are filtered while
+                                                   reading, builder keeps all
+    """
+    if isinstance(existing_title_ids, SortedIdStream):
+        return existing_title_ids.row_filter(column, dead_letter), ALL_IDS
+    return None, existing_title_ids
@@ -0,0 +1,306 @@
+"""
+Per-stage timing and throughput metrics for the loaders.
+
+Every load gets a LoadMetrics (as TransactionStats.metrics), filled in by
+the shared pipeline:
+- parse_seconds        row builder time per chunk (build_*_steps)
+- executemany_seconds  per target table
+- commit_seconds       per transaction
+- queue_depth          chunks submitted but not started, sampled at submit
+- in_flight            chunks submitted and not finished, sampled at submit
+- rows committed and rows/sec per target table
+
+LoadMetrics.worker_state says what each worker thread is doing right now
+(parse / write <table> / commit / idle), for progress.ProgressReporter.
+
+write_run_report() saves the run report as JSON, plus the metrics in
+Prometheus text format (for node_exporter's textfile collector or just
+for diffing two runs), and records the finished load in the load_runs
+table; its run_id goes into the report (None, with a warning, if the
+database has no load_runs table).
+"""
+import json
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+from connect_db import *
+
+
+# ---------------- CONFIG ----------------
+
+RUN_REPORT_DIR = Path("run_reports")
+RECORD_LOAD_RUNS = True   # write_run_report adds a load_runs row
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+# ----------------------------------------
+
+# worker_state label of each timed stage
+STAGES = {"parse_seconds": "parse", "executemany_seconds": "write", "commit_seconds": "commit"}
+
+HISTOGRAMS = {
+    # name -> (buckets, help text)
+    "parse_seconds": (LATENCY_BUCKETS, "Row builder time per chunk"),
+    "executemany_seconds": (LATENCY_BUCKETS, "executemany latency per target table"),
+    "commit_seconds": (LATENCY_BUCKETS, "COMMIT latency per transaction"),
+    "queue_depth": (COUNT_BUCKETS, "Chunks waiting for a worker, sampled at submit"),
+    "in_flight": (COUNT_BUCKETS, "Chunks submitted and not finished, sampled at submit"),
+}
+
+
+@lru_cache(maxsize=None)
+def table_of(sql):
+    """
+    Target table of an INSERT statement.
+    """
+    match = re.search(r"INSERT\s+(?:IGNORE\s+)?INTO\s+(\w+)", sql, re.IGNORECASE)
+    return match.group(1) if match else "?"
+
+
+def _bound(value):
+    # JSON has no Infinity
+    return "+Inf" if value == float("inf") else value
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram (Prometheus style). Not locked by itself;
+    LoadMetrics serializes access.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-quantile (None if empty).
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def report(self):
+        cumulative = []
+        seen = 0
+        for bound, n in zip((*self.buckets, "+Inf"), self.counts):
+            seen += n
+            cumulative.append([bound, seen])
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": _bound(self.quantile(0.50)),
+            "p95": _bound(self.quantile(0.95)),
+            "p99": _bound(self.quantile(0.99)),
+            "buckets": cumulative,
+        }
+
+
+class LoadMetrics:
+    """
+    Thread-safe metrics of one load, shared by all its workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}    # (name, table) -> Histogram
+        self._rows = {}          # table -> rows committed
+        self._running = 0        # chunks a worker has started on
+        self.started = time.perf_counter()
+        # thread name -> (state, since); each worker only writes its own
+        # entry, so this needs no lock
+        self.worker_state = {}
+        self.profiler = None     # profiling.ChunkProfiler while profiling
+
+    def observe(self, name, value, table=None):
+        key = (name, table)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(HISTOGRAMS[name][0])
+            hist.observe(value)
+
+    def set_state(self, state):
+        self.worker_state[threading.current_thread().name] = (state, time.perf_counter())
+
+    @contextmanager
+    def stage(self, state):
+        """
+        Mark the calling worker as being in `state`, then back to "busy".
+        """
+        self.set_state(state)
+        try:
+            yield
+        finally:
+            if self.profiler is not None:
+                self.profiler.stage_done(state)
+            self.set_state("busy")
+
+    @contextmanager
+    def timer(self, name, table=None):
+        start = time.perf_counter()
+        state = STAGES.get(name, name)
+        with self.stage(f"{state} {table}" if table else state):
+            try:
+                yield
+            finally:
+                self.observe(name, time.perf_counter() - start, table)
+
+    def record_rows(self, table, n):
+        with self._lock:
+            self._rows[table] = self._rows.get(table, 0) + n
+
+    def rows_committed(self):
+        with self._lock:
+            return dict(self._rows)
+
+    def chunk_started(self):
+        self.set_state("busy")
+        with self._lock:
+            self._running += 1
+
+    def chunk_finished(self):
+        with self._lock:
+            self._running -= 1
+        self.set_state("idle")
+
+    def sample_queue(self, in_flight):
+        """
+        Called by the reading thread right after a submit.
+        """
+        with self._lock:
+            running = self._running
+        self.observe("in_flight", in_flight)
+        self.observe("queue_depth", max(0, in_flight - running))
+
+    def report(self):
+        """
+        Metrics section of the run report.
+        """
+        elapsed = time.perf_counter() - self.started
+        with self._lock:
+            histograms = [
+                {"name": name, "table": table, **hist.report()}
+                for (name, table), hist in sorted(self._histograms.items(), key=lambda kv: str(kv[0]))
+            ]
+            rows = {
+                table: {"rows": n, "rows_per_s": round(n / elapsed, 1) if elapsed else None}
+                for table, n in sorted(self._rows.items())
+            }
+        return {"elapsed_seconds": round(elapsed, 3), "rows": rows, "histograms": histograms}
+
+
+# ---------------- export ----------------
+
+
+def _labels(**labels):
+    inner = ",".join(f'{k}="{v}"' for k, v in labels.items() if v is not None)
+    return "{" + inner + "}"
+
+
+def prometheus_text(report, prefix="imdb_loader"):
+    """
+    The metrics section of a run report in Prometheus text format.
+    """
+    loader = report["table"]
+    metrics = report["metrics"]
+    lines = []
+
+    for name, (_, help_text) in HISTOGRAMS.items():
+        series = [h for h in metrics["histograms"] if h["name"] == name]
+        if not series:
+            continue
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} histogram")
+        for h in series:
+            for bound, n in h["buckets"]:
+                lines.append(f"{prefix}_{name}_bucket{_labels(loader=loader, table=h['table'], le=bound)} {n}")
+            lines.append(f"{prefix}_{name}_sum{_labels(loader=loader, table=h['table'])} {h['sum']}")
+            lines.append(f"{prefix}_{name}_count{_labels(loader=loader, table=h['table'])} {h['count']}")
+
+    lines.append(f"# HELP {prefix}_rows_total Rows committed per target table")
+    lines.append(f"# TYPE {prefix}_rows_total counter")
+    for table, r in metrics["rows"].items():
+        lines.append(f"{prefix}_rows_total{_labels(loader=loader, table=table)} {r['rows']}")
+    lines.append(f"# HELP {prefix}_rows_per_second Rows committed per second over the run")
+    lines.append(f"# TYPE {prefix}_rows_per_second gauge")
+    for table, r in metrics["rows"].items():
+        lines.append(f"{prefix}_rows_per_second{_labels(loader=loader, table=table)} {r['rows_per_s']}")
+    return "\n".join(lines) + "\n"
+
+
+def run_report_path(label, directory: Path=RUN_REPORT_DIR, suffix=".json"):
+    """
+    Where the run report of `label` goes; other per-run artifacts
+    (profiles, ...) are written next to it with their own suffix.
+    """
+    return directory / f"{label}{suffix}"
+
+
+def _json_default(obj):
+    # objects with a report() (e.g. loader_pipeline.TouchedKeys) are
+    # written as their report
+    report = getattr(obj, "report", None)
+    return report() if callable(report) else str(obj)
+
+
+def record_load_run(table, rows_read=None):
+    """
+    Insert a load_runs row for a finished load; returns its run_id, or
+    None if it couldn't be recorded (e.g. a database created before the
+    load_runs table: run create_db.py to add it). The load's data is
+    already committed, so a failure here only warns.
+    """
+    try:
+        conn = connect_db()
+        try:
+            cur = conn.cursor()
+            cur.execute("INSERT INTO load_runs (table_name, rows_read) VALUES (%s, %s);", (table, rows_read))
+            run_id = cur.lastrowid
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+    except Exception as err:
+        print(f"WARNING: load run of {table} not recorded in load_runs: {err}")
+        return None
+    return run_id
+
+
+def write_run_report(report, directory: Path=RUN_REPORT_DIR):
+    """
+    Write <table>.json (the whole report) and, if it has metrics,
+    <table>.prom. Returns the JSON path.
+    """
+    if RECORD_LOAD_RUNS:
+        report["run_id"] = record_load_run(report["table"], report.get("rows_read"))
+    directory.mkdir(parents=True, exist_ok=True)
+    path = run_report_path(report["table"], directory)
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=_json_default)
+    if "metrics" in report:
+        run_report_path(report["table"], directory, ".prom").write_text(
+            prometheus_text(report), encoding="utf-8")
+    print(f"Run report written to {path}")
+    return path
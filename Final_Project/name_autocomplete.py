@@ -0,0 +1,294 @@
+"""
+Person name autocomplete.
+
+name_basics.primaryName has no index usable for prefix search.
+build_name_index() writes a compact, memory-mapped one to NAME_INDEX_DIR:
+
+- keys: the folded name (title_search.fold) and, for names of several
+  words, the name from its 2nd, 3rd ... word on (up to MAX_WORD_STARTS),
+  so "hanks" finds "Tom Hanks"; cut to KEY_BYTES bytes of UTF-8 and
+  sorted, as one fixed-width NumPy bytes array. The names starting with
+  a prefix are then a contiguous range, found with two np.searchsorted
+- popularity of a person: principal credits (title_principals) plus
+  KNOWN_FOR_WEIGHT per name_known_for title
+- a range of at most SCAN_LIMIT keys is ranked on the fly; for every
+  longer one (short prefixes, "j", "john") the TOP_K most popular people
+  were stored at build time (heavy_keys / heavy_top), which makes the
+  sorted keys a trie whose crowded nodes carry their own top list
+
+Lookups are a few binary searches on the mapped arrays plus a bounded
+ranking, microseconds once the pages are cached:
+
+    names = NameIndex.open()
+    names.complete("tom ha", k=5)
+
+The name_basics and title_principals loaders rebuild the index at the end
+of their main() (BUILD_AFTER_LOAD).
+
+Usage:
+    python name_autocomplete.py build
+    python name_autocomplete.py complete "tom ha"
+"""
+import argparse
+import json
+import shutil
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from connect_db import *
+from columnar import decode_id, encode_id
+from title_search import fold
+
+
+# ---------------- CONFIG ----------------
+
+NAME_INDEX_DIR = Path("name_index")
+KEY_BYTES = 32            # bytes of a folded name kept for prefix lookups
+MAX_WORD_STARTS = 3       # keys per name: from its 1st, 2nd, ... word on
+TOP_K = 20                # people stored per crowded prefix
+SCAN_LIMIT = 2048         # longer ranges get a stored top list
+KNOWN_FOR_WEIGHT = 10     # popularity of one name_known_for title, in principal credits
+BUILD_AFTER_LOAD = True   # name_basics / title_principals loaders rebuild the index
+FETCH_SIZE = 100000
+
+# ----------------------------------------
+
+ARRAYS = ("keys", "key_person", "person_nconst", "person_popularity",
+          "name_offsets", "names", "heavy_keys", "heavy_top")
+# sorts after every UTF-8 byte: prefix + _END bounds the range of prefix
+_END = b"\xff"
+
+
+class NameHit(NamedTuple):
+    nconst: str
+    name: str
+    popularity: int
+
+
+def popularity(cur, known_for_weight: int=KNOWN_FOR_WEIGHT):
+    """
+    {nconst: principal credits + known_for_weight * known-for titles}
+    """
+    scores = {}
+    for sql, weight in (
+            ("SELECT nconst, COUNT(1) FROM title_principals GROUP BY nconst;", 1),
+            ("SELECT nconst, COUNT(1) FROM name_known_for GROUP BY nconst;", known_for_weight)):
+        cur.execute(sql)
+        for nconst, n in cur.fetchall():
+            scores[nconst] = scores.get(nconst, 0) + weight * n
+    return scores
+
+
+def name_keys(folded, max_word_starts: int=MAX_WORD_STARTS, key_bytes: int=KEY_BYTES):
+    """
+    The folded name from each of its first max_word_starts words on, as
+    key_bytes-long UTF-8 keys.
+    """
+    words = folded.split(" ")
+    return {" ".join(words[i:]).encode("utf-8")[:key_bytes]
+            for i in range(min(len(words), max_word_starts))}
+
+
+def top_people(key_person, person_popularity, lo, hi, k):
+    """
+    Up to k distinct people of keys[lo:hi], most popular first.
+    """
+    people = np.asarray(key_person[lo:hi])
+    # a person has at most MAX_WORD_STARTS keys in a range
+    n = min(len(people), k * MAX_WORD_STARTS)
+    pop = person_popularity[people]
+    best = np.argpartition(-pop, n - 1)[:n] if n < len(people) else np.arange(len(people))
+    best = best[np.lexsort((people[best], -pop[best]))]
+    _, first = np.unique(people[best], return_index=True)
+    return people[best[np.sort(first)]][:k]
+
+
+def heavy_prefixes(keys, key_person, person_popularity, scan_limit: int=SCAN_LIMIT, k: int=TOP_K):
+    """
+    (prefix, top people) of every key prefix shared by more than
+    scan_limit keys, found by walking down the sorted keys as a trie.
+    """
+    key_bytes = keys.dtype.itemsize
+    heavy = []
+    stack = [(b"", 0, len(keys))]
+    while stack:
+        prefix, lo, hi = stack.pop()
+        if hi - lo <= scan_limit:
+            continue
+        heavy.append((prefix, top_people(key_person, person_popularity, lo, hi, k)))
+        depth = len(prefix)
+        if depth == key_bytes:
+            continue
+        # keys equal to the prefix come first; then one child per next byte
+        i = int(np.searchsorted(keys, prefix, "right")) if keys[lo] == prefix else lo
+        while i < hi:
+            child = keys[i][:depth + 1]
+            if depth + 1 < key_bytes:
+                j = int(np.searchsorted(keys, child + _END, "left"))
+            else:
+                j = int(np.searchsorted(keys, child, "right"))
+            stack.append((child, i, j))
+            i = j
+    heavy.sort(key=lambda h: h[0])
+    return heavy
+
+
+def build_name_index(directory: Path=NAME_INDEX_DIR, key_bytes: int=KEY_BYTES,
+                     scan_limit: int=SCAN_LIMIT, k: int=TOP_K):
+    """
+    Read name_basics and the popularity counts, write the index to
+    directory (built next to it, then swapped in). Returns the number of
+    people indexed.
+    """
+    start = time.perf_counter()
+    conn = connect_db()
+    cur = conn.cursor()
+    scores = popularity(cur)
+    nconsts, names, pops, key_parts, person_parts = [], [], [], [], []
+    cur.execute("SELECT nconst, primaryName FROM name_basics;")
+    while True:
+        rows = cur.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        keys, people = [], []
+        for nconst, name in rows:
+            folded = fold(name or "")
+            if not folded:
+                continue
+            person = len(nconsts)
+            nconsts.append(nconst)
+            names.append(name.encode("utf-8"))
+            pops.append(scores.get(nconst, 0))
+            for key in name_keys(folded, key_bytes=key_bytes):
+                keys.append(key)
+                people.append(person)
+        key_parts.append(np.array(keys, f"S{key_bytes}"))
+        person_parts.append(np.array(people, np.int32))
+    cur.close()
+    conn.close()
+
+    keys = np.concatenate(key_parts) if key_parts else np.empty(0, f"S{key_bytes}")
+    key_person = np.concatenate(person_parts) if person_parts else np.empty(0, np.int32)
+    order = np.lexsort((key_person, keys))
+    keys, key_person = keys[order], key_person[order]
+    person_popularity = np.array(pops, np.int32)
+
+    heavy = heavy_prefixes(keys, key_person, person_popularity, scan_limit, k)
+    heavy_top = np.full((len(heavy), k), -1, np.int32)
+    for row, (_, top) in enumerate(heavy):
+        heavy_top[row, :len(top)] = top
+    lengths = np.fromiter(map(len, names), np.int64, len(names))
+    arrays = {
+        "keys": keys,
+        "key_person": key_person,
+        "person_nconst": np.fromiter(map(encode_id, nconsts), np.int32, len(nconsts)),
+        "person_popularity": person_popularity,
+        "name_offsets": np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+        "names": np.frombuffer(b"".join(names), np.uint8),
+        "heavy_keys": np.array([prefix for prefix, _ in heavy], f"S{key_bytes}"),
+        "heavy_top": heavy_top,
+    }
+
+    staging = directory.with_name(directory.name + ".building")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    for name in ARRAYS:
+        np.save(staging / f"{name}.npy", arrays[name])
+    (staging / "meta.json").write_text(json.dumps({"scan_limit": scan_limit, "top_k": k}), encoding="utf-8")
+    shutil.rmtree(directory, ignore_errors=True)
+    staging.rename(directory)
+    print(f"Built name index: {len(nconsts)} people, {len(keys)} keys, {len(heavy)} stored top lists "
+          f"in {time.perf_counter() - start:.1f}s -> {directory}")
+    return len(nconsts)
+
+
+def build_after_load():
+    if BUILD_AFTER_LOAD:
+        return build_name_index()
+    return None
+
+
+class NameIndex:
+    """
+    Memory-mapped arrays of build_name_index().
+    """
+
+    def __init__(self, arrays, scan_limit, top_k):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.scan_limit = scan_limit
+        self.top_k = top_k
+
+    @classmethod
+    def open(cls, directory: Path=NAME_INDEX_DIR):
+        meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+        # plain ndarray views of the maps: np.memmap's per-index overhead is
+        # most of a lookup's time
+        arrays = {name: np.load(directory / f"{name}.npy", mmap_mode="r").view(np.ndarray) for name in ARRAYS}
+        return cls(arrays, meta["scan_limit"], meta["top_k"])
+
+    def name_of(self, person):
+        return bytes(self.names[self.name_offsets[person]:self.name_offsets[person + 1]]).decode("utf-8")
+
+    def _range(self, prefix):
+        lo = int(np.searchsorted(self.keys, prefix, "left"))
+        if len(prefix) < self.keys.dtype.itemsize:
+            hi = int(np.searchsorted(self.keys, prefix + _END, "left"))
+        else:
+            hi = int(np.searchsorted(self.keys, prefix, "right"))
+        return lo, hi
+
+    def complete(self, query, k=10):
+        """
+        Up to k people with a name (or a later word of it) starting with
+        query, most popular first.
+        """
+        folded = fold(query)
+        if not folded:
+            return []
+        encoded = folded.encode("utf-8")
+        prefix = encoded[:self.keys.dtype.itemsize]
+        cut = len(encoded) > len(prefix)
+        lo, hi = self._range(prefix)
+        if hi - lo > self.scan_limit and k <= self.top_k and not cut:
+            row = int(np.searchsorted(self.heavy_keys, prefix))
+            people = self.heavy_top[row]
+            people = people[people >= 0][:k]
+        else:
+            people = top_people(self.key_person, self.person_popularity, lo, hi, hi - lo if cut else k)
+            if cut:
+                # the keys are cut at KEY_BYTES; check the whole query on the names
+                people = [p for p in people
+                          if encoded in name_keys(fold(self.name_of(p)), key_bytes=len(encoded))][:k]
+        people = np.asarray(people, np.int64)
+        return [NameHit(decode_id("nm", nconst), self.name_of(p), pop) for p, nconst, pop in zip(
+            people.tolist(), self.person_nconst[people].tolist(), self.person_popularity[people].tolist())]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / query the person name autocomplete index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build")
+    complete_cmd = sub.add_parser("complete")
+    complete_cmd.add_argument("query")
+    complete_cmd.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_name_index()
+        return
+
+    index = NameIndex.open()
+    start = time.perf_counter()
+    hits = index.complete(args.query, args.k)
+    seconds = time.perf_counter() - start
+    for hit in hits:
+        print(f"{hit.nconst}  {hit.popularity:6d}  {hit.name}")
+    print(f"{len(hits)} names in {seconds * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+Role bitsets per person, for role intersection queries.
+
+Query 5 of commands.sql (people who both directed and wrote) is two
+IN (SELECT ...) subqueries over title_director and title_writer; the
+same question for principal categories or professions goes through
+title_principals / person_profession. person_roles (create_db.py) keeps
+every role of a person as bits of one row:
+
+    crew_mask        bit 0 director, bit 1 writer   (title_director / title_writer)
+    category_mask    bit principal_category.mask_bit (title_principals)
+    profession_mask  bit profession.mask_bit         (person_profession)
+
+(mask_bit: dense bit per lookup name, see mask_bits.py).
+
+Roles are named "director" / "writer" (crew), "category:<name>" and
+"profession:<name>". An intersection, union or exclusion of roles is
+then one bitwise test per mask column (predicate); query 5 becomes
+
+    SELECT COUNT(1) FROM person_roles WHERE (crew_mask & 3) = 3;
+
+a scan of the narrow idx_pr_crew index. RoleBitmaps.load() reads the
+table once into NumPy arrays for the same tests in memory.
+
+Each mask column is built from its sources with BIT_OR ... GROUP BY
+nconst:
+- rebuild(): the column is reset and recomputed, in one transaction
+  (new category / profession names get their mask_bit first)
+- merge(deltas): after a delta load, only the rows of the changed keys
+  are read and OR-ed into the masks (loads only add roles)
+The crew, principals and name_basics loaders call
+build_after_load(tables, touched) at the end of their main(); a column
+is merged if the keys of all its changed sources were collected
+(loader_pipeline.TouchedKeys), rebuilt otherwise.
+
+Usage:
+    python person_roles.py build [--only crew category profession]
+    python person_roles.py count --all director writer
+    python person_roles.py count --any category:actor category:actress --none profession:director
+    python person_roles.py roles
+"""
+import argparse
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+from connect_db import *
+from columnar import decode_id, read_columns
+from mask_bits import assign_mask_bits, mask_bits
+
+
+# ---------------- CONFIG ----------------
+
+BUILD_AFTER_LOAD = True   # crew / principals / name_basics loaders update person_roles
+DELTA_BATCH_SIZE = 5000   # changed keys staged per executemany
+
+# ----------------------------------------
+
+CREW_ROLES = {"director": 1, "writer": 2}
+
+
+class RoleMask(NamedTuple):
+    """
+    - sources: tables the column is computed from
+    - key: column of the sources matched against the delta keys
+    - select: SELECT nconst, mask; {where} is "" or an AND on `key`
+    - lookup: lookup table of the role names (mask_bits.LOOKUPS), or None
+    """
+    column: str
+    sources: tuple
+    key: str
+    select: str
+    lookup: object = None
+
+
+MASKS = {
+    "crew": RoleMask(
+        "crew_mask", ("title_director", "title_writer"), "tconst",
+        """
+        SELECT c.nconst, BIT_OR(c.bit)
+        FROM (
+            SELECT nconst, 1 AS bit FROM title_director WHERE nconst IS NOT NULL {where}
+            UNION ALL
+            SELECT nconst, 2 AS bit FROM title_writer WHERE nconst IS NOT NULL {where}
+        ) AS c
+        GROUP BY c.nconst
+        """),
+    "category": RoleMask(
+        "category_mask", ("title_principals",), "tconst",
+        """
+        SELECT tp.nconst, BIT_OR(1 << pc.mask_bit)
+        FROM title_principals AS tp
+        INNER JOIN principal_category AS pc
+            ON pc.id = tp.category_id
+        WHERE pc.mask_bit IS NOT NULL {where}
+        GROUP BY tp.nconst
+        """, "principal_category"),
+    "profession": RoleMask(
+        "profession_mask", ("person_profession",), "nconst",
+        """
+        SELECT pp.nconst, BIT_OR(1 << p.mask_bit)
+        FROM person_profession AS pp
+        INNER JOIN profession AS p
+            ON p.id = pp.profession_id
+        WHERE p.mask_bit IS NOT NULL {where}
+        GROUP BY pp.nconst
+        """, "profession"),
+}
+
+DELTA_KEYS_TABLE = "person_roles_delta_keys"
+
+
+def role_names(cur):
+    """
+    {role name: (mask column, bit)} of every role.
+    """
+    roles = {name: ("crew_mask", bit) for name, bit in CREW_ROLES.items()}
+    for kind, mask in MASKS.items():
+        if mask.lookup is None:
+            continue
+        for name, bit in mask_bits(cur, mask.lookup).items():
+            roles[f"{kind}:{name}"] = (mask.column, 1 << bit)
+    return roles
+
+
+def _roles(roles, names):
+    unknown = [n for n in names if n not in roles]
+    if unknown:
+        raise KeyError(f"unknown role(s): {', '.join(unknown)}")
+    return [roles[n] for n in names]
+
+
+def _masks(roles, names):
+    """
+    {mask column: OR of the bits of names}
+    """
+    masks = {}
+    for column, bits in _roles(roles, names):
+        masks[column] = masks.get(column, 0) | bits
+    return masks
+
+
+def predicate(roles, all_of=(), any_of=(), none_of=(), alias="pr"):
+    """
+    (SQL condition, params) on person_roles AS alias: every role of
+    all_of, at least one of any_of, none of none_of.
+    """
+    conditions, params = [], []
+    for column, m in _masks(roles, all_of).items():
+        conditions.append(f"({alias}.{column} & %s) = %s")
+        params += [m, m]
+    if any_of:
+        masks = _masks(roles, any_of)
+        conditions.append("(" + " OR ".join(f"({alias}.{column} & %s) <> 0" for column in masks) + ")")
+        params += list(masks.values())
+    for column, m in _masks(roles, none_of).items():
+        conditions.append(f"({alias}.{column} & %s) = 0")
+        params.append(m)
+    return " AND ".join(conditions) or "1 = 1", params
+
+
+def count_people(cur, all_of=(), any_of=(), none_of=()):
+    where, params = predicate(role_names(cur), all_of, any_of, none_of)
+    cur.execute(f"SELECT COUNT(1) FROM person_roles AS pr WHERE {where};", params)
+    return cur.fetchone()[0]
+
+
+def _upsert_sql(mask, where="", merge=False):
+    update = f"{mask.column} | VALUES({mask.column})" if merge else f"VALUES({mask.column})"
+    return (f"INSERT INTO person_roles (nconst, {mask.column}) {mask.select.format(where=where)} "
+            f"ON DUPLICATE KEY UPDATE {mask.column} = {update}")
+
+
+DELETE_EMPTY_SQL = """
+    DELETE FROM person_roles
+    WHERE crew_mask = 0 AND category_mask = 0 AND profession_mask = 0;
+"""
+
+
+def rebuild(kinds=None):
+    """
+    Recompute the given mask columns (default: all) from their sources,
+    one transaction each. Returns {kind: seconds}.
+    """
+    timings = {}
+    conn = connect_db()
+    conn.autocommit = False
+    cur = conn.cursor()
+    try:
+        for kind in kinds or MASKS:
+            start = time.perf_counter()
+            mask = MASKS[kind]
+            if mask.lookup is not None:
+                assign_mask_bits(cur, mask.lookup)
+            cur.execute(f"UPDATE person_roles SET {mask.column} = 0;")
+            cur.execute(_upsert_sql(mask))
+            cur.execute(DELETE_EMPTY_SQL)
+            conn.commit()
+            timings[kind] = time.perf_counter() - start
+            print(f"Rebuilt person_roles.{mask.column} in {timings[kind]:.2f}s")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    return timings
+
+
+def merge(deltas, batch_size: int=DELTA_BATCH_SIZE):
+    """
+    OR the roles of the changed keys into person_roles:
+    deltas = {kind: keys of its `key` column}, one transaction per kind.
+    Returns {kind: seconds}.
+    """
+    timings = {}
+    conn = connect_db()
+    conn.autocommit = False
+    cur = conn.cursor()
+    try:
+        cur.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {DELTA_KEYS_TABLE} "
+                    f"(k VARCHAR(12) NOT NULL PRIMARY KEY);")
+        for kind, keys in deltas.items():
+            start = time.perf_counter()
+            mask = MASKS[kind]
+            if mask.lookup is not None:
+                assign_mask_bits(cur, mask.lookup)
+            cur.execute(f"DELETE FROM {DELTA_KEYS_TABLE};")
+            keys = sorted(keys)
+            for i in range(0, len(keys), batch_size):
+                cur.executemany(f"INSERT INTO {DELTA_KEYS_TABLE} (k) VALUES (%s);",
+                                [(k,) for k in keys[i:i + batch_size]])
+            cur.execute(_upsert_sql(mask, f"AND {mask.key} IN (SELECT k FROM {DELTA_KEYS_TABLE})", merge=True))
+            conn.commit()
+            timings[kind] = time.perf_counter() - start
+            print(f"Merged {len(keys)} changed keys into person_roles.{mask.column} "
+                  f"in {timings[kind]:.2f}s")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    return timings
+
+
+def build_after_load(loaded_tables, touched=None):
+    """
+    Bring the mask columns computed from any of loaded_tables up to date:
+    merged from the committed keys in touched where all of them were
+    collected, otherwise rebuilt.
+    """
+    if not BUILD_AFTER_LOAD:
+        return {}
+    rebuilt = []
+    deltas = {}
+    for kind, mask in MASKS.items():
+        changed = [t for t in mask.sources if t in loaded_tables]
+        if not changed:
+            continue
+        keys = [touched.get(t) for t in changed] if touched is not None else [None]
+        if any(k is None for k in keys):
+            rebuilt.append(kind)
+        else:
+            deltas[kind] = set().union(*keys)
+    timings = rebuild(rebuilt) if rebuilt else {}
+    if deltas:
+        timings.update(merge(deltas))
+    return timings
+
+
+class RoleBitmaps:
+    """
+    person_roles in memory: nconst ids and one uint64 array per mask
+    column, for role tests without a query.
+    """
+
+    def __init__(self, nconst, masks, roles):
+        self.nconst = nconst
+        self.masks = masks
+        self.roles = roles
+
+    @classmethod
+    def load(cls):
+        conn = connect_db()
+        cur = conn.cursor()
+        roles = role_names(cur)
+        columns = [mask.column for mask in MASKS.values()]
+        nconst, *masks = read_columns(
+            cur, f"SELECT nconst, {', '.join(columns)} FROM person_roles ORDER BY nconst;",
+            (None, *[np.dtype(np.uint64)] * len(columns)))
+        cur.close()
+        conn.close()
+        return cls(nconst, dict(zip(columns, masks)), roles)
+
+    def select(self, all_of=(), any_of=(), none_of=()):
+        """
+        Boolean array over the people, same filter as predicate().
+        """
+        selected = np.ones(len(self.nconst), bool)
+        for column, m in _masks(self.roles, all_of).items():
+            m = np.uint64(m)
+            selected &= (self.masks[column] & m) == m
+        if any_of:
+            hit = np.zeros(len(self.nconst), bool)
+            for column, m in _masks(self.roles, any_of).items():
+                hit |= (self.masks[column] & np.uint64(m)) != 0
+            selected &= hit
+        for column, m in _masks(self.roles, none_of).items():
+            selected &= (self.masks[column] & np.uint64(m)) == 0
+        return selected
+
+    def count(self, all_of=(), any_of=(), none_of=()):
+        return int(np.count_nonzero(self.select(all_of, any_of, none_of)))
+
+    def people(self, all_of=(), any_of=(), none_of=(), limit=None):
+        ids = self.nconst[self.select(all_of, any_of, none_of)][:limit]
+        return [decode_id("nm", n) for n in ids.tolist()]
+
+    def role_counts(self):
+        """
+        {role name: people with the role}
+        """
+        return {name: int(np.count_nonzero(self.masks[column] & np.uint64(bit)))
+                for name, (column, bit) in self.roles.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / query the person_roles bitsets.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build")
+    build_cmd.add_argument("--only", nargs="+", choices=list(MASKS))
+    count_cmd = sub.add_parser("count", help="people with a role combination")
+    count_cmd.add_argument("--all", nargs="+", default=(), metavar="ROLE")
+    count_cmd.add_argument("--any", nargs="+", default=(), metavar="ROLE")
+    count_cmd.add_argument("--none", nargs="+", default=(), metavar="ROLE")
+    sub.add_parser("roles", help="people per role")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        rebuild(args.only)
+        return
+
+    if args.command == "roles":
+        for name, n in sorted(RoleBitmaps.load().role_counts().items()):
+            print(f"{n:10d}  {name}")
+        return
+
+    conn = connect_db()
+    cur = conn.cursor()
+    start = time.perf_counter()
+    n = count_people(cur, args.all, args.any, args.none)
+    seconds = time.perf_counter() - start
+    cur.close()
+    conn.close()
+    print(f"{n} people ({seconds * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
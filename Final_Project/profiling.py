@@ -0,0 +1,214 @@
+"""
+Sampled profiling of loader chunks.
+
+With PROFILE = True, every PROFILE_EVERY-th chunk of a load runs under:
+- a stack sampler: a background thread reads the worker's stack every
+  SAMPLE_INTERVAL seconds (sys._current_frames), tagged with the worker's
+  current stage (parse / write <table> / commit, see metrics.STAGES).
+  The reading thread of loader_pipeline.load_chunks is sampled too, as
+  stage "read", while it reads (CSV parsing) and filters (row_filter)
+  a sampled chunk.
+- tracemalloc: started for the sampled chunk; the traced memory
+  counters (get_traced_memory) are read at the end of each stage, and
+  one snapshot per chunk is taken at the end of SNAPSHOT_STAGE, so the
+  top allocation sites are what that stage still holds (tracemalloc is
+  process-wide, so other threads' allocations made meanwhile are
+  included too)
+
+The other chunks run untouched, so the load keeps its normal speed.
+Output, next to the run report (metrics.RUN_REPORT_DIR):
+- <table>.folded       folded stacks for flamegraph.pl / speedscope
+- <table>.allocations  traced memory growth per stage, top allocation
+                       sites at the end of SNAPSHOT_STAGE
+"""
+import os
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+
+from metrics import run_report_path
+
+
+# ---------------- CONFIG ----------------
+
+PROFILE = False
+PROFILE_EVERY = 50          # profile one chunk in this many
+SAMPLE_INTERVAL = 0.001     # seconds between stack samples
+TOP_ALLOCATIONS = 20        # allocation sites kept per snapshot
+SNAPSHOT_STAGE = "parse"    # stage whose end is snapshotted, once per sampled chunk
+
+# ----------------------------------------
+
+READ_STAGE = "read"
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def folded_stack(frame):
+    """
+    Stack of frame, outermost first, as "a;b;c".
+    """
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class ChunkProfiler:
+    """
+    Profiles sampled chunks of one load. Use as a context manager around
+    the load, call run(process_chunk, chunk, index) from the workers and
+    reading(index) from the reading thread.
+    """
+
+    def __init__(self, label, metrics, every: int=None, enabled: bool=None):
+        self.label = label
+        self.metrics = metrics
+        self.every = PROFILE_EVERY if every is None else every
+        self.enabled = PROFILE if enabled is None else enabled
+
+        self.sampled_chunks = 0
+        self.stacks = Counter()        # "label;stage;frames..." -> samples (sampler thread only)
+        self.allocations = Counter()   # (file, line) -> bytes, at the end of SNAPSHOT_STAGE
+        self.memory = Counter()        # stage -> traced memory growth (bytes)
+        self.stage_counts = Counter()  # stage -> stages ended in sampled chunks
+        self._threads = {}             # thread ident -> thread name, of sampled chunks
+        self._marks = {}               # thread ident -> traced memory at its last stage end
+        self._snapshotted = set()      # idents whose chunk has its snapshot
+        self._snapshotting = set()     # idents inside stage_done (not sampled)
+        self._reader = None            # ident of the reading thread, while on a sampled chunk
+        self._lock = threading.Lock()
+        self._tracing = 0              # sampled chunks currently using tracemalloc
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"profiler-{label}", daemon=True)
+
+    def __enter__(self):
+        if self.enabled:
+            self.metrics.profiler = self
+            self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.enabled:
+            self._stop.set()
+            self._sampler.join()
+            self.metrics.profiler = None
+
+    def run(self, process_chunk, chunk, index):
+        """
+        process_chunk(chunk), profiled if this is a sampled chunk.
+        """
+        if not self.enabled or index % self.every:
+            return process_chunk(chunk)
+
+        thread = threading.current_thread()
+        with self._lock:
+            self.sampled_chunks += 1
+            if self._tracing == 0:
+                tracemalloc.start()
+            self._tracing += 1
+        self._marks[thread.ident] = tracemalloc.get_traced_memory()[0]
+        self._threads[thread.ident] = thread.name
+        try:
+            return process_chunk(chunk)
+        finally:
+            self._threads.pop(thread.ident, None)
+            self._marks.pop(thread.ident, None)
+            self._snapshotted.discard(thread.ident)
+            with self._lock:
+                self._tracing -= 1
+                if self._tracing == 0:
+                    tracemalloc.stop()
+
+    def reading(self, index):
+        """
+        Called by the reading thread before it reads chunk `index` (None:
+        done reading); its stack is sampled while the chunk is sampled.
+        """
+        if self.enabled:
+            sampled = index is not None and index % self.every == 0
+            self._reader = threading.get_ident() if sampled else None
+
+    def stage_done(self, stage):
+        """
+        Called by metrics.LoadMetrics.stage when a worker leaves a stage.
+        """
+        ident = threading.get_ident()
+        if ident not in self._threads or not tracemalloc.is_tracing():
+            return
+        stage = stage.split(" ")[0]
+        current = tracemalloc.get_traced_memory()[0]
+        growth = current - self._marks.get(ident, current)
+        self._marks[ident] = current
+        with self._lock:
+            self.memory[stage] += growth
+            self.stage_counts[stage] += 1
+        if stage != SNAPSHOT_STAGE or ident in self._snapshotted:
+            return
+
+        self._snapshotted.add(ident)
+        self._snapshotting.add(ident)
+        try:
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ])
+            stats = snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+        finally:
+            self._snapshotting.discard(ident)
+        with self._lock:
+            for stat in stats:
+                frame = stat.traceback[0]
+                self.allocations[(frame.filename, frame.lineno)] += stat.size
+
+    def _sample_loop(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            reader = self._reader
+            if not self._threads and reader is None:
+                continue
+            frames = sys._current_frames()
+            for ident, name in list(self._threads.items()):
+                frame = frames.get(ident)
+                if frame is None or ident in self._snapshotting:
+                    continue
+                state = self.metrics.worker_state.get(name, ("busy", 0))[0]
+                self.stacks[f"{self.label};{state};{folded_stack(frame)}"] += 1
+            frame = frames.get(reader) if reader is not None else None
+            if frame is not None:
+                self.stacks[f"{self.label};{READ_STAGE};{folded_stack(frame)}"] += 1
+
+    def write(self):
+        """
+        Write the folded stacks and allocation sites; returns the profile
+        section of the run report.
+        """
+        folded_path = run_report_path(self.label, suffix=".folded")
+        alloc_path = run_report_path(self.label, suffix=".allocations")
+        folded_path.parent.mkdir(parents=True, exist_ok=True)
+
+        with folded_path.open("w", encoding="utf-8") as f:
+            for stack, n in self.stacks.most_common():
+                f.write(f"{stack} {n}\n")
+
+        with alloc_path.open("w", encoding="utf-8") as f:
+            f.write(f"Traced memory growth per stage, summed over "
+                    f"{self.sampled_chunks} sampled chunks\n")
+            for stage, growth in sorted(self.memory.items()):
+                f.write(f"{growth / 1024:12.1f} KiB  {stage} ({self.stage_counts[stage]} stages)\n")
+            f.write(f"\n== top allocation sites at the end of {SNAPSHOT_STAGE} ==\n")
+            for (filename, lineno), size in self.allocations.most_common(TOP_ALLOCATIONS):
+                f.write(f"{size / 1024:12.1f} KiB  {filename}:{lineno}\n")
+
+        print(f"Profile of {self.sampled_chunks} chunks written to {folded_path} and {alloc_path}")
+        return {
+            "sampled_chunks": self.sampled_chunks,
+            "every": self.every,
+            "stack_samples": sum(self.stacks.values()),
+            "folded": str(folded_path),
+            "allocations": str(alloc_path),
+        }
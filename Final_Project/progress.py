@@ -0,0 +1,116 @@
+"""
+Live progress for the chunked loaders.
+
+ProgressReporter prints one line every PROGRESS_INTERVAL seconds from its
+own thread:
+
+    title_principals: 41.2% of 3.6 GB | 37200000 queued, 36950000 committed
+    (lag 250000) | 118000 rows/s | ETA 0:12:31 | workers: 9 write, 3 commit,
+    2 parse, 2 idle
+
+- progress is the byte offset of the TSV reader, scaled by the share of
+  queued rows that are already committed (so the ETA is for durable rows)
+- worker states come from LoadMetrics.worker_state; a worker that has
+  been in the same state for STUCK_AFTER seconds is listed by name
+
+Nothing here takes a lock: the reading thread is the only writer of the
+row / byte counters, and every worker only writes its own worker_state
+entry.
+"""
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+
+# ---------------- CONFIG ----------------
+
+SHOW_PROGRESS = True
+PROGRESS_INTERVAL = 10.0    # seconds between progress lines
+STUCK_AFTER = 60.0          # seconds in one state before a worker is called out
+
+# ----------------------------------------
+
+
+def _size(n_bytes):
+    for unit in ("B", "KB", "MB"):
+        if n_bytes < 1024:
+            return f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.1f} GB"
+
+
+class ProgressReporter:
+    """
+    Context manager around one load. The reading thread calls queued()
+    and committed(); everything else happens on the reporter's thread.
+    """
+
+    def __init__(self, label, tsv_path: Path, metrics, interval: float=PROGRESS_INTERVAL):
+        self.label = label
+        self.total_bytes = tsv_path.stat().st_size
+        self.metrics = metrics
+        self.interval = interval
+
+        # written by the reading thread only
+        self.bytes_read = 0
+        self.rows_queued = 0
+        self.rows_committed = 0
+
+        self.started = time.perf_counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"progress-{label}", daemon=True)
+
+    def queued(self, rows_read, bytes_read):
+        self.rows_queued = rows_read
+        self.bytes_read = bytes_read
+
+    def committed(self, n_rows):
+        self.rows_committed += n_rows
+
+    def __enter__(self):
+        if SHOW_PROGRESS:
+            self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+            print(self.line())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            print(self.line())
+
+    def line(self):
+        now = time.perf_counter()
+        elapsed = now - self.started
+        queued, committed, bytes_read = self.rows_queued, self.rows_committed, self.bytes_read
+
+        # bytes whose rows are committed, assuming rows are about the same size
+        done_bytes = bytes_read * committed / queued if queued else 0
+        share = done_bytes / self.total_bytes if self.total_bytes else 0.0
+        rate = committed / elapsed if elapsed else 0.0
+        if share >= 1.0:
+            eta = "done"
+        elif done_bytes:
+            eta = str(timedelta(seconds=int(elapsed * (self.total_bytes - done_bytes) / done_bytes)))
+        else:
+            eta = "?"
+
+        return (f"{self.label}: {share:.1%} of {_size(self.total_bytes)} | "
+                f"{queued} queued, {committed} committed (lag {queued - committed}) | "
+                f"{rate:.0f} rows/s | ETA {eta} | workers: {self.workers(now)}")
+
+    def workers(self, now):
+        counts = {}
+        stuck = []
+        for worker, (state, since) in list(self.metrics.worker_state.items()):
+            counts[state] = counts.get(state, 0) + 1
+            if state != "idle" and now - since > STUCK_AFTER:
+                stuck.append(f"{worker} in {state} for {now - since:.0f}s")
+        summary = ", ".join(f"{n} {state}" for state, n in sorted(counts.items())) or "none yet"
+        if stuck:
+            summary += " | possibly stuck: " + "; ".join(stuck)
+        return summary
@@ -0,0 +1,290 @@
+"""
+Query workload benchmark for commands.sql.
+
+commands.sql is split into named queries at its "# <n>." comments
+(query_1 ... query_7); CREATE INDEX statements in a section are index
+DDL, not part of the workload. Each query is then run, per schema/index
+variant:
+- cold: its first execution, on a fresh connection right after the
+  variant's indexes were built (MySQL keeps no result cache, but the
+  buffer pool may still hold pages of earlier variants)
+- warm: WARMUP executions, then WARM_RUNS timed executions on each of
+  `concurrency` threads, one connection per thread
+
+and reported as p50 / p95 / p99 latency and QPS. EXPLAIN ANALYZE of
+every query is saved per variant. With --summaries, queries 3, 4, 6
+and 7 read the summary tables of summaries.py instead (refresh them
+first). Variants (VARIANTS) are lists of index DDL built before and
+dropped after their run; "commands_sql" is the indexes of commands.sql
+itself. Indexes that already exist are left alone (and not dropped),
+so "none" is only index-free on a database without them.
+
+Output, in metrics.RUN_REPORT_DIR:
+- queries_<variant>.json        latencies / QPS per query
+- queries_<variant>.plans.txt   EXPLAIN ANALYZE per query
+
+Usage:
+    python query_benchmark.py --variants none commands_sql --concurrency 4
+"""
+import argparse
+import json
+import math
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from connect_db import *
+from loader_pipeline import error_code
+from metrics import run_report_path
+
+
+# ---------------- CONFIG ----------------
+
+COMMANDS_SQL = Path(__file__).with_name("commands.sql")
+WARMUP = 1          # untimed executions per thread before the warm runs
+WARM_RUNS = 5       # timed executions per thread
+CONCURRENCY = 1
+PLAN_PREFIX = "EXPLAIN ANALYZE "
+
+VARIANTS = {
+    "none": [],
+    "commands_sql": None,   # the CREATE INDEX statements of commands.sql
+    "ratings_votes": [
+        "CREATE INDEX idx_title_ratings_votes_rating ON title_ratings (numVotes, averageRating)",
+    ],
+}
+
+# ----------------------------------------
+
+# 1061: ER_DUP_KEYNAME
+DUPLICATE_INDEX_ERRNOS = {1061}
+
+_SECTION = re.compile(r"^#\s*(\d+)\.\s*$", re.MULTILINE)
+_CREATE_INDEX = re.compile(r"CREATE\s+INDEX\s+(\w+)\s+ON\s+(\w+)", re.IGNORECASE)
+
+
+def parse_commands(path: Path=COMMANDS_SQL):
+    """
+    ({query name: SQL}, [index DDL]) from commands.sql.
+    """
+    text = path.read_text(encoding="utf-8")
+    queries = {}
+    indexes = []
+    parts = _SECTION.split(text)
+    # parts = [preamble, "1", section 1, "2", section 2, ...]
+    for number, section in zip(parts[1::2], parts[2::2]):
+        statements = [s.strip() for s in section.split(";") if s.strip()]
+        for sql in statements:
+            if _CREATE_INDEX.match(sql):
+                indexes.append(sql)
+            else:
+                queries.setdefault(f"query_{number}", sql)
+    return queries, indexes
+
+
+def percentile(sorted_values, q):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(len(sorted_values) * q))
+    return sorted_values[rank - 1]
+
+
+def latency_report(latencies, wall_seconds):
+    latencies = sorted(latencies)
+    return {
+        "runs": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "qps": round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+    }
+
+
+def timed(cur, sql):
+    start = time.perf_counter()
+    cur.execute(sql)
+    rows = cur.fetchall()
+    return time.perf_counter() - start, len(rows)
+
+
+# ---------------- variants ----------------
+
+
+def build_indexes(ddl):
+    """
+    Run the variant's CREATE INDEX statements; returns the DROP INDEX
+    statements for the ones it created.
+    """
+    drops = []
+    conn = connect_db()
+    cur = conn.cursor()
+    for sql in ddl:
+        name, table = _CREATE_INDEX.match(sql).groups()
+        try:
+            cur.execute(sql)
+        except Exception as e:
+            if error_code(e) in DUPLICATE_INDEX_ERRNOS or "already exists" in str(e):
+                print(f"  index {name} already exists, keeping it")
+                continue
+            raise
+        print(f"  built index {name} on {table}")
+        drops.append(f"DROP INDEX {name} ON {table}")
+    conn.commit()
+    cur.close()
+    conn.close()
+    return drops
+
+
+def drop_indexes(drops):
+    conn = connect_db()
+    cur = conn.cursor()
+    for sql in drops:
+        cur.execute(sql)
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+# ---------------- runs ----------------
+
+
+def explain(cur, sql, plan_prefix=PLAN_PREFIX):
+    cur.execute(plan_prefix + sql)
+    return "\n".join(" | ".join(str(v) for v in row) for row in cur.fetchall())
+
+
+def run_cold(queries):
+    """
+    First execution of every query on one fresh connection.
+    """
+    conn = connect_db()
+    cur = conn.cursor()
+    cold = {}
+    for name, sql in queries.items():
+        seconds, n_rows = timed(cur, sql)
+        cold[name] = {"ms": round(seconds * 1000, 3), "rows": n_rows}
+    cur.close()
+    conn.close()
+    return cold
+
+
+def run_warm(sql, concurrency: int=CONCURRENCY, warmup: int=WARMUP, runs: int=WARM_RUNS):
+    """
+    `runs` timed executions of sql on each of `concurrency` threads, which
+    start timing together once all of them are warmed up.
+    """
+    latencies = []
+    lock = threading.Lock()
+    ready = threading.Barrier(concurrency)
+
+    def worker():
+        conn = connect_db()
+        cur = conn.cursor()
+        try:
+            for _ in range(warmup):
+                timed(cur, sql)
+            ready.wait()
+            mine = [timed(cur, sql)[0] for _ in range(runs)]
+        finally:
+            cur.close()
+            conn.close()
+        with lock:
+            latencies.extend(mine)
+        return sum(mine)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(worker) for _ in range(concurrency)]
+        busiest = max(future.result() for future in futures)
+    # the slowest thread's timed runs span the timed phase
+    return latency_report(latencies, busiest)
+
+
+def benchmark_variant(variant, queries, indexes, concurrency: int=CONCURRENCY,
+                      warm_runs: int=WARM_RUNS, plans=True):
+    """
+    Build the variant's indexes, run the workload, save the plans and
+    results, drop the indexes again. Returns the variant report.
+    """
+    ddl = indexes if VARIANTS[variant] is None else VARIANTS[variant]
+    print(f"==== variant {variant} ====")
+    label = f"queries_{variant}"
+    drops = build_indexes(ddl)
+    try:
+        cold = run_cold(queries)
+        report = {"variant": variant, "indexes": ddl,
+                  "concurrency": concurrency, "warm_runs": warm_runs, "queries": {}}
+        for name, sql in queries.items():
+            warm = run_warm(sql, concurrency, runs=warm_runs)
+            report["queries"][name] = {"cold_ms": cold[name]["ms"], "rows": cold[name]["rows"], **warm}
+            print(f"  {name}: cold {cold[name]['ms']:.1f} ms | warm p50 {warm['p50_ms']:.1f} "
+                  f"p95 {warm['p95_ms']:.1f} p99 {warm['p99_ms']:.1f} ms | {warm['qps']} qps")
+
+        if plans:
+            conn = connect_db()
+            cur = conn.cursor()
+            plan_path = run_report_path(label, suffix=".plans.txt")
+            plan_path.parent.mkdir(parents=True, exist_ok=True)
+            with plan_path.open("w", encoding="utf-8") as f:
+                for name, sql in queries.items():
+                    f.write(f"==== {name} ====\n{explain(cur, sql)}\n\n")
+            cur.close()
+            conn.close()
+            report["plans"] = str(plan_path)
+    finally:
+        drop_indexes(drops)
+
+    path = run_report_path(label)
+    path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Query report written to {path}")
+    return report
+
+
+def print_comparison(reports):
+    """
+    Warm p50 of every query per variant, with the speedup over the first.
+    """
+    if len(reports) < 2:
+        return
+    base = reports[0]
+    print("Warm p50 (ms) by variant, speedup vs. " + base["variant"] + ":")
+    print("  " + f"{'query':10s}" + "".join(f"{r['variant']:>22s}" for r in reports))
+    for name, q in base["queries"].items():
+        cells = []
+        for r in reports:
+            p50 = r["queries"][name]["p50_ms"]
+            speedup = q["p50_ms"] / p50 if p50 else float("inf")
+            cells.append(f"{p50:>12.1f} ({speedup:5.2f}x)")
+        print("  " + f"{name:10s}" + "".join(f"{c:>22s}" for c in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the commands.sql queries.")
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=["none"])
+    parser.add_argument("--queries", nargs="+", help="only these (query_1 ... query_7)")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--runs", type=int, default=WARM_RUNS)
+    parser.add_argument("--no-plans", action="store_true")
+    parser.add_argument("--summaries", action="store_true",
+                        help="answer queries 3, 4, 6, 7 from the summary tables")
+    args = parser.parse_args()
+
+    queries, indexes = parse_commands()
+    if args.summaries:
+        from summaries import SUMMARY_QUERIES
+        queries.update(SUMMARY_QUERIES)
+    if args.queries:
+        queries = {name: queries[name] for name in args.queries}
+
+    reports = [benchmark_variant(v, queries, indexes, args.concurrency, args.runs, not args.no_plans)
+               for v in args.variants]
+    print_comparison(reports)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,588 @@
+"""
+Read-only HTTP query service over the normalized schema.
+
+Internal apps get titles and people as JSON instead of each opening its
+own MySQL connection and writing its own joins. Endpoints (GET):
+
+    /titles/<tconst>                  title detail: type, genres, rating,
+                                      directors, writers, principals, episode
+    /titles?ids=tt...,tt...           several titles at once
+    /people/<nconst>                  person detail: professions, known for
+    /people?ids=nm...,nm...           several people at once
+    /people/<nconst>/filmography      titles with the person's roles, newest first
+    /leaderboard?k=&min_votes=&type=&genre=&decade=
+                                      top rated titles (top_rated.py buckets);
+                                      by=weighted ranks by weightedRating
+    /stats                            cache and pool counters
+
+- connections come from one ConnectionPool shared by the request threads
+  (POOL_SIZE, created on demand, rolled back and reused after a request)
+- multi-id fetches cost one query per table for the whole batch
+  (fetch_titles / fetch_people: WHERE key IN (...)), not one per id
+- responses are cached in a ResponseCache (LRU of CACHE_ENTRIES, each
+  entry valid for CACHE_TTL seconds) together with the load run they were
+  read in: once a new load_runs row appears (metrics.write_run_report,
+  polled every RUN_ID_POLL seconds) the whole cache is dropped. Post-load
+  steps (summaries, top_rated) finish after their run is recorded, so
+  leaderboards can lag a load by up to CACHE_TTL.
+
+Usage:
+    python query_service.py --port 8564
+    curl localhost:8564/titles/tt0111161
+"""
+import argparse
+import json
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from connect_db import *
+from top_rated import ANY, TOP_K, decade_of
+
+
+# ---------------- CONFIG ----------------
+
+HOST = "127.0.0.1"
+PORT = 8564
+POOL_SIZE = 8             # MySQL connections shared by all request threads
+CACHE_ENTRIES = 10000     # cached responses (LRU)
+CACHE_TTL = 300.0         # seconds a cached response stays valid
+RUN_ID_POLL = 5.0         # seconds between load_runs checks
+MAX_IDS = 500             # ids per multi-id request
+
+# ----------------------------------------
+
+
+class ConnectionPool:
+    """
+    At most `size` connections, opened on demand and reused. A connection
+    is rolled back when it is returned (so the next request reads a fresh
+    snapshot) and dropped if the request failed.
+    """
+
+    def __init__(self, size: int=POOL_SIZE):
+        self.size = size
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        self.opened = 0
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = connect_db()
+                self.opened += 1
+            try:
+                yield conn
+                conn.rollback()
+            except Exception:
+                conn.close()
+                self.opened -= 1
+                raise
+            self._idle.put(conn)
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+class ResponseCache:
+    """
+    LRU cache with a TTL, for the responses of one load run: get / put
+    with another run_id than the cached one empties it first.
+    """
+
+    def __init__(self, max_entries: int=CACHE_ENTRIES, ttl: float=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires, value)
+        self.run_id = None
+        self.hits = self.misses = self.invalidations = 0
+
+    def _check_run(self, run_id):
+        if run_id != self.run_id:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.run_id = run_id
+
+    def get(self, key, run_id):
+        with self._lock:
+            self._check_run(run_id)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, run_id, value):
+        with self._lock:
+            self._check_run(run_id)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def report(self):
+        with self._lock:
+            return {"entries": len(self._entries), "run_id": self.run_id, "hits": self.hits,
+                    "misses": self.misses, "invalidations": self.invalidations}
+
+
+# ---------------- batched fetches ----------------
+
+
+def _marks(ids):
+    return ", ".join(["%s"] * len(ids))
+
+
+def _number(value):
+    # DECIMAL columns come back as Decimal
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def fetch_titles(cur, tconsts):
+    """
+    {tconst: title detail} for the tconsts that exist; one query per table.
+    """
+    ids = list(dict.fromkeys(tconsts))
+    if not ids:
+        return {}
+    marks = _marks(ids)
+    cur.execute(f"""
+        SELECT tb.tconst, tb.primaryTitle, tb.originalTitle, tt.title_type_name, tb.isAdult,
+               tb.startYear, tb.endYear, tb.runtimeMinutes,
+               tr.averageRating, tr.numVotes, tr.weightedRating
+        FROM title_basics AS tb
+        LEFT JOIN title_type AS tt
+            ON tb.title_type_id = tt.title_type_id
+        LEFT JOIN title_ratings AS tr
+            ON tb.tconst = tr.tconst
+        WHERE tb.tconst IN ({marks});
+    """, ids)
+    titles = {}
+    for (tconst, primary, original, title_type, adult, start, end, runtime,
+         rating, votes, weighted) in cur.fetchall():
+        titles[tconst] = {
+            "tconst": tconst, "primaryTitle": primary, "originalTitle": original,
+            "titleType": title_type, "isAdult": adult, "startYear": start, "endYear": end,
+            "runtimeMinutes": runtime,
+            "rating": None if votes is None else {
+                "averageRating": _number(rating), "numVotes": votes, "weightedRating": weighted},
+            "genres": [], "directors": [], "writers": [], "principals": [], "episode": None,
+        }
+    if not titles:
+        return titles
+    ids = list(titles)
+    marks = _marks(ids)
+
+    cur.execute(f"""
+        SELECT tg.tconst, g.genre_name
+        FROM title_genre AS tg
+        INNER JOIN genre AS g
+            ON tg.genre_id = g.genre_id
+        WHERE tg.tconst IN ({marks})
+        ORDER BY tg.id;
+    """, ids)
+    for tconst, genre in cur.fetchall():
+        titles[tconst]["genres"].append(genre)
+
+    for table, field in (("title_director", "directors"), ("title_writer", "writers")):
+        cur.execute(f"""
+            SELECT c.tconst, c.nconst, nb.primaryName
+            FROM {table} AS c
+            LEFT JOIN name_basics AS nb
+                ON c.nconst = nb.nconst
+            WHERE c.tconst IN ({marks})
+            ORDER BY c.id;
+        """, ids)
+        for tconst, nconst, name in cur.fetchall():
+            titles[tconst][field].append({"nconst": nconst, "name": name})
+
+    cur.execute(f"""
+        SELECT tp.id, tp.tconst, tp.ordering, tp.nconst, nb.primaryName, pc.category_name, tp.job
+        FROM title_principals AS tp
+        LEFT JOIN name_basics AS nb
+            ON tp.nconst = nb.nconst
+        LEFT JOIN principal_category AS pc
+            ON tp.category_id = pc.id
+        WHERE tp.tconst IN ({marks})
+        ORDER BY tp.tconst, tp.ordering;
+    """, ids)
+    principals = {}
+    for principal_id, tconst, ordering, nconst, name, category, job in cur.fetchall():
+        principals[principal_id] = {"ordering": ordering, "nconst": nconst, "name": name,
+                                    "category": category, "job": job, "characters": []}
+        titles[tconst]["principals"].append(principals[principal_id])
+    if principals:
+        principal_ids = list(principals)
+        cur.execute(f"""
+            SELECT title_principals_id, character_name
+            FROM principal_character
+            WHERE title_principals_id IN ({_marks(principal_ids)})
+            ORDER BY id;
+        """, principal_ids)
+        for principal_id, character in cur.fetchall():
+            principals[principal_id]["characters"].append(character)
+
+    cur.execute(f"""
+        SELECT tconst, parentTconst, seasonNumber, episodeNumber
+        FROM title_episode
+        WHERE tconst IN ({marks});
+    """, ids)
+    for tconst, parent, season, episode in cur.fetchall():
+        titles[tconst]["episode"] = {"parentTconst": parent, "seasonNumber": season,
+                                     "episodeNumber": episode}
+    return titles
+
+
+def fetch_people(cur, nconsts):
+    """
+    {nconst: person detail} for the nconsts that exist; one query per table.
+    """
+    ids = list(dict.fromkeys(nconsts))
+    if not ids:
+        return {}
+    marks = _marks(ids)
+    cur.execute(f"""
+        SELECT nconst, primaryName, birthYear, deathYear
+        FROM name_basics
+        WHERE nconst IN ({marks});
+    """, ids)
+    people = {
+        nconst: {"nconst": nconst, "primaryName": name, "birthYear": birth, "deathYear": death,
+                 "professions": [], "knownFor": []}
+        for nconst, name, birth, death in cur.fetchall()
+    }
+    if not people:
+        return people
+    ids = list(people)
+    marks = _marks(ids)
+
+    cur.execute(f"""
+        SELECT pp.nconst, p.profession_name
+        FROM person_profession AS pp
+        INNER JOIN profession AS p
+            ON pp.profession_id = p.id
+        WHERE pp.nconst IN ({marks})
+        ORDER BY pp.id;
+    """, ids)
+    for nconst, profession in cur.fetchall():
+        people[nconst]["professions"].append(profession)
+
+    cur.execute(f"""
+        SELECT kf.nconst, kf.tconst, tb.primaryTitle, tb.startYear
+        FROM name_known_for AS kf
+        LEFT JOIN title_basics AS tb
+            ON kf.tconst = tb.tconst
+        WHERE kf.nconst IN ({marks})
+        ORDER BY kf.nconst, kf.position;
+    """, ids)
+    for nconst, tconst, title, year in cur.fetchall():
+        people[nconst]["knownFor"].append({"tconst": tconst, "primaryTitle": title, "startYear": year})
+    return people
+
+
+def fetch_filmography(cur, nconst):
+    """
+    Titles of a person with their roles there (principal category,
+    "director", "writer"), newest first.
+    """
+    cur.execute("""
+        SELECT c.tconst, c.role, tb.primaryTitle, tt.title_type_name, tb.startYear,
+               tr.averageRating, tr.numVotes
+        FROM (
+            SELECT tp.tconst, COALESCE(pc.category_name, 'principal') AS role
+            FROM title_principals AS tp
+            LEFT JOIN principal_category AS pc
+                ON tp.category_id = pc.id
+            WHERE tp.nconst = %s
+            UNION
+            SELECT tconst, 'director' FROM title_director WHERE nconst = %s
+            UNION
+            SELECT tconst, 'writer' FROM title_writer WHERE nconst = %s
+        ) AS c
+        INNER JOIN title_basics AS tb
+            ON c.tconst = tb.tconst
+        LEFT JOIN title_type AS tt
+            ON tb.title_type_id = tt.title_type_id
+        LEFT JOIN title_ratings AS tr
+            ON c.tconst = tr.tconst
+        ORDER BY tb.startYear DESC, c.tconst, c.role;
+    """, (nconst, nconst, nconst))
+    titles = {}
+    for tconst, role, title, title_type, year, rating, votes in cur.fetchall():
+        entry = titles.setdefault(tconst, {
+            "tconst": tconst, "primaryTitle": title, "titleType": title_type, "startYear": year,
+            "averageRating": _number(rating), "numVotes": votes, "roles": []})
+        entry["roles"].append(role)
+    return list(titles.values())
+
+
+def fetch_leaderboard(cur, k=10, min_votes=1000, title_type=None, genre=None, decade=None):
+    """
+    Best k titles of a top_rated bucket (see top_rated.py); None if the
+    type or genre name is unknown.
+    """
+    type_id = genre_id = ANY
+    if title_type is not None:
+        cur.execute("SELECT title_type_id FROM title_type WHERE title_type_name = %s;", (title_type,))
+        row = cur.fetchone()
+        if row is None:
+            return None
+        type_id = row[0]
+    if genre is not None:
+        # the bucket id of the name (top_rated.GENRE_IDS_SQL)
+        cur.execute("SELECT MIN(genre_id) FROM genre WHERE genre_name = %s;", (genre,))
+        genre_id = cur.fetchone()[0]
+        if genre_id is None:
+            return None
+    cur.execute("""
+        SELECT rank_pos, tconst, primaryTitle, averageRating, numVotes
+        FROM top_rated
+        WHERE min_votes = %s AND title_type_id = %s AND genre_id = %s AND decade = %s
+        ORDER BY rank_pos
+        LIMIT %s;
+    """, (min_votes, type_id, genre_id, ANY if decade is None else decade_of(decade), k))
+    return [{"rank": pos, "tconst": tconst, "primaryTitle": title,
+             "averageRating": _number(rating), "numVotes": votes}
+            for pos, tconst, title, rating, votes in cur.fetchall()]
+
+
+def fetch_weighted_leaderboard(cur, k=10):
+    cur.execute("""
+        SELECT tr.tconst, tb.primaryTitle, tr.averageRating, tr.numVotes, tr.weightedRating
+        FROM title_ratings AS tr
+        INNER JOIN title_basics AS tb
+            ON tr.tconst = tb.tconst
+        WHERE tr.weightedRating IS NOT NULL
+        ORDER BY tr.weightedRating DESC
+        LIMIT %s;
+    """, (k,))
+    return [{"rank": pos, "tconst": tconst, "primaryTitle": title, "averageRating": _number(rating),
+             "numVotes": votes, "weightedRating": weighted}
+            for pos, (tconst, title, rating, votes, weighted) in enumerate(cur.fetchall(), 1)]
+
+
+# ---------------- service ----------------
+
+
+class BadRequest(Exception):
+    pass
+
+
+class NotFound(Exception):
+    pass
+
+
+def _ids(params, prefix):
+    ids = [i for i in ",".join(params.get("ids", [])).split(",") if i]
+    if not ids:
+        raise BadRequest("ids is required")
+    if len(ids) > MAX_IDS:
+        raise BadRequest(f"at most {MAX_IDS} ids per request")
+    if any(not i.startswith(prefix) for i in ids):
+        raise BadRequest(f"ids must start with {prefix!r}")
+    return ids
+
+
+def _int(params, name, default=None):
+    values = params.get(name)
+    if not values:
+        return default
+    try:
+        return int(values[0])
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer") from None
+
+
+def _str(params, name):
+    values = params.get(name)
+    return values[0] if values else None
+
+
+class QueryService:
+    """
+    Routes a request path to its fetch, through the response cache.
+    """
+
+    def __init__(self, pool: ConnectionPool, cache: ResponseCache, run_id_poll: float=RUN_ID_POLL):
+        self.pool = pool
+        self.cache = cache
+        self.run_id_poll = run_id_poll
+        self._run_id = None
+        self._run_id_checked = float("-inf")
+        self._run_lock = threading.Lock()
+        self.routes = [
+            (re.compile(r"^/titles/(tt\d+)$"), self.title),
+            (re.compile(r"^/titles$"), self.titles),
+            (re.compile(r"^/people/(nm\d+)$"), self.person),
+            (re.compile(r"^/people$"), self.people),
+            (re.compile(r"^/people/(nm\d+)/filmography$"), self.filmography),
+            (re.compile(r"^/leaderboard$"), self.leaderboard),
+        ]
+
+    def run_id(self):
+        """
+        Latest load_runs.run_id, re-read at most every run_id_poll seconds;
+        None if it can't be read (no load_runs table): cached responses
+        then only expire by CACHE_TTL.
+        """
+        with self._run_lock:
+            now = time.monotonic()
+            if now - self._run_id_checked >= self.run_id_poll:
+                try:
+                    with self.pool.connection() as conn:
+                        cur = conn.cursor()
+                        cur.execute("SELECT MAX(run_id) FROM load_runs;")
+                        self._run_id = cur.fetchone()[0]
+                        cur.close()
+                except Exception as err:
+                    if self._run_id_checked == float("-inf"):
+                        print(f"WARNING: can't read load_runs, caching by CACHE_TTL only: {err}")
+                    self._run_id = None
+                self._run_id_checked = now
+            return self._run_id
+
+    def _query(self, fetch, *args):
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                return fetch(cur, *args)
+            finally:
+                cur.close()
+
+    def title(self, params, tconst):
+        found = self._query(fetch_titles, [tconst])
+        if tconst not in found:
+            raise NotFound(f"no title {tconst}")
+        return found[tconst]
+
+    def titles(self, params):
+        ids = _ids(params, "tt")
+        found = self._query(fetch_titles, ids)
+        return {"titles": [found[i] for i in dict.fromkeys(ids) if i in found],
+                "missing": [i for i in dict.fromkeys(ids) if i not in found]}
+
+    def person(self, params, nconst):
+        found = self._query(fetch_people, [nconst])
+        if nconst not in found:
+            raise NotFound(f"no person {nconst}")
+        return found[nconst]
+
+    def people(self, params):
+        ids = _ids(params, "nm")
+        found = self._query(fetch_people, ids)
+        return {"people": [found[i] for i in dict.fromkeys(ids) if i in found],
+                "missing": [i for i in dict.fromkeys(ids) if i not in found]}
+
+    def filmography(self, params, nconst):
+        return {"nconst": nconst, "titles": self._query(fetch_filmography, nconst)}
+
+    def leaderboard(self, params):
+        k = _int(params, "k", 10)
+        if not 1 <= k <= TOP_K:
+            raise BadRequest(f"k must be between 1 and {TOP_K}")
+        if _str(params, "by") == "weighted":
+            return {"by": "weighted", "titles": self._query(fetch_weighted_leaderboard, k)}
+        min_votes = _int(params, "min_votes", 1000)
+        titles = self._query(fetch_leaderboard, k, min_votes, _str(params, "type"),
+                             _str(params, "genre"), _int(params, "decade"))
+        if titles is None:
+            raise NotFound("unknown title type or genre")
+        return {"min_votes": min_votes, "titles": titles}
+
+    def handle(self, target):
+        """
+        (status, JSON body bytes, cache state) of a GET request target.
+        """
+        url = urlsplit(target)
+        if url.path == "/stats":
+            body = {"cache": self.cache.report(), "pool": {"size": self.pool.size, "opened": self.pool.opened}}
+            return 200, json.dumps(body).encode("utf-8"), "BYPASS"
+        run_id = self.run_id()
+        key = (url.path, url.query)
+        cached = self.cache.get(key, run_id)
+        if cached is not None:
+            return 200, cached, "HIT"
+        params = parse_qs(url.query)
+        for pattern, route in self.routes:
+            match = pattern.match(url.path)
+            if match:
+                break
+        else:
+            return 404, json.dumps({"error": f"no endpoint {url.path}"}).encode("utf-8"), "BYPASS"
+        try:
+            body = json.dumps(route(params, *match.groups()), default=str).encode("utf-8")
+        except BadRequest as e:
+            return 400, json.dumps({"error": str(e)}).encode("utf-8"), "BYPASS"
+        except NotFound as e:
+            return 404, json.dumps({"error": str(e)}).encode("utf-8"), "BYPASS"
+        self.cache.put(key, run_id, body)
+        return 200, body, "MISS"
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        try:
+            status, body, cache_state = self.server.service.handle(self.path)
+        except Exception as e:
+            status, body, cache_state = 500, json.dumps({"error": str(e)}).encode("utf-8"), "BYPASS"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Cache", cache_state)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(host=HOST, port: int=PORT, pool_size: int=POOL_SIZE,
+                cache_entries: int=CACHE_ENTRIES, cache_ttl: float=CACHE_TTL, quiet=False):
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+    server.service = QueryService(ConnectionPool(pool_size), ResponseCache(cache_entries, cache_ttl))
+    server.quiet = quiet
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read-only HTTP service for title / person lookups.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--pool-size", type=int, default=POOL_SIZE)
+    parser.add_argument("--cache-entries", type=int, default=CACHE_ENTRIES)
+    parser.add_argument("--cache-ttl", type=float, default=CACHE_TTL)
+    parser.add_argument("--quiet", action="store_true", help="no per-request log lines")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.pool_size, args.cache_entries, args.cache_ttl, args.quiet)
+    print(f"Serving on http://{args.host}:{args.port} (pool {args.pool_size}, "
+          f"cache {args.cache_entries} entries / {args.cache_ttl:.0f}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.pool.close()
+
+
+if __name__ == "__main__":
+    main()
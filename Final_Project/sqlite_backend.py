@@ -0,0 +1,190 @@
+"""
+SQLite stand-in for connect_db, for benchmarks and smoke tests without a
+MySQL server.
+
+connect_db() returns a connection whose cursors take the MySQL dialect
+the loaders use (%s placeholders, INSERT IGNORE, CHAR_LENGTH, ENGINE=...,
+ON DUPLICATE KEY UPDATE, BIT_OR, SELECT ... FOR UPDATE)
+and translate it for SQLite. create_schema() builds the create_db.py
+tables in a fresh SQLite file.
+
+To run a loader on it, register it before the loader is imported:
+
+    import sys, sqlite_backend
+    sys.modules["connect_db"] = sqlite_backend
+
+Only the threaded insert_data_*.py loaders and query_benchmark.py (with
+EXPLAIN QUERY PLAN standing in for EXPLAIN ANALYZE) are meant to run here;
+the server-side engines (staging_load.py --engine sql, JSON_TABLE) need
+MySQL.
+"""
+import ast
+import re
+import sqlite3
+from pathlib import Path
+
+__all__ = ["connect_db"]
+
+
+# ---------------- CONFIG ----------------
+
+SQLITE_PATH = Path("imdb_bench.sqlite")
+BUSY_TIMEOUT = 60.0     # seconds a writer waits for the database lock
+
+# ----------------------------------------
+
+_REWRITES = [
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"\bINSERT\s+IGNORE\b", re.IGNORECASE), "INSERT OR IGNORE"),
+    (re.compile(r"\bCHAR_LENGTH\(", re.IGNORECASE), "LENGTH("),
+    (re.compile(r"\bENGINE\s*=\s*\w+", re.IGNORECASE), ""),
+    (re.compile(r"\bINT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b", re.IGNORECASE),
+     "INTEGER PRIMARY KEY AUTOINCREMENT"),
+    (re.compile(r"\b(DROP\s+INDEX\s+\w+)\s+ON\s+\w+", re.IGNORECASE), r"\1"),
+    (re.compile(r"\bEXPLAIN\s+ANALYZE\b", re.IGNORECASE), "EXPLAIN QUERY PLAN"),
+    (re.compile(r"\bON\s+DUPLICATE\s+KEY\s+UPDATE\b", re.IGNORECASE), "ON CONFLICT DO UPDATE SET"),
+    (re.compile(r"\bVALUES\((\w+)\)", re.IGNORECASE), r"excluded.\1"),
+    # SQLite locks the whole file for a writer; row locks have no equivalent
+    (re.compile(r"\s+FOR\s+UPDATE\b", re.IGNORECASE), ""),
+]
+
+
+def to_sqlite(sql):
+    for pattern, replacement in _REWRITES:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+class BitOr:
+    """
+    MySQL's BIT_OR aggregate (bits 0..62: SQLite integers are signed).
+    """
+
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        if value is not None:
+            self.value |= value
+
+    def finalize(self):
+        return self.value
+
+
+class Cursor:
+    """
+    DB-API cursor that accepts the loaders' MySQL statements.
+    """
+
+    def __init__(self, conn):
+        self._cur = conn.cursor()
+
+    def execute(self, sql, params=()):
+        self._cur.execute(to_sqlite(sql), params)
+
+    def executemany(self, sql, rows):
+        self._cur.executemany(to_sqlite(sql), rows)
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchmany(self, size):
+        return self._cur.fetchmany(size)
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def close(self):
+        self._cur.close()
+
+
+class Connection:
+    """
+    Just enough of a mysql.connector connection for the loaders.
+    """
+
+    def __init__(self, path: Path=None):
+        self._conn = sqlite3.connect(path or SQLITE_PATH, timeout=BUSY_TIMEOUT,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL;")
+        self._conn.execute("PRAGMA foreign_keys = ON;")
+        self._conn.create_aggregate("BIT_OR", 1, BitOr)
+        self.autocommit = False   # accepted for compatibility; sqlite3 handles transactions
+
+    def cursor(self):
+        return Cursor(self._conn)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+def connect_db():
+    return Connection()
+
+
+def create_db_statements(create_db_path: Path=Path(__file__).with_name("create_db.py")):
+    """
+    CREATE TABLE statements of create_db.py, in DBC_STATEMENTS order, read
+    from its source (importing it would need mysql.connector).
+    """
+    tree = ast.parse(create_db_path.read_text(encoding="utf-8"))
+    lists = {}
+    order = []
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or not isinstance(node.targets[0], ast.Name):
+            continue
+        name = node.targets[0].id
+        if name == "DBC_STATEMENTS":
+            order = [elt.id for elt in node.value.elts]
+        elif isinstance(node.value, ast.List) and all(
+                isinstance(elt, ast.Constant) and isinstance(elt.value, str) for elt in node.value.elts):
+            lists[name] = [elt.value for elt in node.value.elts]
+    return [sql for name in order if name in lists for sql in lists[name]]
+
+
+_INLINE_INDEX = re.compile(r",\s*(?:INDEX|KEY)\s+(\w+)\s*\(([^)]*)\)", re.IGNORECASE)
+_CREATE_TABLE = re.compile(r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE)
+
+
+def split_inline_indexes(sql):
+    """
+    (CREATE TABLE without its INDEX / KEY clauses, [CREATE INDEX ...]):
+    SQLite only takes indexes as separate statements.
+    """
+    table = _CREATE_TABLE.search(sql).group(1)
+    indexes = [f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"
+               for name, columns in _INLINE_INDEX.findall(sql)]
+    return _INLINE_INDEX.sub("", sql), indexes
+
+
+def create_schema(path: Path=None):
+    """
+    Create an empty SQLite database with the create_db.py schema
+    (an existing file is replaced).
+    """
+    path = Path(path or SQLITE_PATH)
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+    conn = sqlite3.connect(path)
+    for sql in create_db_statements():
+        table_sql, indexes = split_inline_indexes(to_sqlite(sql))
+        conn.execute(table_sql)
+        for index_sql in indexes:
+            conn.execute(index_sql)
+    conn.commit()
+    conn.close()
+    return path
@@ -0,0 +1,754 @@
+"""
+Staging-table load engines: let the server do the set-based work.
+
+--engine staging (FK filtering on the server instead of the client)
+    The threaded loaders pull every tconst / nconst into Python sets so
+    rows pointing at missing titles or names can be dropped before INSERT.
+    Here the loader's row builder runs with those checks switched off, its
+    rows go in bulk into unindexed stg_* tables, and set-based
+    INSERT ... SELECT ... JOIN title_basics / name_basics statements build
+    the normalized tables on the server.
+
+--engine sql (comma lists split on the server too)
+    The raw TSV columns are loaded as-is into stg_raw_* tables, and a few
+    large statements parse them, fill the lookup tables and explode the
+    comma-separated columns (genres, primaryProfession, knownForTitles,
+    directors, writers, types, attributes) into the bridge tables with
+    JSON_TABLE. Needs MySQL 8.0.4+.
+
+Usage:
+    python staging_load.py title_crew /path/to/title.crew.tsv
+    python staging_load.py title_crew /path/to/title.crew.tsv --engine sql
+
+Meant for a fresh load of the target tables (rows already present are
+not de-duplicated, same as the threaded loaders).
+
+main() then runs the post-load steps of the insert_data_*.py mains
+(post_load): summaries, title_summary, person_roles, top_rated, the
+title search and name autocomplete indexes and the distinct-count
+sketches. The set-based statements collect no touched keys, so every
+step rebuilds what it derives from the loaded tables (touched=None)
+instead of merging a delta.
+"""
+import argparse
+import importlib
+import re
+from pathlib import Path
+from typing import NamedTuple
+
+from connect_db import connect_db
+from distinct_sketches import SKETCHED_TABLES, SKETCH_DURING_LOAD
+from distinct_sketches import rebuild as rebuild_sketches
+from insert_data_title_ratings_and_title_episode import WEIGHTED_MIN_VOTES, WEIGHTED_PRIOR_MEAN
+from loader_pipeline import (ALL_IDS, Batch, LinkedBatch, TransactionStats, load_chunks,
+                             print_report, run_steps)
+from loader_registry import LOADERS
+from mask_bits import assign_mask_bits
+from metrics import write_run_report
+from summaries import refresh_after_load
+from title_summary import sync_after_load as sync_title_summary
+from top_rated import build_top_rated
+
+
+# Staging tables: no keys, no indexes; columns follow the builder's tuples.
+# Children of AUTO_INCREMENT parents carry the parent's natural key
+# (tconst/titleId, ordering) instead of the id.
+STAGING_TABLES = {
+    "stg_name_known_for": (
+        ("nconst", "VARCHAR(12)"), ("tconst", "VARCHAR(12)"), ("position", "INT"),
+    ),
+    "stg_title_akas": (
+        ("titleId", "VARCHAR(12)"), ("ordering", "INT"), ("title", "VARCHAR(512)"),
+        ("region_code", "VARCHAR(16)"), ("language_code", "VARCHAR(16)"),
+        ("isOriginalTitle", "TINYINT(1)"),
+    ),
+    "stg_title_aka_type": (
+        ("titleId", "VARCHAR(12)"), ("ordering", "INT"), ("title_types_id", "INT"),
+    ),
+    "stg_title_aka_attribute": (
+        ("titleId", "VARCHAR(12)"), ("ordering", "INT"), ("title_attribute_id", "INT"),
+    ),
+    "stg_title_principals": (
+        ("tconst", "VARCHAR(12)"), ("ordering", "INT"), ("nconst", "VARCHAR(12)"),
+        ("category_id", "INT"), ("job", "VARCHAR(256)"),
+    ),
+    "stg_principal_character": (
+        ("tconst", "VARCHAR(12)"), ("ordering", "INT"), ("character_name", "VARCHAR(512)"),
+    ),
+    "stg_title_director": (
+        ("tconst", "VARCHAR(12)"), ("nconst", "VARCHAR(12)"),
+    ),
+    "stg_title_writer": (
+        ("tconst", "VARCHAR(12)"), ("nconst", "VARCHAR(12)"),
+    ),
+    "stg_title_episode": (
+        ("tconst", "VARCHAR(12)"), ("parentTconst", "VARCHAR(12)"),
+        ("seasonNumber", "INT"), ("episodeNumber", "INT"),
+    ),
+    "stg_title_ratings": (
+        ("tconst", "VARCHAR(12)"), ("averageRating", "DECIMAL(3,1)"), ("numVotes", "INT"),
+        ("weightedRating", "DOUBLE"),
+    ),
+}
+
+
+class StagingSpec(NamedTuple):
+    """
+    - context(module): builder arguments with the id sets replaced by ALL_IDS
+    - routes: one entry per table in LOADERS[name].tables; a stg_* table, or
+      None to insert that batch straight into the real table
+    - finalize: INSERT ... SELECT statements, run in order after staging;
+      %(id_mark)s is MAX(id) of mark_table before the first one runs
+      (see lock_id_mark)
+    """
+    context: object
+    routes: tuple
+    finalize: tuple
+    mark_table: object = None
+
+
+STAGING = {
+    "name_basics": StagingSpec(
+        lambda m: (m.lookups_professions(), ALL_IDS),
+        (None, None, "stg_name_known_for"),
+        (
+            # positions are renumbered over the titles that exist
+            """
+            INSERT INTO name_known_for (nconst, tconst, position)
+            SELECT s.nconst, s.tconst,
+                   ROW_NUMBER() OVER (PARTITION BY s.nconst ORDER BY s.position)
+            FROM stg_name_known_for AS s
+            INNER JOIN title_basics AS tb
+                ON tb.tconst = s.tconst;
+            """,
+        ),
+    ),
+    "title_akas": StagingSpec(
+        lambda m: (*m.lookup_types_attributes(), ALL_IDS),
+        ("stg_title_akas", "stg_title_aka_type", "stg_title_aka_attribute"),
+        (
+            """
+            INSERT INTO title_akas (titleId, ordering, title, region_code, language_code, isOriginalTitle)
+            SELECT s.titleId, s.ordering, s.title, s.region_code, s.language_code, s.isOriginalTitle
+            FROM stg_title_akas AS s
+            INNER JOIN title_basics AS tb
+                ON tb.tconst = s.titleId;
+            """,
+            """
+            INSERT INTO title_aka_type (title_akas_id, title_types_id)
+            SELECT ta.id, s.title_types_id
+            FROM stg_title_aka_type AS s
+            INNER JOIN title_akas AS ta
+                ON ta.titleId = s.titleId
+               AND ta.ordering = s.ordering
+               AND ta.id > %(id_mark)s;
+            """,
+            """
+            INSERT INTO title_aka_attribute (title_akas_id, title_attribute_id)
+            SELECT ta.id, s.title_attribute_id
+            FROM stg_title_aka_attribute AS s
+            INNER JOIN title_akas AS ta
+                ON ta.titleId = s.titleId
+               AND ta.ordering = s.ordering
+               AND ta.id > %(id_mark)s;
+            """,
+        ),
+        mark_table="title_akas",
+    ),
+    "title_principals": StagingSpec(
+        lambda m: (m.lookup_categories(), ALL_IDS, ALL_IDS),
+        ("stg_title_principals", "stg_principal_character"),
+        (
+            """
+            INSERT INTO title_principals (tconst, ordering, nconst, category_id, job)
+            SELECT s.tconst, s.ordering, s.nconst, s.category_id, s.job
+            FROM stg_title_principals AS s
+            INNER JOIN title_basics AS tb
+                ON tb.tconst = s.tconst
+            INNER JOIN name_basics AS nb
+                ON nb.nconst = s.nconst;
+            """,
+            """
+            INSERT INTO principal_character (title_principals_id, character_name)
+            SELECT tp.id, s.character_name
+            FROM stg_principal_character AS s
+            INNER JOIN title_principals AS tp
+                ON tp.tconst = s.tconst
+               AND tp.ordering = s.ordering
+               AND tp.id > %(id_mark)s;
+            """,
+        ),
+        mark_table="title_principals",
+    ),
+    "title_crew": StagingSpec(
+        lambda m: (ALL_IDS, ALL_IDS),
+        ("stg_title_director", "stg_title_writer"),
+        (
+            """
+            INSERT INTO title_director (tconst, nconst)
+            SELECT s.tconst, s.nconst
+            FROM stg_title_director AS s
+            INNER JOIN title_basics AS tb
+                ON tb.tconst = s.tconst
+            INNER JOIN name_basics AS nb
+                ON nb.nconst = s.nconst;
+            """,
+            """
+            INSERT INTO title_writer (tconst, nconst)
+            SELECT s.tconst, s.nconst
+            FROM stg_title_writer AS s
+            INNER JOIN title_basics AS tb
+                ON tb.tconst = s.tconst
+            INNER JOIN name_basics AS nb
+                ON nb.nconst = s.nconst;
+            """,
+        ),
+    ),
+    "title_episode": StagingSpec(
+        lambda m: (ALL_IDS,),
+        ("stg_title_episode",),
+        (
+            # unknown parents become NULL, like the threaded loader
+            """
+            INSERT INTO title_episode (tconst, parentTconst, seasonNumber, episodeNumber)
+            SELECT s.tconst, p.tconst, s.seasonNumber, s.episodeNumber
+            FROM stg_title_episode AS s
+            INNER JOIN title_basics AS tb
+                ON tb.tconst = s.tconst
+            LEFT JOIN title_basics AS p
+                ON p.tconst = s.parentTconst;
+            """,
+        ),
+    ),
+    "title_ratings": StagingSpec(
+        lambda m: (ALL_IDS,),
+        ("stg_title_ratings",),
+        (
+            # weighted rating with the prior mean over the staged file
+            f"""
+            INSERT INTO title_ratings (tconst, averageRating, numVotes, weightedRating)
+            SELECT s.tconst, s.averageRating, s.numVotes,
+                   (COALESCE(s.numVotes, 0) * s.averageRating + {WEIGHTED_MIN_VOTES} * p.mean)
+                   / (COALESCE(s.numVotes, 0) + {WEIGHTED_MIN_VOTES})
+            FROM stg_title_ratings AS s
+            CROSS JOIN (
+                SELECT COALESCE({WEIGHTED_PRIOR_MEAN or "NULL"}, AVG(averageRating)) AS mean
+                FROM stg_title_ratings
+            ) AS p
+            INNER JOIN title_basics AS tb
+                ON tb.tconst = s.tconst;
+            """,
+        ),
+    ),
+}
+
+
+# ---------------- raw-column engine ----------------
+
+
+def explode(col, alias="j"):
+    """
+    JSON_TABLE turning a comma-separated column into one row per item:
+    {alias}.pos (1-based position) and {alias}.item (the text).
+    Backslashes and double quotes are escaped before building the array.
+    """
+    return rf"""JSON_TABLE(
+                CONCAT('["', REPLACE(REPLACE(REPLACE({col}, '\\', '\\\\'), '"', '\\"'), ',', '","'), '"]'),
+                '$[*]' COLUMNS (pos FOR ORDINALITY, item VARCHAR(512) PATH '$')
+            ) AS {alias}"""
+
+
+def sql_text(col):
+    # like `None if value in (None, r"\N") else value`
+    return rf"NULLIF({col}, '\\N')"
+
+
+def sql_int(col):
+    # like parse_int(): NULL unless the text is an integer
+    return rf"CASE WHEN {col} REGEXP '^-?[0-9]+$' THEN CAST({col} AS SIGNED) END"
+
+
+def sql_bool01(col):
+    # like parse_bool_01()
+    return rf"CASE WHEN {col} IS NULL OR {col} IN ('', '\\N') THEN NULL WHEN {col} = '1' THEN 1 ELSE 0 END"
+
+
+def lookup(table, id_col, name_col):
+    """
+    Lookup table as name -> one id (the first), so joins never fan out.
+    """
+    return f"(SELECT {name_col}, MIN({id_col}) AS {id_col} FROM {table} GROUP BY {name_col})"
+
+
+def insert_missing_lookup(table, name_col, source):
+    """
+    Add every distinct, non-empty value of `source` (SELECT ... AS v) that
+    is not in the lookup table yet.
+    """
+    return f"""
+            INSERT INTO {table} ({name_col})
+            SELECT DISTINCT src.v
+            FROM ({source}) AS src
+            WHERE src.v IS NOT NULL AND src.v <> ''
+              AND NOT EXISTS (SELECT 1 FROM {table} AS l WHERE l.{name_col} = src.v);
+            """
+
+
+def list_values(table, col):
+    # every trimmed item of a comma-list column, for insert_missing_lookup
+    return rf"""SELECT TRIM(j.item) AS v
+                FROM {table} AS s
+                CROSS JOIN {explode(f"s.{col}")}
+                WHERE s.{col} <> '\\N'"""
+
+
+def assign_genre_bits(cur):
+    # genre_mask bits of the genres just added (mask_bits.py)
+    return assign_mask_bits(cur, "genre")
+
+
+class RawSpec(NamedTuple):
+    """
+    - table: stg_raw_* table holding the TSV columns as-is
+    - finalize: statements run in order after staging (see finalize());
+      a callable step is called with the cursor instead
+    """
+    table: str
+    finalize: tuple
+    mark_table: object = None
+
+
+RAW = {
+    "title_basics": RawSpec(
+        "stg_raw_title_basics",
+        (
+            insert_missing_lookup(
+                "title_type", "title_type_name",
+                rf"SELECT TRIM(s.titleType) AS v FROM stg_raw_title_basics AS s WHERE s.titleType <> '\\N'"),
+            insert_missing_lookup("genre", "genre_name", list_values("stg_raw_title_basics", "genres")),
+            assign_genre_bits,
+            rf"""
+            INSERT IGNORE INTO title_basics (
+                tconst, primaryTitle, originalTitle, isAdult,
+                startYear, endYear, runtimeMinutes, title_type_id
+            )
+            SELECT s.tconst,
+                   {sql_text("s.primaryTitle")},
+                   {sql_text("s.originalTitle")},
+                   {sql_bool01("s.isAdult")},
+                   {sql_int("s.startYear")},
+                   {sql_int("s.endYear")},
+                   {sql_int("s.runtimeMinutes")},
+                   tt.title_type_id
+            FROM stg_raw_title_basics AS s
+            LEFT JOIN {lookup("title_type", "title_type_id", "title_type_name")} AS tt
+                ON tt.title_type_name = TRIM(s.titleType)
+            WHERE s.tconst <> '';
+            """,
+            rf"""
+            INSERT IGNORE INTO title_genre (tconst, genre_id)
+            SELECT s.tconst, g.genre_id
+            FROM stg_raw_title_basics AS s
+            CROSS JOIN {explode("s.genres")}
+            INNER JOIN {lookup("genre", "genre_id", "genre_name")} AS g
+                ON g.genre_name = TRIM(j.item)
+            WHERE s.genres <> '\\N';
+            """,
+            # title_basics.genre_mask of the loaded titles (genre_mask.py)
+            """
+            UPDATE title_basics AS tb
+            INNER JOIN (
+                SELECT tg.tconst, BIT_OR(1 << g.mask_bit) AS mask
+                FROM title_genre AS tg
+                INNER JOIN stg_raw_title_basics AS s
+                    ON s.tconst = tg.tconst
+                INNER JOIN genre AS g
+                    ON g.genre_id = tg.genre_id
+                GROUP BY tg.tconst
+            ) AS m
+                ON tb.tconst = m.tconst
+            SET tb.genre_mask = m.mask;
+            """,
+        ),
+    ),
+    "name_basics": RawSpec(
+        "stg_raw_name_basics",
+        (
+            insert_missing_lookup("profession", "profession_name",
+                                  list_values("stg_raw_name_basics", "primaryProfession")),
+            rf"""
+            INSERT INTO name_basics (nconst, primaryName, birthYear, deathYear)
+            SELECT s.nconst,
+                   {sql_text("s.primaryName")},
+                   {sql_int("s.birthYear")},
+                   {sql_int("s.deathYear")}
+            FROM stg_raw_name_basics AS s
+            WHERE s.nconst <> '';
+            """,
+            rf"""
+            INSERT INTO person_profession (nconst, profession_id)
+            SELECT DISTINCT s.nconst, p.id
+            FROM stg_raw_name_basics AS s
+            CROSS JOIN {explode("s.primaryProfession")}
+            INNER JOIN {lookup("profession", "id", "profession_name")} AS p
+                ON p.profession_name = TRIM(j.item)
+            WHERE s.primaryProfession <> '\\N';
+            """,
+            # dedupe titles per person, keep the titles that exist, and
+            # number them in file order
+            rf"""
+            INSERT INTO name_known_for (nconst, tconst, position)
+            SELECT k.nconst, k.tconst,
+                   ROW_NUMBER() OVER (PARTITION BY k.nconst ORDER BY k.first_pos)
+            FROM (
+                SELECT s.nconst, TRIM(j.item) AS tconst, MIN(j.pos) AS first_pos
+                FROM stg_raw_name_basics AS s
+                CROSS JOIN {explode("s.knownForTitles")}
+                WHERE s.knownForTitles <> '\\N' AND TRIM(j.item) <> ''
+                GROUP BY s.nconst, TRIM(j.item)
+            ) AS k
+            INNER JOIN title_basics AS tb
+                ON tb.tconst = k.tconst;
+            """,
+        ),
+    ),
+    "title_crew": RawSpec(
+        "stg_raw_title_crew",
+        tuple(
+            rf"""
+            INSERT INTO {target} (tconst, nconst)
+            SELECT DISTINCT s.tconst, TRIM(j.item)
+            FROM stg_raw_title_crew AS s
+            CROSS JOIN {explode(f"s.{col}")}
+            INNER JOIN title_basics AS tb
+                ON tb.tconst = s.tconst
+            INNER JOIN name_basics AS nb
+                ON nb.nconst = TRIM(j.item)
+            WHERE s.{col} <> '\\N';
+            """
+            for target, col in (("title_director", "directors"), ("title_writer", "writers"))
+        ),
+    ),
+    "title_akas": RawSpec(
+        "stg_raw_title_akas",
+        (
+            insert_missing_lookup("types", "type_name", list_values("stg_raw_title_akas", "types")),
+            insert_missing_lookup("title_attribute", "attribute_name",
+                                  list_values("stg_raw_title_akas", "attributes")),
+            rf"""
+            INSERT INTO title_akas (titleId, ordering, title, region_code, language_code, isOriginalTitle)
+            SELECT s.titleId,
+                   {sql_int("s.ordering")},
+                   {sql_text("s.title")},
+                   {sql_text("s.region")},
+                   {sql_text("s.language")},
+                   {sql_bool01("s.isOriginalTitle")}
+            FROM stg_raw_title_akas AS s
+            INNER JOIN title_basics AS tb
+                ON tb.tconst = s.titleId
+            WHERE s.ordering REGEXP '^-?[0-9]+$';
+            """,
+        ) + tuple(
+            rf"""
+            INSERT INTO {target} (title_akas_id, {id_col})
+            SELECT ta.id, l.{lookup_id}
+            FROM stg_raw_title_akas AS s
+            INNER JOIN title_akas AS ta
+                ON ta.titleId = s.titleId
+               AND ta.ordering = {sql_int("s.ordering")}
+               AND ta.id > %(id_mark)s
+            CROSS JOIN {explode(f"s.{col}")}
+            INNER JOIN {lookup(lookup_table, lookup_id, lookup_name)} AS l
+                ON l.{lookup_name} = TRIM(j.item)
+            WHERE s.{col} <> '\\N';
+            """
+            for target, id_col, col, lookup_table, lookup_id, lookup_name in (
+                ("title_aka_type", "title_types_id", "types", "types", "id", "type_name"),
+                ("title_aka_attribute", "title_attribute_id", "attributes",
+                 "title_attribute", "id", "attribute_name"),
+            )
+        ),
+        mark_table="title_akas",
+    ),
+}
+
+# stg_raw_* columns are the TSV header names
+STAGING_TABLES.update({
+    "stg_raw_title_basics": (
+        ("tconst", "VARCHAR(12)"), ("titleType", "VARCHAR(64)"),
+        ("primaryTitle", "VARCHAR(512)"), ("originalTitle", "VARCHAR(512)"),
+        ("isAdult", "VARCHAR(4)"), ("startYear", "VARCHAR(8)"), ("endYear", "VARCHAR(8)"),
+        ("runtimeMinutes", "VARCHAR(16)"), ("genres", "VARCHAR(512)"),
+    ),
+    "stg_raw_name_basics": (
+        ("nconst", "VARCHAR(12)"), ("primaryName", "VARCHAR(256)"),
+        ("birthYear", "VARCHAR(8)"), ("deathYear", "VARCHAR(8)"),
+        ("primaryProfession", "VARCHAR(512)"), ("knownForTitles", "VARCHAR(512)"),
+    ),
+    "stg_raw_title_crew": (
+        ("tconst", "VARCHAR(12)"), ("directors", "TEXT"), ("writers", "TEXT"),
+    ),
+    "stg_raw_title_akas": (
+        ("titleId", "VARCHAR(12)"), ("ordering", "VARCHAR(8)"), ("title", "VARCHAR(1024)"),
+        ("region", "VARCHAR(16)"), ("language", "VARCHAR(16)"), ("types", "VARCHAR(512)"),
+        ("attributes", "VARCHAR(512)"), ("isOriginalTitle", "VARCHAR(4)"),
+    ),
+})
+
+
+def staging_insert_sql(table):
+    columns = [name for name, _ in STAGING_TABLES[table]]
+    return (f"INSERT INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))});")
+
+
+def to_staging(steps, routes):
+    """
+    Re-target a row builder's steps at the staging tables.
+    LinkedBatch children get the parent's first two columns (natural key)
+    in place of the parent id.
+    """
+    staged = []
+    k = 0
+    for step in steps:
+        if isinstance(step, LinkedBatch):
+            parents = [params for params, _ in step.items]
+            staged.append(Batch(staging_insert_sql(routes[k]), parents))
+            for j in range(len(step.child_sqls)):
+                rows = [(*params[:2], *child)
+                        for params, children in step.items
+                        for child in children[j]]
+                staged.append(Batch(staging_insert_sql(routes[k + 1 + j]), rows))
+            k += 1 + len(step.child_sqls)
+        else:
+            target = routes[k]
+            staged.append(step if target is None else Batch(staging_insert_sql(target), step.rows))
+            k += 1
+    return staged
+
+
+def create_staging_tables(tables):
+    """
+    (Re)create empty staging tables.
+    """
+    conn = connect_db()
+    cur = conn.cursor()
+    for table in tables:
+        columns = ",\n    ".join(f"{name} {ddl} NULL" for name, ddl in STAGING_TABLES[table])
+        cur.execute(f"DROP TABLE IF EXISTS {table};")
+        cur.execute(f"CREATE TABLE {table} (\n    {columns}\n) ENGINE=InnoDB;")
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def drop_staging_tables(tables):
+    conn = connect_db()
+    cur = conn.cursor()
+    for table in tables:
+        cur.execute(f"DROP TABLE IF EXISTS {table};")
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def lock_id_mark(cur, table):
+    """
+    MAX(id) of table, with the gap above it locked (FOR UPDATE on
+    id > mark) until the transaction ends: rows another load inserts
+    into table meanwhile wait, instead of landing above the mark and
+    being picked up by the id > %(id_mark)s statements.
+    """
+    cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table};")
+    mark = cur.fetchone()[0]
+    while True:
+        cur.execute(f"SELECT id FROM {table} WHERE id > %s FOR UPDATE;", (mark,))
+        newer = [row[0] for row in cur.fetchall()]
+        if not newer:
+            return mark
+        mark = max(newer)
+
+
+def finalize(spec):
+    """
+    Run the set-based INSERT ... SELECT statements, one transaction each
+    (callable steps get the cursor); with a mark_table they all run in
+    one transaction, which holds the lock of lock_id_mark. Returns rows
+    inserted per statement.
+    """
+    conn = connect_db()
+    conn.autocommit = False
+    cur = conn.cursor()
+    params = {"id_mark": 0}
+
+    inserted = []
+    try:
+        if spec.mark_table:
+            params["id_mark"] = lock_id_mark(cur, spec.mark_table)
+        for sql in spec.finalize:
+            if callable(sql):
+                inserted.append(sql(cur))
+            else:
+                if "%(" in sql:
+                    cur.execute(sql, params)
+                else:
+                    cur.execute(sql)
+                inserted.append(cur.rowcount)
+            if not spec.mark_table:
+                conn.commit()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    return inserted
+
+
+def load_staged(name, tsv_path: Path, max_workers=None, chunk_size=None, keep_staging=False):
+    """
+    Load `name` (a key of STAGING) from tsv_path through staging tables.
+    Returns the run report.
+    """
+    loader = LOADERS[name]
+    spec = STAGING[name]
+    module = importlib.import_module(loader.module)
+    builder = getattr(module, loader.builder)
+    ctx = spec.context(module)
+    staging_tables = [t for t in spec.routes if t is not None]
+    txn_stats = TransactionStats()
+
+    def process_chunk(rows):
+        with txn_stats.metrics.timer("parse_seconds"):
+            steps = to_staging(builder(rows, *ctx), spec.routes)
+        conn = connect_db()
+        conn.autocommit = False
+        try:
+            run_steps(conn, steps, txn_stats, f"{name} (staging)")
+        finally:
+            conn.close()
+        return [len(step.rows) for step in steps]
+
+    create_staging_tables(staging_tables)
+    print(f"Pass 1: bulk loading {tsv_path.name} into {', '.join(staging_tables)}...")
+    results, report = load_chunks(tsv_path, process_chunk, name, max_workers,
+                                  chunk_size or loader.chunk_size, txn_stats)
+    staged = [sum(col) for col in zip(*results)] if results else []
+    for table, n in zip(spec.routes, staged):
+        if table is not None:
+            print(f"Total {table} rows staged: {n}")
+
+    report["engine"] = "staging"
+    report["rows_staged"] = dict(zip(loader.tables, staged))
+    return finish(spec, staging_tables, report, keep_staging)
+
+
+def load_raw(name, tsv_path: Path, max_workers=None, chunk_size=None, keep_staging=False):
+    """
+    Load `name` (a key of RAW) from tsv_path: raw columns into a stg_raw_*
+    table, then everything else on the server. Returns the run report.
+    """
+    spec = RAW[name]
+    columns = [col for col, _ in STAGING_TABLES[spec.table]]
+    insert_sql = staging_insert_sql(spec.table)
+    txn_stats = TransactionStats()
+
+    def process_chunk(rows):
+        batch = Batch(insert_sql, [tuple(row.get(col) for col in columns) for row in rows])
+        conn = connect_db()
+        conn.autocommit = False
+        try:
+            run_steps(conn, [batch], txn_stats, f"{name} (raw staging)")
+        finally:
+            conn.close()
+        return len(batch.rows)
+
+    create_staging_tables([spec.table])
+    print(f"Pass 1: bulk loading raw {tsv_path.name} into {spec.table}...")
+    results, report = load_chunks(tsv_path, process_chunk, name, max_workers,
+                                  chunk_size or LOADERS[name].chunk_size, txn_stats)
+    print(f"Total {spec.table} rows staged: {sum(results)}")
+
+    report["engine"] = "sql"
+    report["rows_staged"] = {spec.table: sum(results)}
+    return finish(spec, [spec.table], report, keep_staging)
+
+
+def finish(spec, staging_tables, report, keep_staging):
+    """
+    Pass 2 shared by both engines: run spec.finalize, report, clean up.
+    """
+    print("Pass 2: set-based INSERT ... SELECT into the normalized tables...")
+    inserted = finalize(spec)
+    rows_inserted = {}
+    for sql, n in zip(spec.finalize, inserted):
+        match = None if callable(sql) else re.search(r"INSERT\s+(?:IGNORE\s+)?INTO\s+(\w+)", sql)
+        if match is None:
+            # UPDATE / callable steps insert nothing
+            continue
+        target = match.group(1)
+        rows_inserted[target] = rows_inserted.get(target, 0) + n
+        print(f"Total {target} rows inserted: {n}")
+
+    if not keep_staging:
+        drop_staging_tables(staging_tables)
+
+    report["rows_inserted"] = rows_inserted
+    print_report(report)
+    write_run_report(report)
+    return report
+
+
+def post_load(tables):
+    """
+    The post-load steps of the insert_data_*.py mains, for a load of
+    `tables` without touched keys: each step rebuilds what it derives
+    from them.
+    """
+    tables = set(tables)
+    refresh_after_load(tables)
+    sync_title_summary(tables)
+    if "title_ratings" in tables:
+        build_top_rated()
+    if tables & {"title_basics", "title_akas"}:
+        # title_search needs NumPy; only the post-load steps use it
+        from title_search import update_after_load as update_search_index
+        update_search_index(None)
+    if tables & {"name_basics", "title_principals"}:
+        # name_autocomplete needs NumPy; only the post-load steps use it
+        from name_autocomplete import build_after_load as build_name_index
+        build_name_index()
+    if tables & {"person_profession", "title_principals", "title_director", "title_writer"}:
+        # person_roles needs NumPy (RoleBitmaps); only the post-load steps use it
+        from person_roles import build_after_load as build_person_roles
+        build_person_roles(tables)
+    dimensions = [d for table in sorted(tables) for d in SKETCHED_TABLES.get(table, ())]
+    if SKETCH_DURING_LOAD and dimensions:
+        rebuild_sketches(dimensions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load an IMDb TSV via staging tables.")
+    parser.add_argument("loader", choices=sorted(set(STAGING) | set(RAW)))
+    parser.add_argument("tsv", type=Path)
+    parser.add_argument("--engine", choices=("staging", "sql"), default="staging",
+                        help="staging: Python row builders + server-side FK joins; "
+                             "sql: raw columns, comma lists exploded on the server")
+    parser.add_argument("--keep-staging", action="store_true",
+                        help="leave the stg_* tables in place for inspection")
+    args = parser.parse_args()
+
+    if not args.tsv.exists():
+        raise FileNotFoundError(f"TSV file not found: {args.tsv}")
+
+    engines = {"staging": (STAGING, load_staged), "sql": (RAW, load_raw)}
+    specs, load = engines[args.engine]
+    if args.loader not in specs:
+        raise SystemExit(f"--engine {args.engine} does not support {args.loader}")
+    load(args.loader, args.tsv, keep_staging=args.keep_staging)
+    post_load(LOADERS[args.loader].tables)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Materialized summaries of the commands.sql analytics.
+
+Queries 3, 4, 6 and 7 aggregate the big bridge / ratings tables on every
+run. The summary_* tables (create_db.py, analytics_summaries) hold those
+aggregates, and SUMMARY_QUERIES answers the same questions from them:
+- summary_type_rating      ratings per title type        (query 3)
+- summary_director_rating  ratings per director          (query 4)
+- summary_genre_director   titles per (genre, director)  (query 7)
+- summary_profession       people per profession         (query 6)
+
+Every value column is additive (counts, and averages kept as
+rating_sum / rating_count), so a summary is refreshed either:
+- by a rebuild, in one transaction (DELETE + INSERT ... SELECT), so
+  readers see either the old or the new contents
+- incrementally after a delta load: the aggregate of just the changed
+  keys (tconst, or nconst for professions) is merged into the summary
+  with INSERT ... ON DUPLICATE KEY UPDATE col = col + VALUES(col); the
+  cost follows the size of the delta, not of the tables
+
+The loaders call refresh_after_load(tables, touched) at the end of their
+main(), with the keys they committed (loader_pipeline.TouchedKeys); a
+summary is merged into if all its changed sources have their keys, and
+rebuilt otherwise (full loads overflow TOUCHED_LIMIT).
+
+Incremental refreshes assume what the loaders assume: a delta load only
+adds rows, and every row of a changed key is new. A transaction in which
+INSERT IGNORE skipped rows (a re-loaded title) leaves its tables' keys
+unknown (TransactionStats.record_steps), so their summaries are rebuilt
+instead of counting those rows twice. Deletes and rating updates need a
+rebuild ("refresh" rebuilds from scratch).
+
+Manual refresh (rebuild):
+
+    python summaries.py refresh [--only summary_profession ...]
+    python summaries.py show query_7
+"""
+import argparse
+import time
+from typing import NamedTuple
+
+from connect_db import *
+
+
+# ---------------- CONFIG ----------------
+
+REFRESH_AFTER_LOAD = True   # loaders refresh the summaries they feed
+DELTA_BATCH_SIZE = 5000     # changed keys staged per executemany
+
+# ----------------------------------------
+
+
+class Summary(NamedTuple):
+    """
+    - sources: tables the summary is computed from
+    - columns: key columns, then additive value columns (sum / count)
+    - select: SELECT producing `columns`; {where} restricts it to the
+      delta keys, matched against the `key` column
+    """
+    table: str
+    sources: tuple
+    columns: tuple
+    n_keys: int
+    select: str
+    key: str
+
+
+SUMMARIES = {
+    s.table: s for s in (
+        Summary(
+            "summary_type_rating", ("title_basics", "title_ratings"),
+            ("title_type_id", "num_titles", "rating_sum", "rating_count"), 1,
+            """
+            SELECT tb.title_type_id, COUNT(1), COALESCE(SUM(tr.averageRating), 0), COUNT(tr.averageRating)
+            FROM title_ratings AS tr
+            INNER JOIN title_basics AS tb
+                ON tr.tconst = tb.tconst
+            {where}
+            GROUP BY tb.title_type_id
+            """, "tr.tconst"),
+        Summary(
+            "summary_director_rating", ("title_director", "title_ratings"),
+            ("nconst", "num_titles", "rating_sum", "rating_count"), 1,
+            """
+            SELECT td.nconst, COUNT(1), COALESCE(SUM(tr.averageRating), 0), COUNT(tr.averageRating)
+            FROM title_director AS td
+            INNER JOIN title_ratings AS tr
+                ON td.tconst = tr.tconst
+            {where}
+            GROUP BY td.nconst
+            """, "td.tconst"),
+        Summary(
+            "summary_genre_director", ("title_genre", "title_director"),
+            ("genre_id", "nconst", "num_titles"), 2,
+            """
+            SELECT tg.genre_id, td.nconst, COUNT(1)
+            FROM title_genre AS tg
+            INNER JOIN title_director AS td
+                ON tg.tconst = td.tconst
+            {where}
+            GROUP BY tg.genre_id, td.nconst
+            """, "tg.tconst"),
+        Summary(
+            "summary_profession", ("person_profession",),
+            ("profession_name", "num_people"), 1,
+            """
+            SELECT p.profession_name, COUNT(DISTINCT pp.nconst)
+            FROM profession AS p
+            INNER JOIN person_profession AS pp
+                ON p.id = pp.profession_id
+            {where}
+            GROUP BY p.profession_name
+            """, "pp.nconst"),
+    )
+}
+
+# commands.sql queries answered from the summaries (same columns)
+SUMMARY_QUERIES = {
+    "query_3": """
+        SELECT
+            tt.title_type_name,
+            s.rating_sum / NULLIF(s.rating_count, 0) AS average_rating
+        FROM summary_type_rating AS s
+        INNER JOIN title_type AS tt
+            ON s.title_type_id = tt.title_type_id
+    """,
+    "query_4": """
+        SELECT
+            nb.primaryName AS name,
+            s.rating_sum / NULLIF(s.rating_count, 0) AS average_ratings,
+            s.num_titles AS number_title
+        FROM summary_director_rating AS s
+        INNER JOIN name_basics AS nb
+            ON s.nconst = nb.nconst
+        WHERE s.num_titles >= 5
+        ORDER BY average_ratings DESC LIMIT 5
+    """,
+    "query_6": """
+        SELECT
+            profession_name,
+            num_people AS number
+        FROM summary_profession
+    """,
+    "query_7": """
+        SELECT
+            g.genre_name AS genre,
+            nb.primaryName AS name,
+            s.num_titles AS num_works
+        FROM summary_genre_director AS s
+        INNER JOIN (
+            SELECT genre_id, MAX(num_titles) AS max_cnt
+            FROM summary_genre_director
+            GROUP BY genre_id
+        ) AS mc
+            ON s.genre_id = mc.genre_id
+           AND s.num_titles = mc.max_cnt
+        INNER JOIN genre AS g
+            ON s.genre_id = g.genre_id
+        INNER JOIN name_basics AS nb
+            ON s.nconst = nb.nconst
+        ORDER BY g.genre_name
+    """,
+}
+
+
+DELTA_KEYS_TABLE = "summary_delta_keys"
+
+
+def _insert_into(summary):
+    return f"INSERT INTO {summary.table} ({', '.join(summary.columns)})"
+
+
+def rebuild_sql(summary):
+    return f"{_insert_into(summary)} {summary.select.format(where='')}"
+
+
+def merge_sql(summary):
+    """
+    Adds the contributions of the delta keys to the summary rows (new
+    groups are inserted, existing ones summed into).
+    """
+    where = f"WHERE {summary.key} IN (SELECT k FROM {DELTA_KEYS_TABLE})"
+    update = ", ".join(f"{c} = {c} + VALUES({c})" for c in summary.columns[summary.n_keys:])
+    return f"{_insert_into(summary)} {summary.select.format(where=where)} ON DUPLICATE KEY UPDATE {update}"
+
+
+def refresh(tables=None):
+    """
+    Rebuild the given summary tables (default: all), one transaction each.
+    Returns {table: seconds}.
+    """
+    timings = {}
+    conn = connect_db()
+    conn.autocommit = False
+    cur = conn.cursor()
+    try:
+        for table in tables or SUMMARIES:
+            start = time.perf_counter()
+            cur.execute(f"DELETE FROM {table};")
+            cur.execute(rebuild_sql(SUMMARIES[table]))
+            conn.commit()
+            timings[table] = time.perf_counter() - start
+            print(f"Refreshed {table} in {timings[table]:.2f}s")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    return timings
+
+
+def refresh_incremental(deltas, batch_size: int=DELTA_BATCH_SIZE):
+    """
+    Merge the contributions of changed keys into the summaries:
+    deltas = {summary table: keys of its `key` column}, one transaction
+    per summary. Returns {table: seconds}.
+    """
+    timings = {}
+    conn = connect_db()
+    conn.autocommit = False
+    cur = conn.cursor()
+    try:
+        cur.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {DELTA_KEYS_TABLE} "
+                    f"(k VARCHAR(12) NOT NULL PRIMARY KEY);")
+        for table, keys in deltas.items():
+            start = time.perf_counter()
+            cur.execute(f"DELETE FROM {DELTA_KEYS_TABLE};")
+            keys = sorted(keys)
+            for i in range(0, len(keys), batch_size):
+                cur.executemany(f"INSERT INTO {DELTA_KEYS_TABLE} (k) VALUES (%s);",
+                                [(k,) for k in keys[i:i + batch_size]])
+            cur.execute(merge_sql(SUMMARIES[table]))
+            conn.commit()
+            timings[table] = time.perf_counter() - start
+            print(f"Merged {len(keys)} changed keys into {table} in {timings[table]:.2f}s")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    return timings
+
+
+def refresh_after_load(loaded_tables, touched=None):
+    """
+    Bring the summaries computed from any of loaded_tables up to date:
+    incrementally from the committed keys in touched
+    (loader_pipeline.TouchedKeys) where all of them were collected,
+    otherwise by a rebuild.
+    """
+    if not REFRESH_AFTER_LOAD:
+        return {}
+    rebuild = []
+    deltas = {}
+    for summary in SUMMARIES.values():
+        changed = [t for t in summary.sources if t in loaded_tables]
+        if not changed:
+            continue
+        keys = [touched.get(t) for t in changed] if touched is not None else [None]
+        if any(k is None for k in keys):
+            rebuild.append(summary.table)
+        elif any(keys):
+            deltas[summary.table] = set().union(*keys)
+
+    timings = refresh(rebuild) if rebuild else {}
+    if deltas:
+        timings.update(refresh_incremental(deltas))
+    return timings
+
+
+def show(query):
+    conn = connect_db()
+    cur = conn.cursor()
+    start = time.perf_counter()
+    cur.execute(SUMMARY_QUERIES[query])
+    rows = cur.fetchall()
+    seconds = time.perf_counter() - start
+    cur.close()
+    conn.close()
+    for row in rows:
+        print(*row, sep="\t")
+    print(f"{len(rows)} rows in {seconds * 1000:.1f} ms")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh / read the analytics summary tables.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    refresh_cmd = sub.add_parser("refresh", help="rebuild summary tables")
+    refresh_cmd.add_argument("--only", nargs="+", choices=list(SUMMARIES))
+    show_cmd = sub.add_parser("show", help="run a commands.sql query from the summaries")
+    show_cmd.add_argument("query", choices=list(SUMMARY_QUERIES))
+    args = parser.parse_args()
+
+    if args.command == "refresh":
+        refresh(args.only)
+    else:
+        show(args.query)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+"""
+Title search over primaryTitle, originalTitle and the akas.
+
+Finding a title by name used to be LIKE '%...%' over title_basics and
+title_akas, a full scan. build_index() folds every title string (case,
+accents and punctuation, see fold) and indexes its trigrams in an
+inverted index on disk:
+
+- trigrams are taken per word, padded "  word " as in pg_trgm, so a word
+  start has its own grams and one-letter prefixes can be looked up; a
+  trigram is stored as its three code points packed into one uint64
+  (gram_code), no hashing and no collisions
+- one "document" per distinct (tconst, folded string, region, language);
+  primaryTitle, originalTitle (if different) and every aka
+- the index is a list of segments (one directory of .npy arrays each,
+  memory-mapped by Segment, see ARRAYS): postings sorted by gram, then
+  per-document tconst / source / region / language / numVotes and the
+  original string
+
+Lookups (TitleSearch):
+- search(query): fuzzy; documents sharing at least MIN_SIMILARITY of the
+  query's trigrams, scored by trigram similarity (Dice), best per title,
+  ties broken by numVotes
+- prefix(query): titles whose folded string starts with the query, most
+  voted first (autocomplete)
+Both can be restricted to one aka region / language.
+
+Delta loads: update(tconsts) indexes the current strings of the given
+titles as a new, small segment of a higher generation; documents of
+those titles in older segments are then ignored. Past MAX_SEGMENTS the
+index is rebuilt. The title_basics and title_akas loaders call
+update_after_load() with the keys they committed (a full load overflows
+them and rebuilds); nothing happens while no index has been built.
+numVotes is the one read at indexing time.
+
+Usage:
+    python title_search.py build
+    python title_search.py search "the godfather" [--region US]
+    python title_search.py prefix "star wa"
+"""
+import argparse
+import json
+import math
+import re
+import shutil
+import time
+import unicodedata
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from connect_db import *
+from columnar import decode_id, encode_id
+
+
+# ---------------- CONFIG ----------------
+
+SEARCH_DIR = Path("title_search")
+SEGMENT_DOCS = 2000000     # documents per segment of a full build
+MAX_SEGMENTS = 16          # more (after delta updates) -> rebuild
+MIN_SIMILARITY = 0.3       # search(): share of the query trigrams a document needs
+FETCH_SIZE = 100000
+UPDATE_AFTER_LOAD = True   # loaders keep an existing index up to date
+UPDATE_BATCH_SIZE = 1000   # tconsts per IN (...) while reading a delta
+
+# ----------------------------------------
+
+SOURCES = ("primaryTitle", "originalTitle", "aka")
+ARRAYS = ("gram_codes", "gram_indptr", "postings",
+          "doc_tconst", "doc_source", "doc_region", "doc_language", "doc_votes", "doc_grams",
+          "text_offsets", "text", "covers")
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+class SearchHit(NamedTuple):
+    tconst: str
+    score: float
+    title: str     # the matched string
+    source: str    # one of SOURCES
+
+
+def fold(text):
+    """
+    Case-, accent- and punctuation-folded text: "Amélie (Le Fabuleux...)"
+    -> "amelie le fabuleux".
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.sub(" ", text.casefold()).split())
+
+
+def gram_code(gram):
+    # three code points of 21 bits each
+    return (ord(gram[0]) << 42) | (ord(gram[1]) << 21) | ord(gram[2])
+
+
+def grams(folded, prefix=False):
+    """
+    Trigram codes of a folded string; with prefix the last word is left
+    open (no trailing pad), for prefix lookups.
+    """
+    words = folded.split(" ") if folded else []
+    codes = set()
+    for i, word in enumerate(words):
+        padded = "  " + word + ("" if prefix and i == len(words) - 1 else " ")
+        codes.update(gram_code(padded[j:j + 3]) for j in range(len(padded) - 2))
+    return codes
+
+
+# ---------------- building ----------------
+
+
+class SegmentWriter:
+    """
+    Collects documents and writes them as one segment directory.
+    """
+
+    def __init__(self, generation=0, covers=()):
+        self.generation = generation
+        self.covers = sorted(covers)
+        self.codes = []
+        self.docs = []
+        self.fields = []     # (tconst, source, region, language, votes, n_grams)
+        self.texts = []
+        self.seen = set()
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, tconst, source, text, region=None, language=None, votes=0):
+        folded = fold(text or "")
+        key = (tconst, folded, region, language)
+        if not folded or key in self.seen:
+            return
+        self.seen.add(key)
+        doc = len(self.texts)
+        codes = grams(folded)
+        self.codes.extend(codes)
+        self.docs.extend([doc] * len(codes))
+        self.fields.append((tconst, SOURCES.index(source), region, language, votes, len(codes)))
+        self.texts.append(text.encode("utf-8"))
+
+    def write(self, directory: Path):
+        codes = np.array(self.codes, np.uint64)
+        docs = np.array(self.docs, np.int32)
+        order = np.lexsort((docs, codes))
+        codes, docs = codes[order], docs[order]
+        gram_codes, starts = np.unique(codes, return_index=True)
+
+        tconsts, sources, regions, languages, votes, n_grams = zip(*self.fields) if self.fields else ((),) * 6
+        region_names = sorted({r for r in regions if r})
+        language_names = sorted({l for l in languages if l})
+
+        def codes_of(values, names):
+            index = {name: i for i, name in enumerate(names)}
+            return np.array([index.get(v, -1) for v in values], np.int16)
+
+        lengths = np.fromiter(map(len, self.texts), np.int64, len(self.texts))
+        arrays = {
+            "gram_codes": gram_codes,
+            "gram_indptr": np.append(starts, len(codes)).astype(np.int64),
+            "postings": docs,
+            "doc_tconst": np.fromiter(map(encode_id, tconsts), np.int32, len(tconsts)),
+            "doc_source": np.array(sources, np.uint8),
+            "doc_region": codes_of(regions, region_names),
+            "doc_language": codes_of(languages, language_names),
+            "doc_votes": np.array(votes, np.int32),
+            "doc_grams": np.array(n_grams, np.uint16),
+            "text_offsets": np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+            "text": np.frombuffer(b"".join(self.texts), np.uint8),
+            "covers": np.fromiter(map(encode_id, self.covers), np.int32, len(self.covers)),
+        }
+        directory.mkdir(parents=True)
+        for name in ARRAYS:
+            np.save(directory / f"{name}.npy", arrays[name])
+        meta = {"generation": self.generation, "documents": len(self),
+                "regions": region_names, "languages": language_names}
+        (directory / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+
+def _rows(cur, sql, params=(), fetch_size: int=FETCH_SIZE):
+    cur.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(fetch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def title_strings(cur, where="", params=()):
+    """
+    (tconst, source, text, region, language) of every title string,
+    optionally restricted by WHERE clauses on the tconst (title_basics)
+    and titleId (title_akas) columns.
+    """
+    for tconst, primary, original in _rows(
+            cur, f"SELECT tconst, primaryTitle, originalTitle FROM title_basics {where.format(key='tconst')};",
+            params):
+        if primary:
+            yield tconst, "primaryTitle", primary, None, None
+        if original:
+            yield tconst, "originalTitle", original, None, None
+    yield from ((tconst, "aka", title, region, language) for tconst, title, region, language in _rows(
+        cur, f"SELECT titleId, title, region_code, language_code FROM title_akas {where.format(key='titleId')};",
+        params) if title)
+
+
+def _segment_dirs(directory):
+    return sorted(p for p in directory.glob("seg_*") if p.is_dir())
+
+
+def build_index(directory: Path=SEARCH_DIR, segment_docs: int=SEGMENT_DOCS):
+    """
+    Index every title string from scratch into directory (written next to
+    it, then swapped in). Returns the number of documents.
+    """
+    start = time.perf_counter()
+    staging = directory.with_name(directory.name + ".building")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    conn = connect_db()
+    cur = conn.cursor()
+    cur.execute("SELECT tconst, numVotes FROM title_ratings;")
+    votes = dict(cur.fetchall())
+    writer, n_segments, n_docs = SegmentWriter(), 0, 0
+    for tconst, source, text, region, language in title_strings(cur):
+        writer.add(tconst, source, text, region, language, votes.get(tconst) or 0)
+        if len(writer) >= segment_docs:
+            writer.write(staging / f"seg_{n_segments:05d}")
+            n_segments, n_docs = n_segments + 1, n_docs + len(writer)
+            writer = SegmentWriter()
+    cur.close()
+    conn.close()
+    if len(writer) or not n_segments:
+        writer.write(staging / f"seg_{n_segments:05d}")
+        n_segments, n_docs = n_segments + 1, n_docs + len(writer)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    staging.rename(directory)
+    print(f"Built title search index: {n_docs} documents in {n_segments} segment(s) "
+          f"in {time.perf_counter() - start:.1f}s -> {directory}")
+    return n_docs
+
+
+def update(tconsts, directory: Path=SEARCH_DIR, batch_size: int=UPDATE_BATCH_SIZE):
+    """
+    Re-index the title strings of tconsts as a new segment; their
+    documents in older segments stop matching. Rebuilds the index instead
+    once it has MAX_SEGMENTS segments.
+    """
+    segments = _segment_dirs(directory)
+    if len(segments) >= MAX_SEGMENTS:
+        return build_index(directory)
+    start = time.perf_counter()
+    generation = 1 + max(json.loads((d / "meta.json").read_text(encoding="utf-8"))["generation"]
+                         for d in segments)
+    tconsts = sorted(tconsts)
+    writer = SegmentWriter(generation, tconsts)
+
+    conn = connect_db()
+    cur = conn.cursor()
+    for i in range(0, len(tconsts), batch_size):
+        batch = tconsts[i:i + batch_size]
+        marks = ", ".join(["%s"] * len(batch))
+        cur.execute(f"SELECT tconst, numVotes FROM title_ratings WHERE tconst IN ({marks});", batch)
+        votes = dict(cur.fetchall())
+        for tconst, source, text, region, language in title_strings(cur, f"WHERE {{key}} IN ({marks})", batch):
+            writer.add(tconst, source, text, region, language, votes.get(tconst) or 0)
+    cur.close()
+    conn.close()
+
+    number = int(segments[-1].name[4:]) + 1 if segments else 0
+    writer.write(directory / f"seg_{number:05d}")
+    print(f"Indexed {len(writer)} documents of {len(tconsts)} titles as segment {number} "
+          f"in {time.perf_counter() - start:.2f}s")
+    return len(writer)
+
+
+def update_after_load(touched):
+    """
+    Bring an existing index up to date after a title_basics / title_akas
+    load, from its committed keys (loader_pipeline.TouchedKeys); rebuilt
+    if they weren't (all) collected, or touched is None.
+    """
+    if not UPDATE_AFTER_LOAD or not SEARCH_DIR.exists():
+        return None
+    keys = [touched.get("title_basics"), touched.get("title_akas")] if touched is not None else [None]
+    if any(k is None for k in keys):
+        return build_index()
+    changed = set().union(*keys)
+    return update(changed) if changed else 0
+
+
+# ---------------- lookups ----------------
+
+
+class Segment:
+    """
+    One memory-mapped segment directory.
+    """
+
+    def __init__(self, directory: Path):
+        for name in ARRAYS:
+            setattr(self, name, np.load(directory / f"{name}.npy", mmap_mode="r"))
+        meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+        self.generation = meta["generation"]
+        self.regions = {name: i for i, name in enumerate(meta["regions"])}
+        self.languages = {name: i for i, name in enumerate(meta["languages"])}
+
+    def postings_of(self, code):
+        i = int(np.searchsorted(self.gram_codes, np.uint64(code)))
+        if i == len(self.gram_codes) or self.gram_codes[i] != code:
+            return np.empty(0, np.int32)
+        return self.postings[self.gram_indptr[i]:self.gram_indptr[i + 1]]
+
+    def text_of(self, doc):
+        return bytes(self.text[self.text_offsets[doc]:self.text_offsets[doc + 1]]).decode("utf-8")
+
+    def keep(self, docs, superseded, region, language):
+        """
+        docs that aren't superseded by a newer segment and match the filters.
+        """
+        mask = ~np.isin(self.doc_tconst[docs], superseded)
+        for wanted, names, column in ((region, self.regions, self.doc_region),
+                                      (language, self.languages, self.doc_language)):
+            if wanted is not None:
+                mask &= column[docs] == names.get(wanted, -2)
+        return docs[mask]
+
+
+class TitleSearch:
+
+    def __init__(self, segments):
+        self.segments = segments
+        # titles re-indexed by a newer generation, per segment
+        self.superseded = [
+            np.unique(np.concatenate([np.empty(0, np.int32)] + [
+                other.covers for other in segments if other.generation > seg.generation]))
+            for seg in segments
+        ]
+
+    @classmethod
+    def open(cls, directory: Path=SEARCH_DIR):
+        return cls([Segment(d) for d in _segment_dirs(directory)])
+
+    def _hit(self, seg, doc, score):
+        return SearchHit(decode_id("tt", int(seg.doc_tconst[doc])), score,
+                         seg.text_of(doc), SOURCES[seg.doc_source[doc]])
+
+    def search(self, query, k=10, region=None, language=None, min_similarity=MIN_SIMILARITY):
+        """
+        Best k titles for a misspelled / partial query, by trigram
+        similarity of their best matching string.
+        """
+        codes = grams(fold(query))
+        if not codes:
+            return []
+        min_count = max(1, math.ceil(len(codes) * min_similarity))
+        candidates = []    # (score, votes, segment, doc)
+        for seg, superseded in zip(self.segments, self.superseded):
+            docs, counts = np.unique(np.concatenate(
+                [np.empty(0, np.int32)] + [seg.postings_of(c) for c in codes]), return_counts=True)
+            docs = docs[counts >= min_count]
+            counts = counts[counts >= min_count]
+            kept = seg.keep(docs, superseded, region, language)
+            counts = counts[np.isin(docs, kept)]
+            scores = 2 * counts / (len(codes) + seg.doc_grams[kept].astype(np.int64))
+            candidates.extend(zip(scores.tolist(), seg.doc_votes[kept].tolist(),
+                                  [seg] * len(kept), kept.tolist()))
+
+        candidates.sort(key=lambda c: (-c[0], -c[1]))
+        hits, seen = [], set()
+        for score, _, seg, doc in candidates:
+            tconst = int(seg.doc_tconst[doc])
+            if tconst not in seen:
+                seen.add(tconst)
+                hits.append(self._hit(seg, doc, round(score, 4)))
+                if len(hits) == k:
+                    break
+        return hits
+
+    def prefix(self, query, k=10, region=None, language=None):
+        """
+        k most voted titles with a string starting with query (folded).
+        """
+        folded = fold(query)
+        codes = sorted(grams(folded, prefix=True))
+        if not codes:
+            return []
+        candidates = []    # (votes, segment, doc)
+        for seg, superseded in zip(self.segments, self.superseded):
+            lists = sorted((seg.postings_of(c) for c in codes), key=len)
+            docs = lists[0]
+            for other in lists[1:]:
+                docs = np.intersect1d(docs, other, assume_unique=True)
+            kept = seg.keep(np.asarray(docs), superseded, region, language)
+            candidates.extend(zip(seg.doc_votes[kept].tolist(), [seg] * len(kept), kept.tolist()))
+
+        # the trigrams only narrow the candidates down; check them most voted first
+        candidates.sort(key=lambda c: -c[0])
+        hits, seen = [], set()
+        for _, seg, doc in candidates:
+            tconst = int(seg.doc_tconst[doc])
+            if tconst in seen or not fold(seg.text_of(doc)).startswith(folded):
+                continue
+            seen.add(tconst)
+            hits.append(self._hit(seg, doc, 1.0))
+            if len(hits) == k:
+                break
+        return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / query the title search index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build")
+    for name in ("search", "prefix"):
+        cmd = sub.add_parser(name)
+        cmd.add_argument("query")
+        cmd.add_argument("-k", type=int, default=10)
+        cmd.add_argument("--region")
+        cmd.add_argument("--language")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_index()
+        return
+
+    index = TitleSearch.open()
+    start = time.perf_counter()
+    lookup = index.search if args.command == "search" else index.prefix
+    hits = lookup(args.query, args.k, args.region, args.language)
+    seconds = time.perf_counter() - start
+    for hit in hits:
+        print(f"{hit.tconst}  {hit.score:.3f}  {hit.title}  [{hit.source}]")
+    print(f"{len(hits)} titles in {seconds * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
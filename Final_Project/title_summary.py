@@ -0,0 +1,248 @@
+"""
+Denormalized title_summary table, for single-row title reads.
+
+Rendering one title joins title_basics, title_type, title_genre / genre,
+title_ratings, title_director, title_writer (with name_basics) and
+title_episode. title_summary (create_db.py) holds all of it in one row
+keyed by tconst; genres, directors and writers are JSON arrays:
+
+    genres     ["Crime", "Drama"]
+    directors  [{"nconst": "nm0000338", "name": "Francis Ford Coppola"}]
+
+so a point read is one primary key lookup (read_title).
+
+Rows are written per batch of BATCH_SIZE tconsts, one transaction each:
+the batch's rows are deleted and re-inserted from the source tables
+(titles gone from title_basics just disappear). That serves both ways
+of keeping the table in sync:
+- rebuild(): every title, paged through title_basics by key
+- sync(tconsts): only the given titles; the loaders call
+  sync_after_load(tables, touched) at the end of their main() with the
+  keys they committed (loader_pipeline.TouchedKeys), and a rebuild runs
+  instead if some keys weren't collected (full loads)
+
+Director / writer names are read when a title's row is written; renaming
+a person does not rewrite their titles' rows.
+
+Usage:
+    python title_summary.py rebuild
+    python title_summary.py show tt0068646
+"""
+import argparse
+import json
+import time
+
+from connect_db import *
+
+
+# ---------------- CONFIG ----------------
+
+SYNC_AFTER_LOAD = True   # loaders keep title_summary in sync
+BATCH_SIZE = 1000        # titles per transaction (and per IN (...))
+
+# ----------------------------------------
+
+SOURCES = ("title_basics", "title_genre", "title_ratings", "title_director", "title_writer",
+           "title_episode")
+COLUMNS = ("tconst", "primaryTitle", "originalTitle", "titleType", "isAdult", "startYear",
+           "endYear", "runtimeMinutes", "averageRating", "numVotes", "weightedRating",
+           "genres", "directors", "writers", "parentTconst", "seasonNumber", "episodeNumber")
+JSON_COLUMNS = ("genres", "directors", "writers")
+
+INSERT_TITLE_SUMMARY_SQL = f"""
+    INSERT INTO title_summary ({", ".join(COLUMNS)})
+    VALUES ({", ".join(["%s"] * len(COLUMNS))});
+"""
+
+
+def _marks(ids):
+    return ", ".join(["%s"] * len(ids))
+
+
+def summary_rows(cur, tconsts):
+    """
+    title_summary rows of the tconsts that are in title_basics; one query
+    per source table for the whole batch.
+    """
+    marks = _marks(tconsts)
+    cur.execute(f"""
+        SELECT tb.tconst, tb.primaryTitle, tb.originalTitle, tt.title_type_name, tb.isAdult,
+               tb.startYear, tb.endYear, tb.runtimeMinutes,
+               tr.averageRating, tr.numVotes, tr.weightedRating,
+               te.parentTconst, te.seasonNumber, te.episodeNumber
+        FROM title_basics AS tb
+        LEFT JOIN title_type AS tt
+            ON tb.title_type_id = tt.title_type_id
+        LEFT JOIN title_ratings AS tr
+            ON tb.tconst = tr.tconst
+        LEFT JOIN title_episode AS te
+            ON tb.tconst = te.tconst
+        WHERE tb.tconst IN ({marks});
+    """, tconsts)
+    base = {row[0]: row for row in cur.fetchall()}
+    genres = {t: [] for t in base}
+    people = {"title_director": {t: [] for t in base}, "title_writer": {t: [] for t in base}}
+
+    cur.execute(f"""
+        SELECT tg.tconst, g.genre_name
+        FROM title_genre AS tg
+        INNER JOIN genre AS g
+            ON tg.genre_id = g.genre_id
+        WHERE tg.tconst IN ({marks})
+        ORDER BY tg.id;
+    """, tconsts)
+    for tconst, genre in cur.fetchall():
+        if tconst in genres:
+            genres[tconst].append(genre)
+
+    for table, credits in people.items():
+        cur.execute(f"""
+            SELECT c.tconst, c.nconst, nb.primaryName
+            FROM {table} AS c
+            LEFT JOIN name_basics AS nb
+                ON c.nconst = nb.nconst
+            WHERE c.tconst IN ({marks})
+            ORDER BY c.id;
+        """, tconsts)
+        for tconst, nconst, name in cur.fetchall():
+            if tconst in credits:
+                credits[tconst].append({"nconst": nconst, "name": name})
+
+    def dump(value):
+        return json.dumps(value, ensure_ascii=False)
+
+    return [
+        (*row[:11], dump(genres[t]), dump(people["title_director"][t]), dump(people["title_writer"][t]),
+         *row[11:])
+        for t, row in base.items()
+    ]
+
+
+def write_batch(cur, tconsts):
+    """
+    Replace the title_summary rows of tconsts (no commit); returns the
+    number of rows written.
+    """
+    rows = summary_rows(cur, tconsts)
+    cur.execute(f"DELETE FROM title_summary WHERE tconst IN ({_marks(tconsts)});", tconsts)
+    if rows:
+        cur.executemany(INSERT_TITLE_SUMMARY_SQL, rows)
+    return len(rows)
+
+
+def sync(tconsts, batch_size: int=BATCH_SIZE):
+    """
+    Rewrite the rows of the given titles, a transaction per batch.
+    Returns the number of rows written.
+    """
+    start = time.perf_counter()
+    tconsts = sorted(tconsts)
+    written = 0
+    conn = connect_db()
+    conn.autocommit = False
+    cur = conn.cursor()
+    try:
+        for i in range(0, len(tconsts), batch_size):
+            written += write_batch(cur, tconsts[i:i + batch_size])
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    print(f"Synced title_summary for {len(tconsts)} titles ({written} rows) "
+          f"in {time.perf_counter() - start:.2f}s")
+    return written
+
+
+def rebuild(batch_size: int=BATCH_SIZE):
+    """
+    Rewrite every row, paging through title_basics by tconst, and drop
+    the rows of titles that no longer exist.
+    """
+    start = time.perf_counter()
+    written = 0
+    conn = connect_db()
+    conn.autocommit = False
+    cur = conn.cursor()
+    try:
+        cur.execute("DELETE FROM title_summary WHERE tconst NOT IN (SELECT tconst FROM title_basics);")
+        conn.commit()
+        last = ""
+        while True:
+            cur.execute("SELECT tconst FROM title_basics WHERE tconst > %s ORDER BY tconst LIMIT %s;",
+                        (last, batch_size))
+            tconsts = [row[0] for row in cur.fetchall()]
+            if not tconsts:
+                break
+            written += write_batch(cur, tconsts)
+            conn.commit()
+            last = tconsts[-1]
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    print(f"Rebuilt title_summary: {written} rows in {time.perf_counter() - start:.1f}s")
+    return written
+
+
+def sync_after_load(loaded_tables, touched=None):
+    """
+    Bring title_summary up to date after a load of loaded_tables: sync
+    the committed keys in touched if all of them were collected,
+    otherwise rebuild.
+    """
+    if not SYNC_AFTER_LOAD:
+        return None
+    changed = [t for t in SOURCES if t in loaded_tables]
+    if not changed:
+        return None
+    keys = [touched.get(t) for t in changed] if touched is not None else [None]
+    if any(k is None for k in keys):
+        return rebuild()
+    tconsts = set().union(*keys)
+    return sync(tconsts) if tconsts else 0
+
+
+def read_title(cur, tconst):
+    """
+    One title as a dict (JSON columns decoded), None if it has no row.
+    """
+    cur.execute(f"SELECT {', '.join(COLUMNS)} FROM title_summary WHERE tconst = %s;", (tconst,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    title = dict(zip(COLUMNS, row))
+    for column in JSON_COLUMNS:
+        title[column] = json.loads(title[column]) if title[column] is not None else []
+    return title
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild / read the title_summary table.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild")
+    show_cmd = sub.add_parser("show")
+    show_cmd.add_argument("tconst")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        rebuild()
+        return
+
+    conn = connect_db()
+    cur = conn.cursor()
+    start = time.perf_counter()
+    title = read_title(cur, args.tconst)
+    seconds = time.perf_counter() - start
+    cur.close()
+    conn.close()
+    print(json.dumps(title, indent=2, ensure_ascii=False, default=str))
+    print(f"read in {seconds * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
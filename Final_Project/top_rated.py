@@ -0,0 +1,264 @@
+"""
+Top-K rated titles, precomputed.
+
+Query 2 of commands.sql (numVotes > 1000 ORDER BY averageRating DESC
+LIMIT 5) sorts all of title_ratings on every run. build_top_rated()
+computes, once per load, the TOP_K best rated titles of every bucket
+    (vote threshold, title type, genre, decade)
+where each of type / genre / decade may also be "any" (stored as 0),
+and a title is in the threshold-t buckets if numVotes > t. Ties are
+broken by numVotes, then tconst. The buckets go to the top_rated table
+(create_db.py); the title_ratings loader rebuilds it at the end of its
+main().
+
+Lookups go through TopRated, which holds all buckets in memory:
+
+    board = TopRated.load()
+    board.top(5, min_votes=1000, genre="Crime", decade=1990)
+
+top_weighted(k) ranks by the Bayesian weighted rating column instead
+(no buckets needed; it is an index scan).
+
+Usage:
+    python top_rated.py build
+    python top_rated.py show --min-votes 1000 --type movie --genre Drama
+"""
+import argparse
+import time
+from itertools import product
+from typing import NamedTuple
+
+from connect_db import *
+
+
+# ---------------- CONFIG ----------------
+
+TOP_K = 100
+VOTE_THRESHOLDS = (100, 1000, 10000, 100000)   # numVotes > threshold
+ANY = 0
+
+# ----------------------------------------
+
+# a genre's bucket id is the lowest genre_id of its name, so a name the
+# lookup holds under several ids (older loads) is still one bucket
+GENRE_IDS_SQL = "SELECT genre_name, MIN(genre_id) FROM genre GROUP BY genre_name;"
+
+
+class TopTitle(NamedTuple):
+    tconst: str
+    primaryTitle: str
+    averageRating: object   # Decimal from MySQL
+    numVotes: int
+
+
+def decade_of(start_year):
+    return None if start_year is None else start_year // 10 * 10
+
+
+def rated_titles(cur, min_votes):
+    """
+    Rated titles with numVotes > min_votes, best first.
+    """
+    cur.execute("""
+        SELECT tr.tconst, tb.primaryTitle, tr.averageRating, tr.numVotes,
+               tb.title_type_id, tb.startYear
+        FROM title_ratings AS tr
+        INNER JOIN title_basics AS tb
+            ON tr.tconst = tb.tconst
+        WHERE tr.numVotes > %s AND tr.averageRating IS NOT NULL
+        ORDER BY tr.averageRating DESC, tr.numVotes DESC, tr.tconst;
+    """, (min_votes,))
+    return cur.fetchall()
+
+
+def title_genres(cur, min_votes):
+    """
+    {tconst: bucket genre ids (see GENRE_IDS_SQL)} of the rated titles.
+    """
+    cur.execute("""
+        SELECT DISTINCT tg.tconst, c.genre_id
+        FROM title_genre AS tg
+        INNER JOIN title_ratings AS tr
+            ON tg.tconst = tr.tconst
+        INNER JOIN genre AS g
+            ON g.genre_id = tg.genre_id
+        INNER JOIN (
+            SELECT genre_name, MIN(genre_id) AS genre_id
+            FROM genre
+            GROUP BY genre_name
+        ) AS c
+            ON c.genre_name = g.genre_name
+        WHERE tr.numVotes > %s;
+    """, (min_votes,))
+    genres = {}
+    for tconst, genre_id in cur.fetchall():
+        genres.setdefault(tconst, []).append(genre_id)
+    return genres
+
+
+def compute_buckets(titles, genres, k: int=TOP_K, thresholds=VOTE_THRESHOLDS):
+    """
+    {(min_votes, title_type_id, genre_id, decade): [TopTitle]} from titles
+    sorted best first; a title is appended to every bucket it belongs to
+    that isn't full yet.
+    """
+    buckets = {}
+    for tconst, title, rating, votes, type_id, start_year in titles:
+        entry = TopTitle(tconst, title, rating, votes)
+        decade = decade_of(start_year)
+        keys = product(
+            [t for t in thresholds if votes > t],
+            (ANY,) if type_id is None else (ANY, type_id),
+            (ANY, *genres.get(tconst, ())),
+            (ANY,) if decade is None else (ANY, decade),
+        )
+        for key in keys:
+            bucket = buckets.setdefault(key, [])
+            if len(bucket) < k:
+                bucket.append(entry)
+    return buckets
+
+
+INSERT_TOP_RATED_SQL = """
+    INSERT INTO top_rated (
+        min_votes, title_type_id, genre_id, decade, rank_pos,
+        tconst, primaryTitle, averageRating, numVotes
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
+"""
+
+
+def build_top_rated(k: int=TOP_K, thresholds=VOTE_THRESHOLDS, batch_size: int=5000):
+    """
+    Recompute the top_rated table in one transaction; returns the number
+    of buckets.
+    """
+    start = time.perf_counter()
+    conn = connect_db()
+    conn.autocommit = False
+    cur = conn.cursor()
+    try:
+        titles = rated_titles(cur, min(thresholds))
+        buckets = compute_buckets(titles, title_genres(cur, min(thresholds)), k, thresholds)
+        rows = [
+            (*key, pos, *entry)
+            for key, bucket in buckets.items()
+            for pos, entry in enumerate(bucket, 1)
+        ]
+        cur.execute("DELETE FROM top_rated;")
+        for i in range(0, len(rows), batch_size):
+            cur.executemany(INSERT_TOP_RATED_SQL, rows[i:i + batch_size])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+    print(f"Built top_rated: {len(buckets)} buckets, {len(rows)} rows from "
+          f"{len(titles)} titles in {time.perf_counter() - start:.1f}s")
+    return len(buckets)
+
+
+def top_weighted(k=10):
+    """
+    Best k titles by Bayesian weighted rating (title_ratings.weightedRating,
+    set by the ratings loader): a backward scan of idx_tr_weighted.
+    """
+    conn = connect_db()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT tr.tconst, tb.primaryTitle, tr.averageRating, tr.numVotes
+        FROM title_ratings AS tr
+        INNER JOIN title_basics AS tb
+            ON tr.tconst = tb.tconst
+        WHERE tr.weightedRating IS NOT NULL
+        ORDER BY tr.weightedRating DESC
+        LIMIT %s;
+    """, (k,))
+    titles = [TopTitle(*row) for row in cur.fetchall()]
+    cur.close()
+    conn.close()
+    return titles
+
+
+class TopRated:
+    """
+    In-memory copy of the top_rated table; lookups are dict reads.
+    """
+
+    def __init__(self, buckets, type_ids, genre_ids):
+        self.buckets = buckets      # (min_votes, type_id, genre_id, decade) -> [TopTitle]
+        self.type_ids = type_ids    # title_type_name -> title_type_id
+        self.genre_ids = genre_ids  # genre_name -> bucket genre_id
+        self.thresholds = sorted({key[0] for key in buckets})
+
+    @classmethod
+    def load(cls):
+        conn = connect_db()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT min_votes, title_type_id, genre_id, decade,
+                   tconst, primaryTitle, averageRating, numVotes
+            FROM top_rated
+            ORDER BY min_votes, title_type_id, genre_id, decade, rank_pos;
+        """)
+        buckets = {}
+        for min_votes, type_id, genre_id, decade, *entry in cur.fetchall():
+            buckets.setdefault((min_votes, type_id, genre_id, decade), []).append(TopTitle(*entry))
+        cur.execute("SELECT title_type_name, title_type_id FROM title_type;")
+        type_ids = dict(cur.fetchall())
+        cur.execute(GENRE_IDS_SQL)
+        genre_ids = dict(cur.fetchall())
+        cur.close()
+        conn.close()
+        return cls(buckets, type_ids, genre_ids)
+
+    def top(self, k=5, min_votes=1000, title_type=None, genre=None, decade=None):
+        """
+        Best k titles with numVotes > min_votes (one of the built
+        thresholds), optionally of one type / genre (by name) / decade.
+        An unknown type or genre name raises ValueError; a known one
+        without rated titles gives [].
+        """
+        if min_votes not in self.thresholds:
+            raise ValueError(f"min_votes must be one of {self.thresholds}, not {min_votes}")
+        if title_type is not None and title_type not in self.type_ids:
+            raise ValueError(f"unknown title type {title_type!r}")
+        if genre is not None and genre not in self.genre_ids:
+            raise ValueError(f"unknown genre {genre!r}")
+        key = (
+            min_votes,
+            ANY if title_type is None else self.type_ids[title_type],
+            ANY if genre is None else self.genre_ids[genre],
+            ANY if decade is None else decade_of(decade),
+        )
+        return self.buckets.get(key, [])[:k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build / read the top-rated titles table.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="recompute the top_rated table")
+    show_cmd = sub.add_parser("show", help="print one leaderboard")
+    show_cmd.add_argument("-k", type=int, default=5)
+    show_cmd.add_argument("--min-votes", type=int, default=1000)
+    show_cmd.add_argument("--type")
+    show_cmd.add_argument("--genre")
+    show_cmd.add_argument("--decade", type=int)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_top_rated()
+        return
+
+    board = TopRated.load()
+    start = time.perf_counter()
+    titles = board.top(args.k, args.min_votes, args.type, args.genre, args.decade)
+    seconds = time.perf_counter() - start
+    for pos, t in enumerate(titles, 1):
+        print(f"{pos:3d}. {t.primaryTitle} ({t.tconst}) {t.averageRating} / {t.numVotes} votes")
+    print(f"lookup took {seconds * 1e6:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()